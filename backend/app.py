@@ -1,9 +1,16 @@
 from flask import Flask
 from flask_cors import CORS
 from backend.config import Config
-from backend.database import get_db, close_db, init_db
+from backend.database import get_db, close_db, init_db, pool
 
-def create_app():
+def create_app(start_background=True):
+    """Build the Flask app.
+
+    gunicorn.conf.py preloads it once in the master with
+    ``start_background=False``; each worker then runs ``after_fork`` and
+    ``start_background_workers``, since sockets, DB handles and threads
+    must not cross fork().
+    """
     app = Flask(__name__)
     app.config.from_object(Config)
     CORS(app)
@@ -13,8 +20,38 @@ def create_app():
 
     from backend.routes.api import api_bp
     from backend.routes.webhook import webhook_bp
+    from backend.routes import metrics
     app.register_blueprint(api_bp, url_prefix='/api')
     app.register_blueprint(webhook_bp, url_prefix='/webhook')
+    metrics.init_app(app)
 
     app.teardown_appcontext(close_db)
-    return app
\ No newline at end of file
+
+    if start_background:
+        start_background_workers(app)
+    else:
+        preload()
+    return app
+
+def preload():
+    """Fork-safe warm-up in the master; nothing that holds a socket or file handle."""
+    from backend.services.triage import get_rules
+    get_rules()
+    # the schema is migrated; workers open their own connections
+    pool.close()
+
+def after_fork():
+    from backend.services.clients import reset_all
+    reset_all()
+
+def start_background_workers(app):
+    if app.config['WEBHOOK_ASYNC']:
+        from backend.services.inbox import start_workers
+        start_workers(app.config['INBOX_WORKERS'])
+
+def stop_background_workers(timeout=10):
+    """Finish in-flight turns, then commit whatever the writer still holds."""
+    from backend.services.inbox import stop_workers
+    from backend.services.writer import writer
+    stop_workers(timeout)
+    writer.stop(timeout)
\ No newline at end of file
@@ -1,8 +1,16 @@
 import jwt
 import datetime
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
 from flask import request, jsonify, current_app
 
+# Verified payloads by token string. Entries never outlive the token's own
+# `exp`, so caching can't extend a session.
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+
 def generate_token(user_id, role, patient_id=None, doctor_id=None):
     # include any relevant IDs so that downstream authorization checks can
     # validate ownership without extra DB lookups.
@@ -23,20 +31,43 @@ def generate_token(user_id, role, patient_id=None, doctor_id=None):
     return token
 
 def decode_token(token):
+    if isinstance(token, bytes):
+        token = token.decode('utf-8')
+    now = time.time()
+    with _token_cache_lock:
+        entry = _token_cache.get(token)
+        if entry is not None:
+            if entry[1] > now:
+                _token_cache.move_to_end(token)
+                return entry[0]
+            del _token_cache[token]
     try:
-        if isinstance(token, bytes):
-            token = token.decode('utf-8')
         payload = jwt.decode(token, current_app.config['JWT_SECRET'], algorithms=['HS256'])
-        return payload
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
 
+    expires = now + current_app.config['TOKEN_CACHE_TTL_SECONDS']
+    if 'exp' in payload:
+        expires = min(expires, float(payload['exp']))
+    with _token_cache_lock:
+        _token_cache[token] = (payload, expires)
+        while len(_token_cache) > current_app.config['TOKEN_CACHE_SIZE']:
+            _token_cache.popitem(last=False)
+    return payload
+
+# Endpoints that may take the token from the query string. EventSource
+# can't send headers; anywhere else a URL token would leak into access
+# logs, proxies and Referer headers.
+QUERY_TOKEN_ENDPOINTS = {'api.alerts_stream'}
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        if not token and request.endpoint in QUERY_TOKEN_ENDPOINTS:
+            token = request.args.get('token', '')
         if not token:
             return jsonify({'error': 'Token missing'}), 401
         payload = decode_token(token)
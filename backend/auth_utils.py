@@ -1,8 +1,76 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import bcrypt
 
-def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
+from backend.config import Config
+
+
+class HashingBusy(Exception):
+    """The bcrypt executor and its queue are full; the caller should retry later."""
+
+
+# bcrypt burns ~250 ms of CPU per call. Running it on a small dedicated pool
+# caps how many cores a login storm can take; the queue-depth limit turns
+# excess attempts into fast 429s instead of piling up behind each other.
+_executor = ThreadPoolExecutor(max_workers=Config.BCRYPT_WORKERS, thread_name_prefix='bcrypt')
+_slots = threading.BoundedSemaphore(Config.BCRYPT_WORKERS + Config.BCRYPT_QUEUE_DEPTH)
+# Bulk imports share the pool but keep at most this many hashes in flight,
+# leaving at least one worker to logins
+_import_slots = threading.BoundedSemaphore(max(1, min(Config.IMPORT_HASH_WORKERS, Config.BCRYPT_WORKERS - 1)))
+
+def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = _executor.submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future.result()
+
+def _hash(password: str, rounds: int) -> str:
+    salt = bcrypt.gensalt(rounds=rounds)
     return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
+def _check(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+def hash_password(password: str, rounds: int = None) -> str:
+    return _run(_hash, password, rounds or Config.BCRYPT_ROUNDS)
+
+def _release_import_slot(_):
+    _slots.release()
+    _import_slots.release()
+
+def hash_passwords(passwords, rounds: int = None) -> list:
+    """Hash many passwords (bulk imports) on the login pool, a few at a time.
+
+    Waits for a slot rather than raising HashingBusy, so an import slows
+    down under a login storm instead of failing.
+    """
+    rounds = rounds or Config.BCRYPT_ROUNDS
+    futures = []
+    for password in passwords:
+        _import_slots.acquire()
+        _slots.acquire()
+        try:
+            future = _executor.submit(_hash, password, rounds)
+        except BaseException:
+            _slots.release()
+            _import_slots.release()
+            raise
+        future.add_done_callback(_release_import_slot)
+        futures.append(future)
+    return [f.result() for f in futures]
+
 def check_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
\ No newline at end of file
+    return _run(_check, password, hashed)
+
+def needs_rehash(hashed: str) -> bool:
+    """True when the stored hash was made with a different cost than configured."""
+    try:
+        return int(hashed.split('$')[2]) != Config.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
@@ -9,4 +9,100 @@ class Config:
     TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
     TWILIO_WHATSAPP_NUMBER = os.getenv('TWILIO_WHATSAPP_NUMBER')
     DATABASE = os.getenv('DATABASE_PATH', 'data/patients.db')
-    JWT_SECRET = os.getenv('JWT_SECRET', 'jwt-secret')
\ No newline at end of file
+    JWT_SECRET = os.getenv('JWT_SECRET', 'jwt-secret')
+
+    # Async webhook: queue inbound messages and answer from a worker pool
+    WEBHOOK_ASYNC = os.getenv('WEBHOOK_ASYNC', 'false').lower() in ('1', 'true', 'yes')
+    # check X-Twilio-Signature on /webhook/* (needs TWILIO_AUTH_TOKEN); off only for local testing
+    TWILIO_VALIDATE_SIGNATURE = os.getenv('TWILIO_VALIDATE_SIGNATURE', 'true').lower() in ('1', 'true', 'yes')
+    INBOX_WORKERS = int(os.getenv('INBOX_WORKERS', '4'))
+    INBOX_MAX_ATTEMPTS = int(os.getenv('INBOX_MAX_ATTEMPTS', '3'))
+    INBOX_POLL_SECONDS = float(os.getenv('INBOX_POLL_SECONDS', '1.0'))
+    # messages from one patient this close together are answered as one turn
+    COALESCE_WINDOW_SECONDS = float(os.getenv('COALESCE_WINDOW_SECONDS', '3'))
+
+    # Embedding cache in front of rag.embed_text
+    EMBED_MODEL = os.getenv('EMBED_MODEL', 'gemini-embedding-001')
+    EMBED_CACHE_PATH = os.getenv('EMBED_CACHE_PATH', 'data/embedding_cache.db')
+    EMBED_CACHE_MEMORY_MB = int(os.getenv('EMBED_CACHE_MEMORY_MB', '64'))
+    EMBED_CACHE_DISK_MB = int(os.getenv('EMBED_CACHE_DISK_MB', '512'))
+
+    # Vector store for patient records: 'sqlite' (sqlite-vec in DATABASE) or 'chroma'
+    VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'sqlite')
+    EMBEDDING_DIM = int(os.getenv('EMBEDDING_DIM', '3072'))
+
+    # Agent checkpoints
+    CHECKPOINT_DB_PATH = os.getenv('CHECKPOINT_DB_PATH', 'data/checkpoints.db')
+    CHECKPOINT_KEEP_PER_THREAD = int(os.getenv('CHECKPOINT_KEEP_PER_THREAD', '10'))
+    AGENT_HISTORY_TURNS = int(os.getenv('AGENT_HISTORY_TURNS', '20'))
+
+    # Prompt assembly: estimated-token budget for everything but the
+    # instructions; turns older than the recent ones are folded into a
+    # per-patient summary every SUMMARY_EVERY_TURNS turns
+    PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '1200'))
+    PROMPT_RECENT_TURNS = int(os.getenv('PROMPT_RECENT_TURNS', '3'))
+    SUMMARY_EVERY_TURNS = int(os.getenv('SUMMARY_EVERY_TURNS', '10'))
+
+    # Red-flag keyword triage that runs before any LLM call
+    TRIAGE_RULES_PATH = os.getenv(
+        'TRIAGE_RULES_PATH',
+        os.path.join(os.path.dirname(__file__), 'rules', 'triage_rules.json'))
+
+    # 'single': one structured LLM call per turn; 'split': extract, then reply
+    AGENT_MODE = os.getenv('AGENT_MODE', 'single')
+
+    # Gemini call deadlines, hedging, retries and circuit breaker (services/llm.py)
+    LLM_DEADLINE_SECONDS = float(os.getenv('LLM_DEADLINE_SECONDS', '20'))
+    EMBED_DEADLINE_SECONDS = float(os.getenv('EMBED_DEADLINE_SECONDS', '5'))
+    LLM_MAX_ATTEMPTS = int(os.getenv('LLM_MAX_ATTEMPTS', '3'))
+    LLM_HEDGE = os.getenv('LLM_HEDGE', 'true').lower() in ('1', 'true', 'yes')
+    # hedge after the observed p95, never sooner than this
+    LLM_HEDGE_MIN_SECONDS = float(os.getenv('LLM_HEDGE_MIN_SECONDS', '0.5'))
+    LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', '5'))
+    LLM_BREAKER_RESET_SECONDS = float(os.getenv('LLM_BREAKER_RESET_SECONDS', '30'))
+    LLM_WORKERS = int(os.getenv('LLM_WORKERS', '32'))
+
+    # Server-Sent Events stream of alerts
+    ALERT_STREAM_HEARTBEAT_SECONDS = float(os.getenv('ALERT_STREAM_HEARTBEAT_SECONDS', '15'))
+    ALERT_STREAM_POLL_SECONDS = float(os.getenv('ALERT_STREAM_POLL_SECONDS', '1'))
+    # each open stream holds a server thread; keep this below gunicorn's threads
+    ALERT_STREAM_MAX_PER_WORKER = int(os.getenv('ALERT_STREAM_MAX_PER_WORKER', '2'))
+    ALERT_STREAM_RETRY_MS = int(os.getenv('ALERT_STREAM_RETRY_MS', '10000'))
+
+    # Auth: verified-token cache and bcrypt executor
+    TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '10000'))
+    TOKEN_CACHE_TTL_SECONDS = int(os.getenv('TOKEN_CACHE_TTL_SECONDS', '300'))
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+    BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', '2'))
+    BCRYPT_QUEUE_DEPTH = int(os.getenv('BCRYPT_QUEUE_DEPTH', '8'))
+
+    # Metrics: /metrics bearer token (unset = open) and slow-turn log
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    SLOW_TURN_SECONDS = float(os.getenv('SLOW_TURN_SECONDS', '0'))
+    SLOW_TURN_LOG_PATH = os.getenv('SLOW_TURN_LOG_PATH')
+
+    # Proactive check-ins and the outbound send queue
+    CHECKIN_HOUR_UTC = int(os.getenv('CHECKIN_HOUR_UTC', '9'))
+    TWILIO_API_BASE = os.getenv('TWILIO_API_BASE', 'https://api.twilio.com')
+    TWILIO_STATUS_CALLBACK_URL = os.getenv('TWILIO_STATUS_CALLBACK_URL')
+    # Twilio queues and throttles per sender; 1 msg/s is the long-code default
+    TWILIO_RATE_PER_SECOND = float(os.getenv('TWILIO_RATE_PER_SECOND', '1'))
+    TWILIO_RATE_BURST = int(os.getenv('TWILIO_RATE_BURST', '1'))
+    OUTBOX_SENDERS = int(os.getenv('OUTBOX_SENDERS', '8'))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+    OUTBOX_BACKOFF_SECONDS = float(os.getenv('OUTBOX_BACKOFF_SECONDS', '2'))
+
+    # Group-commit writer for conversation, rollup and alert inserts
+    WRITE_BATCH_WINDOW_MS = float(os.getenv('WRITE_BATCH_WINDOW_MS', '20'))
+    WRITE_BATCH_MAX = int(os.getenv('WRITE_BATCH_MAX', '256'))
+
+    # Bulk patient import (scripts/bulk_patients.py, /api/admin/import)
+    IMPORT_CHUNK_ROWS = int(os.getenv('IMPORT_CHUNK_ROWS', '500'))
+    # bcrypt hashes an import keeps in flight on the BCRYPT_WORKERS pool; capped
+    # at BCRYPT_WORKERS - 1 (raise both for a large offline import)
+    IMPORT_HASH_WORKERS = int(os.getenv('IMPORT_HASH_WORKERS', '1'))
+
+    # Cold storage for old conversations (scripts/archive_conversations.py)
+    ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'data/archive')
+    ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '180'))
+    ARCHIVE_ZSTD_LEVEL = int(os.getenv('ARCHIVE_ZSTD_LEVEL', '10'))
@@ -1,91 +1,154 @@
 import sqlite3
 import os
-from flask import g
+import threading
+from contextlib import contextmanager
+from pathlib import Path
 
 DATABASE = os.getenv('DATABASE_PATH', 'data/patients.db')
 
-from pathlib import Path
+# Applied once to every pooled connection
+PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_SIZE_KB', '16384'))}",
+    f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))}",
+    f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))}",
+    "PRAGMA temp_store=MEMORY",
+)
+STATEMENT_CACHE_SIZE = int(os.getenv('SQLITE_STATEMENT_CACHE', '256'))
 
 def _ensure_db_dir():
     dirpath = os.path.dirname(DATABASE)
     if dirpath:
         Path(dirpath).mkdir(parents=True, exist_ok=True)
 
+class ConnectionPool:
+    """Process-wide SQLite connections for one database file.
+
+    Each thread gets its own connection for reads, opened and tuned once.
+    All writes go through a single shared write connection guarded by a
+    lock, so writers in this process queue up here instead of fighting for
+    the file lock. Connections inherited across fork() are abandoned and
+    reopened in the child.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writer = None
+        self._writer_applied = 0
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self._initializers = []
+        self._pid = os.getpid()
+        self._abandoned = []
+        self._wal_ready = False
+
+    def add_initializer(self, fn):
+        """Run ``fn(conn)`` on every connection, including ones already open."""
+        if fn not in self._initializers:
+            self._initializers.append(fn)
+
+    def _check_fork(self):
+        if os.getpid() != self._pid:
+            # never close a parent's SQLite handle from the child
+            self._abandoned.extend(c for c in (getattr(self._local, 'conn', None), self._writer) if c)
+            self._local = threading.local()
+            self._writer = None
+            self._writer_applied = 0
+            self._write_lock = threading.RLock()
+            self._write_depth = 0
+            self._pid = os.getpid()
+
+    def _open(self, check_same_thread=True):
+        _ensure_db_dir()
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=check_same_thread,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        if not self._wal_ready:
+            # journal_mode is persistent in the file; set it once per process
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._wal_ready = True
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _apply_initializers(self, conn, applied):
+        for fn in self._initializers[applied:]:
+            fn(conn)
+        return len(self._initializers)
+
+    def connection(self):
+        """This thread's connection, opened on first use."""
+        self._check_fork()
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = local.conn = self._open()
+            local.applied = 0
+        if local.applied < len(self._initializers):
+            local.applied = self._apply_initializers(conn, local.applied)
+        return conn
+
+    def close(self):
+        """Close the write connection and this thread's reader (e.g. before fork)."""
+        self._check_fork()
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+                self._writer_applied = 0
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def current(self):
+        """This thread's connection if it has one, without opening it."""
+        self._check_fork()
+        return getattr(self._local, 'conn', None)
+
+    @contextmanager
+    def write(self):
+        """Hold the single write connection; commits on success, rolls back on error.
+
+        Re-entrant: nested blocks join the outermost transaction.
+        """
+        self._check_fork()
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._open(check_same_thread=False)
+                self._writer_applied = 0
+            if self._writer_applied < len(self._initializers):
+                self._writer_applied = self._apply_initializers(self._writer, self._writer_applied)
+            conn = self._writer
+            self._write_depth += 1
+            try:
+                yield conn
+            except BaseException:
+                self._write_depth -= 1
+                if self._write_depth == 0:
+                    conn.rollback()
+                raise
+            self._write_depth -= 1
+            if self._write_depth == 0:
+                conn.commit()
+
+pool = ConnectionPool(DATABASE)
+
 def get_db():
-    _ensure_db_dir()
-    db = getattr(g, '_database', None)
-    if db is None:
-        db = g._database = sqlite3.connect(DATABASE, check_same_thread=False)
-        db.row_factory = sqlite3.Row
-        db.execute("PRAGMA journal_mode=WAL")
-    return db
+    return pool.connection()
+
+def db_write():
+    return pool.write()
 
 def close_db(e=None):
-    db = g.pop('_database', None)
-    if db is not None:
-        db.close()
+    # pooled connections stay open; just don't leak an open transaction
+    db = pool.current()
+    if db is not None and db.in_transaction:
+        db.rollback()
 
 def init_db():
-    _ensure_db_dir()
-    with sqlite3.connect(DATABASE) as conn:
-        conn.execute("PRAGMA journal_mode=WAL")
-        conn.executescript('''
-            CREATE TABLE IF NOT EXISTS hospitals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                address TEXT,
-                phone TEXT
-            );
-            CREATE TABLE IF NOT EXISTS doctors (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                phone TEXT UNIQUE,
-                email TEXT,
-                specialty TEXT,
-                hospital_id INTEGER REFERENCES hospitals(id)
-            );
-            CREATE TABLE IF NOT EXISTS patients (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                phone TEXT UNIQUE NOT NULL,
-                name TEXT,
-                date_of_birth TEXT,
-                surgery_date TEXT,
-                surgery_type TEXT,
-                hospital_id INTEGER REFERENCES hospitals(id),
-                primary_doctor_id INTEGER REFERENCES doctors(id),
-                is_active INTEGER DEFAULT 1,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            );
-            CREATE TABLE IF NOT EXISTS conversations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                patient_id INTEGER REFERENCES patients(id) ON DELETE CASCADE,
-                doctor_id INTEGER REFERENCES doctors(id),
-                channel TEXT,
-                patient_message TEXT,
-                agent_response TEXT,
-                extracted_symptoms TEXT,  -- JSON
-                risk_level TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            );
-            CREATE TABLE IF NOT EXISTS alerts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                patient_id INTEGER REFERENCES patients(id) ON DELETE CASCADE,
-                doctor_id INTEGER REFERENCES doctors(id),
-                alert_type TEXT,
-                reason TEXT,
-                acknowledged INTEGER DEFAULT 0,
-                acknowledged_at DATETIME,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            );
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                role TEXT NOT NULL CHECK(role IN ('patient', 'doctor', 'admin')),
-                patient_id INTEGER REFERENCES patients(id) ON DELETE CASCADE,
-                doctor_id INTEGER REFERENCES doctors(id) ON DELETE CASCADE,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            );
-        ''')
-        conn.commit()
\ No newline at end of file
+    """Create or upgrade the schema to the latest migration."""
+    from backend.migrations import apply_migrations
+    with pool.write() as conn:
+        return apply_migrations(conn)
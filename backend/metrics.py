@@ -0,0 +1,252 @@
+"""Prometheus metrics, rendered in the text exposition format.
+
+Kept dependency-free: a handful of counters, gauges and histograms behind
+one lock each. Values are per process; under gunicorn each worker serves
+its own numbers, so scrape workers individually or sum in the query.
+"""
+import contextvars
+import json
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+slow_turn_logger = logging.getLogger("backend.slow_turns")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += self._samples(items)
+        return lines
+
+    def _samples(self, items):
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}" for key, value in items]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that is set, or read from ``fn()`` at scrape time when given."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), fn=None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        if self.fn is not None:
+            self.set(self.fn())
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, (None, 0.0))
+            if counts is None:
+                counts = [0] * len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self, items):
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = _labels(self.label_names, key, [("le", _number(bound))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "Flask request handling time by route.",
+    ("endpoint", "method", "status"))
+agent_node_seconds = registry.histogram(
+    "agent_node_duration_seconds", "Time spent in each agent graph node.", ("node",))
+agent_turn_seconds = registry.histogram(
+    "agent_turn_duration_seconds", "End-to-end agent turn time.")
+external_call_seconds = registry.histogram(
+    "external_call_duration_seconds", "Calls to Gemini, the vector store, Twilio and SQLite.",
+    ("service", "operation"))
+external_call_errors = registry.counter(
+    "external_call_errors_total", "External calls that raised.", ("service", "operation"))
+llm_tokens = registry.counter(
+    "llm_tokens_total", "Gemini tokens reported in usage metadata.", ("kind",))
+json_parse_fallbacks = registry.counter(
+    "json_parse_fallbacks_total", "Structured model outputs that failed validation.", ("stage",))
+slow_turns = registry.counter(
+    "agent_slow_turns_total", "Turns slower than SLOW_TURN_SECONDS.")
+
+
+# Per-turn breakdown. The dict is shared by reference, so node threads that
+# run in a copied context still write into the turn that started them.
+_turn = contextvars.ContextVar("metrics_turn", default=None)
+
+
+def _add_to_turn(part, seconds):
+    turn = _turn.get()
+    if turn is not None:
+        turn[part] = turn.get(part, 0.0) + seconds
+
+
+def timed_node(name, fn):
+    """Wrap a graph node so its duration is observed and added to the turn breakdown."""
+    @wraps(fn)
+    def node(state):
+        start = time.perf_counter()
+        try:
+            return fn(state)
+        finally:
+            took = time.perf_counter() - start
+            agent_node_seconds.observe(took, node=name)
+            _add_to_turn(f"node.{name}", took)
+    return node
+
+
+@contextmanager
+def external_call(service, operation):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        external_call_errors.inc(service=service, operation=operation)
+        raise
+    finally:
+        took = time.perf_counter() - start
+        external_call_seconds.observe(took, service=service, operation=operation)
+        _add_to_turn(f"{service}.{operation}", took)
+
+
+def count_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    for kind, attr in (("prompt", "prompt_token_count"), ("output", "candidates_token_count")):
+        count = getattr(usage, attr, None)
+        if count:
+            llm_tokens.inc(count, kind=kind)
+
+
+@contextmanager
+def agent_turn(patient_id, threshold_seconds=0):
+    """Time one agent turn; turns over ``threshold_seconds`` are logged with their breakdown."""
+    breakdown = {}
+    token = _turn.set(breakdown)
+    start = time.perf_counter()
+    try:
+        yield breakdown
+    finally:
+        _turn.reset(token)
+        took = time.perf_counter() - start
+        agent_turn_seconds.observe(took)
+        if threshold_seconds and took >= threshold_seconds:
+            slow_turns.inc()
+            slow_turn_logger.warning(json.dumps({
+                "patient_id": patient_id,
+                "seconds": round(took, 3),
+                "breakdown": {k: round(v, 3) for k, v in sorted(breakdown.items(), key=lambda kv: -kv[1])},
+            }))
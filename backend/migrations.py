@@ -0,0 +1,347 @@
+"""Versioned schema migrations for patients.db.
+
+Each entry runs once, in order, inside its own transaction; the applied
+version is kept in ``PRAGMA user_version``. Never edit a migration that has
+shipped; append a new one instead.
+"""
+
+MIGRATIONS = [
+    # 1: initial schema (IF NOT EXISTS so databases created before the
+    # runner existed are adopted as-is)
+    '''
+        CREATE TABLE IF NOT EXISTS hospitals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            address TEXT,
+            phone TEXT
+        );
+        CREATE TABLE IF NOT EXISTS doctors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            phone TEXT UNIQUE,
+            email TEXT,
+            specialty TEXT,
+            hospital_id INTEGER REFERENCES hospitals(id)
+        );
+        CREATE TABLE IF NOT EXISTS patients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            phone TEXT UNIQUE NOT NULL,
+            name TEXT,
+            date_of_birth TEXT,
+            surgery_date TEXT,
+            surgery_type TEXT,
+            hospital_id INTEGER REFERENCES hospitals(id),
+            primary_doctor_id INTEGER REFERENCES doctors(id),
+            is_active INTEGER DEFAULT 1,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER REFERENCES patients(id) ON DELETE CASCADE,
+            doctor_id INTEGER REFERENCES doctors(id),
+            channel TEXT,
+            patient_message TEXT,
+            agent_response TEXT,
+            extracted_symptoms TEXT,  -- JSON
+            risk_level TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER REFERENCES patients(id) ON DELETE CASCADE,
+            doctor_id INTEGER REFERENCES doctors(id),
+            alert_type TEXT,
+            reason TEXT,
+            acknowledged INTEGER DEFAULT 0,
+            acknowledged_at DATETIME,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL CHECK(role IN ('patient', 'doctor', 'admin')),
+            patient_id INTEGER REFERENCES patients(id) ON DELETE CASCADE,
+            doctor_id INTEGER REFERENCES doctors(id) ON DELETE CASCADE,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    ''',
+
+    # 2: durable inbound queue for the async webhook
+    '''
+        CREATE TABLE IF NOT EXISTS inbound_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_sid TEXT UNIQUE,
+            patient_id INTEGER REFERENCES patients(id) ON DELETE CASCADE,
+            phone TEXT NOT NULL,
+            body TEXT,
+            status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'processing', 'done', 'failed')),
+            attempts INTEGER DEFAULT 0,
+            last_error TEXT,
+            received_at REAL NOT NULL,
+            available_at REAL NOT NULL,
+            updated_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_inbound_messages_status
+            ON inbound_messages(status, available_at);
+    ''',
+
+    # 3: typed pain_level column, backfilled from the symptom JSON (older
+    # rows stored it under "pain"), and indexes for the dashboard queries
+    '''
+        ALTER TABLE conversations ADD COLUMN pain_level INTEGER;
+        UPDATE conversations
+        SET pain_level = CAST(COALESCE(json_extract(extracted_symptoms, '$.pain_level'),
+                                       json_extract(extracted_symptoms, '$.pain')) AS INTEGER)
+        WHERE json_valid(extracted_symptoms);
+        UPDATE conversations SET risk_level = UPPER(TRIM(risk_level)) WHERE risk_level IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_conversations_patient_created
+            ON conversations(patient_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_alerts_patient_created
+            ON alerts(patient_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_alerts_unacknowledged
+            ON alerts(created_at) WHERE acknowledged = 0;
+    ''',
+
+    # 4: keyset pagination of the patient list on (created_at, id)
+    '''
+        CREATE INDEX IF NOT EXISTS idx_patients_created ON patients(created_at);
+    ''',
+
+    # 5: per-patient daily rollup maintained with each conversation insert;
+    # filled for existing rows by scripts/backfill_daily_stats.py
+    '''
+        CREATE TABLE IF NOT EXISTS daily_patient_stats (
+            patient_id INTEGER NOT NULL REFERENCES patients(id) ON DELETE CASCADE,
+            day TEXT NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            pain_count INTEGER NOT NULL DEFAULT 0,
+            pain_sum INTEGER NOT NULL DEFAULT 0,
+            pain_min INTEGER,
+            pain_max INTEGER,
+            risk_low INTEGER NOT NULL DEFAULT 0,
+            risk_medium INTEGER NOT NULL DEFAULT 0,
+            risk_high INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (patient_id, day)
+        ) WITHOUT ROWID;
+    ''',
+
+    # 6: version counters behind the dashboard response cache
+    '''
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            scope TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID;
+    ''',
+
+    # 7: proactive check-ins. next_checkin_at (UTC) drives the scheduler;
+    # NULL means no more check-ins. outbound_messages is the send queue.
+    '''
+        ALTER TABLE patients ADD COLUMN next_checkin_at TEXT;
+        UPDATE patients SET next_checkin_at = datetime('now') WHERE is_active = 1;
+        CREATE INDEX IF NOT EXISTS idx_patients_next_checkin
+            ON patients(next_checkin_at) WHERE is_active = 1;
+        CREATE TRIGGER IF NOT EXISTS patients_first_checkin AFTER INSERT ON patients
+        WHEN NEW.next_checkin_at IS NULL
+        BEGIN
+            UPDATE patients SET next_checkin_at = datetime('now') WHERE id = NEW.id;
+        END;
+        CREATE TABLE IF NOT EXISTS outbound_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dedupe_key TEXT UNIQUE,
+            patient_id INTEGER REFERENCES patients(id) ON DELETE CASCADE,
+            phone TEXT NOT NULL,
+            body TEXT NOT NULL,
+            kind TEXT NOT NULL DEFAULT 'checkin',
+            status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'sending', 'sent', 'failed')),
+            attempts INTEGER DEFAULT 0,
+            provider_sid TEXT,
+            provider_status TEXT,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            available_at REAL NOT NULL,
+            updated_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_outbound_messages_status
+            ON outbound_messages(status, available_at);
+        CREATE INDEX IF NOT EXISTS idx_outbound_messages_provider_sid
+            ON outbound_messages(provider_sid);
+    ''',
+
+    # 8: per-patient coalescing of inbound bursts; red-flag messages skip
+    # the debounce window
+    '''
+        ALTER TABLE inbound_messages ADD COLUMN urgent INTEGER NOT NULL DEFAULT 0;
+        CREATE INDEX IF NOT EXISTS idx_inbound_messages_patient_status
+            ON inbound_messages(patient_id, status);
+    ''',
+
+    # 9: index of conversations moved to compressed segment files; one row
+    # per zstd frame (one patient's rows for one month from one run)
+    '''
+        CREATE TABLE IF NOT EXISTS conversation_archive (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER NOT NULL REFERENCES patients(id) ON DELETE CASCADE,
+            month TEXT NOT NULL,
+            segment TEXT NOT NULL,
+            byte_offset INTEGER NOT NULL,
+            byte_length INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            first_created_at TEXT NOT NULL,
+            last_created_at TEXT NOT NULL,
+            archived_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_conversation_archive_patient
+            ON conversation_archive(patient_id, last_created_at);
+    ''',
+    # 10: rolling per-patient summary of older turns for prompt assembly
+    '''
+        CREATE TABLE IF NOT EXISTS patient_summaries (
+            patient_id INTEGER PRIMARY KEY REFERENCES patients(id) ON DELETE CASCADE,
+            summary TEXT NOT NULL,
+            through_turn INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        );
+    ''',
+    # 11: resumable bulk imports; rows_done is the offset into the input
+    # stream that has been committed
+    '''
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT,
+            format TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running' CHECK(status IN ('running', 'done', 'failed')),
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            patients INTEGER NOT NULL DEFAULT 0,
+            doctors INTEGER NOT NULL DEFAULT 0,
+            users INTEGER NOT NULL DEFAULT 0,
+            records INTEGER NOT NULL DEFAULT 0,
+            skipped INTEGER NOT NULL DEFAULT 0,
+            rejected INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_users_patient ON users(patient_id);
+    ''',
+
+    # 12: a hospital's patients for cohort statistics
+    '''
+        CREATE INDEX IF NOT EXISTS idx_patients_hospital ON patients(hospital_id, surgery_type);
+    ''',
+
+    # 13: any change to patients invalidates the cached patient views,
+    # whichever code path (or manual edit) made it
+    '''
+        CREATE TRIGGER IF NOT EXISTS patients_bump_insert AFTER INSERT ON patients BEGIN
+            INSERT INTO cache_versions (scope, version) VALUES ('patients', 1)
+            ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS patients_bump_update AFTER UPDATE ON patients BEGIN
+            INSERT INTO cache_versions (scope, version) VALUES ('patients', 1)
+            ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS patients_bump_delete AFTER DELETE ON patients BEGIN
+            INSERT INTO cache_versions (scope, version) VALUES ('patients', 1)
+            ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+        END;
+    ''',
+
+    # 14: inbound messages remember that their turn was persisted, and the
+    # reply still to deliver, so a retry redelivers instead of rerunning
+    '''
+        ALTER TABLE inbound_messages ADD COLUMN turn_recorded INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE inbound_messages ADD COLUMN reply TEXT;
+    ''',
+
+    # 15: at most one alert of a kind per inbound message, however often
+    # its turn is retried (NULL keys never collide)
+    '''
+        ALTER TABLE alerts ADD COLUMN dedupe_key TEXT;
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_alerts_dedupe ON alerts(dedupe_key);
+    ''',
+
+    # 16: moving or removing patients changes how rollup rows line up into
+    # cohorts; check-in scheduling updates do not
+    '''
+        CREATE TRIGGER IF NOT EXISTS patients_bump_rollup_update
+        AFTER UPDATE OF surgery_date, surgery_type, hospital_id ON patients BEGIN
+            INSERT INTO cache_versions (scope, version) VALUES ('rollup', 1)
+            ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS patients_bump_rollup_delete AFTER DELETE ON patients BEGIN
+            INSERT INTO cache_versions (scope, version) VALUES ('rollup', 1)
+            ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+        END;
+    ''',
+
+    # 17: an append-only log of alert changes that every worker process can
+    # poll; its ids are the alert stream's event ids
+    '''
+        CREATE TABLE IF NOT EXISTS alert_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            alert_id INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TRIGGER IF NOT EXISTS alerts_event_insert AFTER INSERT ON alerts BEGIN
+            INSERT INTO alert_events (alert_id, event_type) VALUES (new.id, 'alert.created');
+        END;
+        CREATE TRIGGER IF NOT EXISTS alerts_event_acknowledge
+        AFTER UPDATE OF acknowledged ON alerts WHEN new.acknowledged = 1 AND old.acknowledged = 0 BEGIN
+            INSERT INTO alert_events (alert_id, event_type) VALUES (new.id, 'alert.acknowledged');
+        END;
+    ''',
+
+    # 18: a change to a patient row invalidates only that patient's cached
+    # views; the shared 'patients' counter had no readers left and moved on
+    # every check-in update
+    '''
+        DROP TRIGGER IF EXISTS patients_bump_insert;
+        DROP TRIGGER IF EXISTS patients_bump_update;
+        DROP TRIGGER IF EXISTS patients_bump_delete;
+        CREATE TRIGGER IF NOT EXISTS patients_bump_patient_update AFTER UPDATE ON patients BEGIN
+            INSERT INTO cache_versions (scope, version) VALUES ('patient:' || old.id, 1)
+            ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS patients_bump_patient_delete AFTER DELETE ON patients BEGIN
+            INSERT INTO cache_versions (scope, version) VALUES ('patient:' || old.id, 1)
+            ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+        END;
+    ''',
+
+    # 19: the messages a turn answers, and its idempotency key, are fixed
+    # on first claim so a retry answers the same set under the same key
+    '''
+        ALTER TABLE inbound_messages ADD COLUMN turn_key TEXT;
+    ''',
+
+    # 20: a synchronous webhook turn remembers its Twilio MessageSid, so a
+    # redelivery answers from the stored turn instead of running it again
+    '''
+        ALTER TABLE conversations ADD COLUMN message_key TEXT;
+        ALTER TABLE conversations ADD COLUMN reply_sent INTEGER NOT NULL DEFAULT 0;
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_conversations_message_key ON conversations(message_key);
+    ''',
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn):
+    """Bring the database up to the latest version. Returns the versions applied."""
+    applied = []
+    for version, script in enumerate(MIGRATIONS, start=1):
+        if version <= schema_version(conn):
+            continue
+        try:
+            conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {version};\nCOMMIT;")
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        applied.append(version)
+    return applied
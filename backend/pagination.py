@@ -0,0 +1,89 @@
+import base64
+import json
+
+from flask import Response, request, stream_with_context
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class PageError(ValueError):
+    """Bad pagination or projection parameters (answered with 400)."""
+
+
+def encode_cursor(created_at, row_id):
+    raw = json.dumps([created_at, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return str(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise PageError('Invalid cursor')
+
+
+class Page:
+    """Keyset page request parsed from ``limit``, ``cursor`` and ``fields``.
+
+    Rows are ordered newest first on (created_at, id); the cursor is the
+    (created_at, id) of the last row returned, so each page is an index
+    range scan no matter how deep the client has paged.
+    """
+
+    def __init__(self, columns, default_fields):
+        self.columns = columns  # output field -> SQL expression
+        try:
+            self.limit = int(request.args.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            raise PageError('limit must be an integer')
+        if not 1 <= self.limit <= MAX_LIMIT:
+            raise PageError(f'limit must be between 1 and {MAX_LIMIT}')
+
+        fields = request.args.get('fields')
+        self.fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else list(default_fields)
+        unknown = [f for f in self.fields if f not in columns]
+        if unknown:
+            raise PageError(f"Unknown fields: {', '.join(unknown)}")
+
+        cursor = request.args.get('cursor')
+        self.after = decode_cursor(cursor) if cursor else None
+
+    def select(self, created_col, id_col):
+        """SELECT list with the projected fields plus the hidden cursor keys."""
+        exprs = [f'{self.columns[f]} AS {f}' for f in self.fields]
+        exprs += [f'{created_col} AS _cursor_created', f'{id_col} AS _cursor_id']
+        return ', '.join(exprs)
+
+    def where(self, created_col, id_col):
+        """Keyset predicate and its parameters ('1' when on the first page)."""
+        if self.after is None:
+            return '1', ()
+        created_at, row_id = self.after
+        return (f'({created_col} < ? OR ({created_col} = ? AND {id_col} < ?))',
+                (created_at, created_at, row_id))
+
+    def order_limit(self, created_col, id_col):
+        # one extra row tells us whether there is a next page
+        return f'ORDER BY {created_col} DESC, {id_col} DESC LIMIT {self.limit + 1}'
+
+    def respond(self, cursor):
+        """Stream ``{"items": [...], "next_cursor": ...}`` straight from the DB cursor."""
+        fields = self.fields
+        limit = self.limit
+
+        def generate():
+            yield '{"items":['
+            last = None
+            for n, row in enumerate(cursor):
+                if n == limit:
+                    yield '],"next_cursor":%s}' % json.dumps(encode_cursor(*last))
+                    return
+                item = {f: row[f] for f in fields}
+                yield (',' if n else '') + json.dumps(item, separators=(',', ':'))
+                last = (row['_cursor_created'], row['_cursor_id'])
+            yield '],"next_cursor":null}'
+
+        return Response(stream_with_context(generate()), mimetype='application/json')
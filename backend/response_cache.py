@@ -0,0 +1,148 @@
+import hashlib
+import hmac
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+from backend.database import get_db
+
+# Scopes whose version counters invalidate cached views
+# Bumped when the daily rollup is rebuilt rather than updated turn by turn,
+# and by triggers when patients move between cohorts (migration 16)
+ROLLUP_SCOPE = 'rollup'
+
+
+def patient_scope(patient_id):
+    # also bumped by triggers when the patient row changes (migration 18)
+    return f'patient:{patient_id}'
+
+
+def hospital_scope(hospital_id):
+    return f'hospital:{hospital_id}'
+
+
+def bump_versions(db, *scopes):
+    """Invalidate cached views; call inside the transaction that changes the data."""
+    db.executemany("""
+        INSERT INTO cache_versions (scope, version) VALUES (?, 1)
+        ON CONFLICT (scope) DO UPDATE SET version = version + 1
+    """, [(s,) for s in scopes])
+
+
+def current_versions(db, scopes):
+    placeholders = ','.join('?' * len(scopes))
+    found = dict(db.execute(
+        f"SELECT scope, version FROM cache_versions WHERE scope IN ({placeholders})", scopes).fetchall())
+    return tuple(found.get(s, 0) for s in scopes)
+
+
+class ResponseCache:
+    """Serialized JSON bodies of read-only views, keyed by route, params and role.
+
+    Entries remember the version counters they were built from and are
+    stale as soon as any of them moves. ETags are derived from the key and
+    versions, so a conditional GET is answered from the counter lookup
+    alone, in any worker process.
+    """
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key, versions):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != versions:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, versions, body, mimetype):
+        with self._lock:
+            self._entries[key] = (versions, body, mimetype)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def count(self, outcome):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def stats(self):
+        with self._lock:
+            served = self.hits + self.not_modified
+            total = served + self.misses
+            return {
+                'hits': self.hits,
+                'not_modified': self.not_modified,
+                'misses': self.misses,
+                'hit_rate': served / total if total else 0.0,
+                'entries': len(self._entries),
+            }
+
+
+response_cache = ResponseCache()
+
+
+def _role_scope():
+    user = request.user
+    if user.get('role') == 'patient':
+        return f"patient:{user.get('patient_id')}"
+    # doctors and admins see the same data on these routes
+    return 'staff'
+
+
+def cached_view(scopes, authorize=None):
+    """Cache a GET view's 200 responses; ``scopes(**view_args)`` names its counters.
+
+    Must be applied below token_required/role_required. Per-resource checks
+    go in ``authorize(**view_args)``, which returns an error response or
+    None and runs before any 304 or cached body is served, never in the
+    view body. Streamed responses get an ETag but are not stored.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if authorize is not None:
+                denied = authorize(**kwargs)
+                if denied is not None:
+                    return make_response(denied)
+            view_scopes = scopes(**kwargs)
+            versions = current_versions(get_db(), view_scopes)
+            params = tuple(sorted((k, v) for k, v in request.args.items(multi=True) if k != 'token'))
+            key = (request.endpoint, tuple(sorted(kwargs.items())), params, _role_scope())
+            # keyed, so nobody can derive another user's ETag from the counters
+            etag = hmac.new(current_app.config['SECRET_KEY'].encode('utf-8'),
+                            repr((key, versions)).encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+            if etag in request.if_none_match:
+                response_cache.count('not_modified')
+                resp = make_response('', 304)
+                resp.set_etag(etag)
+                return resp
+
+            entry = response_cache.get(key, versions)
+            if entry is not None:
+                response_cache.count('hits')
+                resp = make_response(entry[1])
+                resp.mimetype = entry[2]
+            else:
+                response_cache.count('misses')
+                resp = make_response(f(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+                # streamed bodies keep streaming: they get the ETag (it only
+                # depends on the counters) but are not stored
+                if not resp.is_streamed:
+                    response_cache.put(key, versions, resp.get_data(), resp.mimetype)
+            resp.set_etag(etag)
+            resp.headers['Cache-Control'] = 'private, no-cache'
+            return resp
+        return decorated
+    return decorator
@@ -1,12 +1,43 @@
-from flask import Blueprint, jsonify, request, g
-from backend.database import get_db
+from flask import Blueprint, Response, current_app, jsonify, request, g, stream_with_context
+from backend.database import get_db, db_write
 from backend.auth import token_required, role_required
-from backend.auth_utils import check_password
+from backend.auth_utils import HashingBusy, check_password, hash_password, needs_rehash
 from backend.auth import generate_token
+from backend.pagination import Page, PageError
+from backend.response_cache import (ROLLUP_SCOPE, cached_view, hospital_scope, patient_scope,
+                                    response_cache)
+from backend.services import archive, bulk, cohort
+from backend.services.events import alert_feed, format_event
+import heapq
+import io
+import itertools
 import json
+import time
 
 api_bp = Blueprint('api', __name__)
 
+PATIENT_FIELDS = {f: f for f in (
+    'id', 'name', 'phone', 'date_of_birth', 'surgery_date', 'surgery_type',
+    'hospital_id', 'primary_doctor_id', 'is_active', 'created_at')}
+CONVERSATION_FIELDS = {f: f for f in (
+    'id', 'patient_message', 'agent_response', 'extracted_symptoms',
+    'pain_level', 'risk_level', 'created_at')}
+ALERT_FIELDS = {
+    'id': 'alerts.id', 'patient_id': 'alerts.patient_id', 'name': 'patients.name',
+    'alert_type': 'alerts.alert_type', 'reason': 'alerts.reason',
+    'acknowledged': 'alerts.acknowledged', 'created_at': 'alerts.created_at',
+}
+
+def _own_patient(pid):
+    # patients may only read their own records
+    if request.user['role'] == 'patient' and request.user.get('patient_id') != pid:
+        return jsonify({'error': 'Forbidden'}), 403
+    return None
+
+@api_bp.errorhandler(PageError)
+def bad_page(e):
+    return jsonify({'error': str(e)}), 400
+
 @api_bp.route('/health', methods=['GET'])
 def health():
     return jsonify({"status": "ok"})
@@ -24,14 +55,29 @@ def login():
         SELECT id, username, password_hash, role, patient_id, doctor_id
         FROM users WHERE username = ?
     """, (username,)).fetchone()
-    if not user or not check_password(password, user['password_hash']):
+    try:
+        valid = user is not None and check_password(password, user['password_hash'])
+    except HashingBusy:
+        return jsonify({'error': 'Too many login attempts, try again shortly'}), 429, {'Retry-After': '1'}
+    if not valid:
         return jsonify({'error': 'Invalid credentials'}), 401
 
+    if needs_rehash(user['password_hash']):
+        # transparently move the stored hash to the configured bcrypt cost
+        try:
+            new_hash = hash_password(password)
+        except HashingBusy:
+            new_hash = None
+        if new_hash:
+            with db_write() as w:
+                w.execute("UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?",
+                          (new_hash, user['id'], user['password_hash']))
+
     # attach the associated patient/doctor IDs so they are embedded in the JWT
     token = generate_token(
         user['id'], user['role'],
-        patient_id=user.get('patient_id'),
-        doctor_id=user.get('doctor_id')
+        patient_id=user['patient_id'],
+        doctor_id=user['doctor_id']
     )
     return jsonify({
         'token': token,
@@ -44,13 +90,18 @@ def login():
 @token_required
 @role_required('admin', 'doctor')
 def get_patients():
-    db = get_db()
-    patients = db.execute("SELECT id, name, phone, surgery_date, is_active FROM patients").fetchall()
-    return jsonify([dict(p) for p in patients])
+    page = Page(PATIENT_FIELDS, ('id', 'name', 'phone', 'surgery_date', 'is_active'))
+    where, params = page.where('created_at', 'id')
+    cursor = get_db().execute(f"""
+        SELECT {page.select('created_at', 'id')} FROM patients
+        WHERE {where} {page.order_limit('created_at', 'id')}
+    """, params)
+    return page.respond(cursor)
 
 @api_bp.route('/patients/<int:pid>', methods=['GET'])
 @token_required
 @role_required('doctor', 'admin')
+@cached_view(lambda pid: [patient_scope(pid)])
 def get_patient(pid):
     db = get_db()
     patient = db.execute("SELECT * FROM patients WHERE id = ?", (pid,)).fetchone()
@@ -61,50 +112,184 @@ def get_patient(pid):
 @api_bp.route('/patients/<int:pid>/conversations', methods=['GET'])
 @token_required
 @role_required('patient', 'doctor', 'admin')
+@cached_view(lambda pid: [patient_scope(pid)], authorize=_own_patient)
 def patient_conversations(pid):
-    if request.user['role'] == 'patient' and request.user.get('patient_id') != pid:
-        return jsonify({'error': 'Forbidden'}), 403
+    page = Page(CONVERSATION_FIELDS, ('id', 'patient_message', 'agent_response',
+                                      'extracted_symptoms', 'risk_level', 'created_at'))
+    where, params = page.where('created_at', 'id')
     db = get_db()
-    convs = db.execute("""
-        SELECT id, patient_message, agent_response, extracted_symptoms, risk_level, created_at
-        FROM conversations WHERE patient_id = ? ORDER BY created_at DESC
-    """, (pid,)).fetchall()
-    return jsonify([dict(c) for c in convs])
+    cursor = db.execute(f"""
+        SELECT {page.select('created_at', 'id')} FROM conversations
+        WHERE patient_id = ? AND {where} {page.order_limit('created_at', 'id')}
+    """, (pid, *params))
+    if not archive.has_archive(db, pid):
+        return page.respond(cursor)
+    # older history lives in the cold tier; merge both newest-first streams
+    cold = [{**row, '_cursor_created': row['created_at'], '_cursor_id': row['id']}
+            for row in archive.read_archived(db, pid, page.after, page.limit + 1)]
+    rows = heapq.merge(cursor.fetchall(), cold, reverse=True,
+                       key=lambda r: (r['_cursor_created'] or '', r['_cursor_id']))
+    return page.respond(list(itertools.islice(rows, page.limit + 1)))
 
 @api_bp.route('/patients/<int:pid>/pain-trend', methods=['GET'])
 @token_required
 @role_required('patient', 'doctor', 'admin')
+@cached_view(lambda pid: [patient_scope(pid)], authorize=_own_patient)
 def pain_trend(pid):
-    if request.user['role'] == 'patient' and request.user.get('patient_id') != pid:
-        return jsonify({'error': 'Forbidden'}), 403
     db = get_db()
     rows = db.execute("""
-        SELECT date(created_at) as day,
-               json_extract(extracted_symptoms, '$.pain_level') as pain
-        FROM conversations
-        WHERE patient_id = ? AND json_extract(extracted_symptoms, '$.pain_level') IS NOT NULL
+        SELECT day, ROUND(CAST(pain_sum AS REAL) / pain_count, 1) AS pain, pain_min, pain_max,
+               message_count, risk_low, risk_medium, risk_high
+        FROM daily_patient_stats
+        WHERE patient_id = ? AND pain_count > 0
         ORDER BY day
     """, (pid,)).fetchall()
-    return jsonify([{"date": r["day"], "pain": r["pain"]} for r in rows])
+    return jsonify([{
+        "date": r["day"], "pain": r["pain"], "pain_min": r["pain_min"], "pain_max": r["pain_max"],
+        "messages": r["message_count"],
+        "risk": {"LOW": r["risk_low"], "MEDIUM": r["risk_medium"], "HIGH": r["risk_high"]},
+    } for r in rows])
+
+@api_bp.route('/hospitals/<int:hid>/cohort-stats', methods=['GET'])
+@token_required
+@role_required('doctor', 'admin')
+@cached_view(lambda hid: [hospital_scope(hid), ROLLUP_SCOPE])
+def cohort_stats(hid):
+    days = request.args.get('days', cohort.DEFAULT_DAYS, type=int)
+    recent_days = request.args.get('recent_days', cohort.DEFAULT_RECENT_DAYS, type=int)
+    if not 1 <= days <= cohort.MAX_DAYS or not 0 <= recent_days <= days:
+        return jsonify({'error': f'days must be 1-{cohort.MAX_DAYS} and recent_days 0-days'}), 400
+    return jsonify(cohort.cohort_stats(get_db(), hid, days, recent_days,
+                                       surgery_type=request.args.get('surgery_type')))
+
+@api_bp.route('/cache-stats', methods=['GET'])
+@token_required
+@role_required('admin')
+def cache_stats():
+    return jsonify(response_cache.stats())
 
 @api_bp.route('/alerts', methods=['GET'])
 @token_required
 @role_required('doctor', 'admin')
 def get_alerts():
-    db = get_db()
-    alerts = db.execute("""
-        SELECT alerts.id, patients.name, alerts.alert_type, alerts.reason, alerts.acknowledged, alerts.created_at
+    page = Page(ALERT_FIELDS, ('id', 'name', 'alert_type', 'reason', 'acknowledged', 'created_at'))
+    where, params = page.where('alerts.created_at', 'alerts.id')
+    cursor = get_db().execute(f"""
+        SELECT {page.select('alerts.created_at', 'alerts.id')}
         FROM alerts JOIN patients ON alerts.patient_id = patients.id
-        WHERE alerts.acknowledged = 0
-        ORDER BY alerts.created_at DESC
-    """).fetchall()
-    return jsonify([dict(a) for a in alerts])
+        WHERE alerts.acknowledged = 0 AND {where}
+        {page.order_limit('alerts.created_at', 'alerts.id')}
+    """, params)
+    return page.respond(cursor)
 
 @api_bp.route('/alerts/<int:aid>/acknowledge', methods=['POST'])
 @token_required
 @role_required('doctor', 'admin')
 def acknowledge_alert(aid):
-    db = get_db()
-    db.execute("UPDATE alerts SET acknowledged = 1, acknowledged_at = CURRENT_TIMESTAMP WHERE id = ?", (aid,))
-    db.commit()
-    return jsonify({"status": "ok"})
\ No newline at end of file
+    with db_write() as db:
+        db.execute("""
+            UPDATE alerts SET acknowledged = 1, acknowledged_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND acknowledged = 0
+        """, (aid,)).rowcount
+    return jsonify({"status": "ok"})
+
+@api_bp.route('/alerts/stream', methods=['GET'])
+@token_required
+@role_required('doctor', 'admin')
+def alerts_stream():
+    """Server-Sent Events: alert.created / alert.acknowledged, with heartbeats.
+
+    Events are polled from ``alert_events``, so they reach streams on every
+    worker and resume from Last-Event-ID on any of them. Each stream holds a
+    server thread: past ALERT_STREAM_MAX_PER_WORKER open streams this worker
+    answers 503 with a ``retry:`` hint instead.
+    """
+    config = current_app.config
+    retry_ms = config['ALERT_STREAM_RETRY_MS']
+    if not alert_feed.acquire(config['ALERT_STREAM_MAX_PER_WORKER']):
+        return Response(f"retry: {retry_ms}\n\n", status=503, mimetype='text/event-stream',
+                        headers={'Retry-After': str(retry_ms // 1000)})
+    heartbeat = config['ALERT_STREAM_HEARTBEAT_SECONDS']
+    poll = config['ALERT_STREAM_POLL_SECONDS']
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    # events from the moment of connecting on, or after the client's last one
+    latest = alert_feed.latest_id(get_db())
+    resume = last_event_id and last_event_id.isdigit() and int(last_event_id) <= latest
+
+    def generate():
+        yield f"retry: {retry_ms}\n\n"
+        db = get_db()
+        last_id = int(last_event_id) if resume else latest
+        if last_event_id and not resume:
+            # not an alert_events id; the client reloads the alert list
+            yield 'event: reset\ndata: {}\n\n'
+        quiet = 0.0
+        while True:
+            events = alert_feed.since(db, last_id)
+            for row in events:
+                last_id = row['id']
+                yield format_event(row)
+            if len(events) == alert_feed.batch:
+                continue
+            if events:
+                quiet = 0.0
+            elif quiet >= heartbeat:
+                quiet = 0.0
+                yield ': heartbeat\n\n'
+            time.sleep(poll)
+            quiet += poll
+
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    response.call_on_close(alert_feed.release)
+    return response
+
+@api_bp.route('/admin/import', methods=['POST'])
+@token_required
+@role_required('admin')
+def bulk_import():
+    """Stream a CSV or NDJSON body of patients in; answers NDJSON progress, one line per chunk.
+
+    Pass ``job_id`` with the same body to resume an interrupted import.
+    """
+    try:
+        fmt = bulk.detect_format(request.args.get('format'), request.mimetype)
+        job_id = request.args.get('job_id', type=int)
+        if job_id:
+            bulk.resume_job(job_id, fmt)
+        else:
+            job_id = bulk.create_job(request.args.get('source') or 'upload', fmt)
+    except bulk.BulkImportError as e:
+        return jsonify({'error': str(e)}), 400
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8-sig', newline='')
+
+    def generate():
+        for report in bulk.run_import(job_id, bulk.read_rows(stream, fmt)):
+            yield json.dumps(report) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Import-Job': str(job_id)})
+
+@api_bp.route('/admin/import/<int:job_id>', methods=['GET'])
+@token_required
+@role_required('admin')
+def bulk_import_status(job_id):
+    job = bulk.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(job)
+
+@api_bp.route('/admin/export', methods=['GET'])
+@token_required
+@role_required('admin')
+def bulk_export():
+    try:
+        fmt = bulk.detect_format(request.args.get('format') or 'ndjson')
+    except bulk.BulkImportError as e:
+        return jsonify({'error': str(e)}), 400
+    rows = bulk.export_rows(request.args.get('hospital_id', type=int))
+    return Response(stream_with_context(bulk.format_rows(rows, fmt)),
+                    mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson',
+                    headers={'Content-Disposition': f'attachment; filename=patients.{fmt}'})
\ No newline at end of file
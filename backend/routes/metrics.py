@@ -0,0 +1,46 @@
+import hmac
+import logging
+import time
+
+from flask import Blueprint, Response, current_app, g, request
+
+from backend.metrics import http_request_seconds, registry, slow_turn_logger
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    token = current_app.config['METRICS_TOKEN']
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """Time every request and attach the slow-turn log file if configured."""
+
+    @app.before_request
+    def _start_timer():
+        g._request_start = time.perf_counter()
+
+    @app.after_request
+    def _observe(response):
+        start = g.pop('_request_start', None)
+        if start is not None:
+            # endpoint names (api.get_patient) keep the label set bounded,
+            # unlike raw paths with ids in them
+            http_request_seconds.observe(time.perf_counter() - start,
+                                         endpoint=request.endpoint or 'unmatched',
+                                         method=request.method, status=response.status_code)
+        return response
+
+    path = app.config['SLOW_TURN_LOG_PATH']
+    if path and not any(getattr(h, 'baseFilename', None) for h in slow_turn_logger.handlers):
+        handler = logging.FileHandler(path)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_turn_logger.addHandler(handler)
+
+    app.register_blueprint(metrics_bp)
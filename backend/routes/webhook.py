@@ -1,12 +1,38 @@
-from flask import Blueprint, request
+from functools import wraps
+
+from flask import Blueprint, request, current_app
+from twilio.request_validator import RequestValidator
 from twilio.twiml.messaging_response import MessagingResponse
-from backend.services.agent import run_agent
+from backend.services.inbox import enqueue, handle_turn
+from backend.services.outbox import record_status
 from backend.database import get_db
-import json
 
 webhook_bp = Blueprint('webhook', __name__)
 
+def twilio_signed(url_setting=None):
+    """Reject posts without a valid X-Twilio-Signature (403).
+
+    Twilio signs the URL it was configured with; ``url_setting`` names the
+    config key holding it, otherwise the request's own URL is checked (so
+    a TLS-terminating proxy must pass the original scheme and host).
+    Fails closed when TWILIO_AUTH_TOKEN is unset.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            config = current_app.config
+            if config['TWILIO_VALIDATE_SIGNATURE']:
+                token = config['TWILIO_AUTH_TOKEN']
+                url = (url_setting and config[url_setting]) or request.url
+                signature = request.headers.get('X-Twilio-Signature', '')
+                if not token or not RequestValidator(token).validate(url, request.form, signature):
+                    return 'Invalid signature', 403
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
+
 @webhook_bp.route('/whatsapp', methods=['POST'])
+@twilio_signed()
 def whatsapp_reply():
     incoming_msg = request.form.get('Body')
     sender = request.form.get('From')
@@ -19,17 +45,28 @@ def whatsapp_reply():
         resp.message("You are not registered.")
         return str(resp)
 
-    final_state = run_agent(patient['id'], incoming_msg)
-    reply = final_state['response']
+    if current_app.config['WEBHOOK_ASYNC']:
+        # acknowledge at once; an inbox worker runs the agent and replies
+        # through the REST API, so Twilio never waits on the LLM
+        enqueue(patient['id'], phone, incoming_msg, request.form.get('MessageSid'))
+        return str(MessagingResponse())
 
-    db.execute("""
-        INSERT INTO conversations (patient_id, patient_message, agent_response, extracted_symptoms, risk_level)
-        VALUES (?, ?, ?, ?, ?)
-    """, (patient['id'], incoming_msg, reply,
-          json.dumps({"symptoms": final_state['symptoms'], "pain": final_state['pain_level']}),
-          final_state['risk']))
-    db.commit()
+    sid = request.form.get('MessageSid')
+    # a redelivered webhook must not alert (or page the patient) twice
+    reply = handle_turn(patient['id'], incoming_msg, phone=phone, message_key=sid and f'sid:{sid}')
 
     resp = MessagingResponse()
-    resp.message(reply)
-    return str(resp)
\ No newline at end of file
+    if reply:
+        resp.message(reply)
+    return str(resp)
+
+
+@webhook_bp.route('/status', methods=['POST'])
+@twilio_signed('TWILIO_STATUS_CALLBACK_URL')
+def message_status():
+    # Twilio delivery callbacks for outbound messages (TWILIO_STATUS_CALLBACK_URL)
+    sid = request.form.get('MessageSid')
+    status = request.form.get('MessageStatus')
+    if sid and status:
+        record_status(sid, status)
+    return '', 204
@@ -1,42 +1,205 @@
-import json
-import os
-import sqlite3
+import logging
+import re
+import threading
+from contextlib import contextmanager
 from typing import TypedDict, List, Optional
 
-from google import genai
+from google.genai import types
 from langgraph.graph import END, StateGraph
-from langgraph.checkpoint.memory import MemorySaver
 
+from backend.config import Config
+from backend.metrics import json_parse_fallbacks, timed_node
+from backend.response_cache import bump_versions, patient_scope
+from backend.services.checkpointer import open_checkpointer
+from backend.services.clients import LazySingleton, register
+from backend.services import llm
+from backend.services.llm import LLMUnavailable
+from backend.services.prompt import assemble
 from backend.services.rag import retrieve_similar_records
+from backend.services.structured import (
+    EXTRACTION_SCHEMA, TURN_SCHEMA, SchemaError, parse_json_object, validate_extraction,
+)
+from backend.services.triage import get_rules
+from backend.services.whatsapp import send_whatsapp
+from backend.services.writer import writer
 
-# --------------------------------------------------------------
-# 1. Initialize Gemini client (new SDK)
-# --------------------------------------------------------------
-gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+logger = logging.getLogger(__name__)
+
+LLM_MODEL = "models/gemini-2.5-flash"
+
+URGENT_REPLY = (
+    "I'm concerned. Please contact your doctor immediately or go to the ER. "
+    "I've notified your care team."
+)
+
+# Replies used when Gemini is unavailable (deadline, repeated errors or an
+# open circuit breaker); see services/llm.py
+FALLBACK_REPLIES = {
+    "LOW": "Thanks for the update. Keep resting and follow your recovery instructions; we'll check in again soon.",
+    "MEDIUM": "Thanks for letting us know. Please keep an eye on your symptoms and contact your doctor "
+              "if they get worse.",
+}
+
+# Only explicit scores ("7/10", "7 out of 10", "pain is/of/at/level 7");
+# a bare number near "pain" is as often a duration or yesterday's score
+_PAIN_SCORE = re.compile(
+    r"\b(10|[0-9])\s*(?:/|out of)\s*10\b"
+    r"|\bpain(?:\s+level)?\s+(?:is|of|at|level)\s*:?\s*(10|[0-9])\b(?!\s*(?:[/.,]\d|days?|hours?|weeks?|h\b))",
+    re.IGNORECASE)
 
 # --------------------------------------------------------------
-# 2. Define the agent's state
+# 1. Define the agent's state
 # --------------------------------------------------------------
 class PatientState(TypedDict):
     patient_id: int
+    phone: Optional[str]
+    message_key: Optional[str]
     messages: List[dict]
+    turn_count: int
     current_message: str
     retrieved_context: List[str]
+    history: str
     symptoms: List[str]
     pain_level: Optional[int]
     risk: Optional[str]
     response: Optional[str]
     need_clarification: bool
     clarification_question: Optional[str]
+    triage_reason: Optional[str]
+    alerted: bool
+    reply_sent: bool
+    draft_response: Optional[str]
+    parse_failed: bool
+    degraded: bool
+
+def _insert_alert(db, patient_id, alert_type, reason, dedupe_key=None):
+    alert = db.execute("""
+        INSERT INTO alerts (patient_id, alert_type, reason, dedupe_key) VALUES (?, ?, ?, ?)
+        ON CONFLICT (dedupe_key) DO NOTHING
+        RETURNING id
+    """, (patient_id, alert_type, reason, dedupe_key)).fetchone()
+    if alert is None:
+        return None
+    bump_versions(db, patient_scope(patient_id))
+    return alert["id"]
+
+def create_alert(patient_id, alert_type, reason, message_key=None):
+    """Create an alert in the SQLite database; dashboard streams pick it up from ``alert_events``.
+
+    With a ``message_key`` (the inbound message being answered) the alert is
+    created at most once per message and type; returns False for a repeat.
+    """
+    dedupe_key = f"{alert_type}:{message_key}" if message_key else None
+    # flush: commits the writer's pending batch now instead of after its window
+    created = writer.submit(_insert_alert, patient_id, alert_type, reason, dedupe_key, flush=True).result()
+    return created is not None
 
 # --------------------------------------------------------------
-# 3. Node functions
+# 2. Node functions
 # --------------------------------------------------------------
+def triage(state: PatientState) -> PatientState:
+    """Match red-flag phrases before any LLM call; alert and reply at once."""
+    match = get_rules().match(state["current_message"])
+    if not match:
+        return state
+    state["risk"] = "HIGH"
+    state["triage_reason"] = match.reason
+    state["response"] = URGENT_REPLY
+    state["alerted"] = True
+    if not create_alert(state["patient_id"], "red_flag", f"{match.reason}: {state['current_message']}",
+                        state.get("message_key")):
+        # a retried turn: this message was already alerted on and its
+        # urgent reply sent right after
+        state["reply_sent"] = True
+        return state
+    # Send the urgent reply now; the rest of the graph only enriches the
+    # conversation record with extracted symptoms.
+    if state.get("phone"):
+        try:
+            send_whatsapp(state["phone"], URGENT_REPLY)
+            state["reply_sent"] = True
+        except Exception:
+            logger.exception("Fast-path reply to patient %s failed", state["patient_id"])
+    return state
+
 def retrieve_context(state: PatientState) -> PatientState:
-    """Retrieve relevant patient records from Chroma."""
+    """Retrieve relevant patient records and fit them and the history into the prompt budget."""
     pid = state["patient_id"]
     query = state["current_message"]
-    state["retrieved_context"] = retrieve_similar_records(pid, query)
+    records = retrieve_similar_records(pid, query)
+    state["history"], state["retrieved_context"] = assemble(
+        pid, query, state["messages"], records, state["turn_count"])
+    return state
+
+def _history_text(state: PatientState) -> str:
+    """The history assembled by retrieve_context, or an empty string."""
+    return state.get("history") or ""
+
+def _apply_extraction(state: PatientState, data: dict) -> None:
+    state.update({
+        "symptoms": data["symptoms"],
+        "pain_level": data["pain_level"],
+        # a red-flag match is never downgraded by the model
+        "risk": "HIGH" if state.get("triage_reason") else data["risk"],
+    })
+
+def _rule_based_extraction(message: str) -> dict:
+    """Extraction without the LLM: a stated pain score, MEDIUM risk unless it is severe."""
+    # the last score stated is the current one ("was 9/10, now 3/10")
+    match = None
+    for match in _PAIN_SCORE.finditer(message):
+        pass
+    pain = int(match.group(1) or match.group(2)) if match else None
+    return {"symptoms": [], "pain_level": pain, "risk": "HIGH" if pain is not None and pain >= 8 else "MEDIUM"}
+
+def _degrade(state: PatientState, stage: str, exc: Exception) -> PatientState:
+    logger.warning("Gemini unavailable for patient %s at %s: %s", state["patient_id"], stage, exc)
+    llm.fallbacks.inc(stage=stage)
+    _apply_extraction(state, _rule_based_extraction(state["current_message"]))
+    state["draft_response"] = None
+    state["degraded"] = True
+    return state
+
+def analyze_turn(state: PatientState) -> PatientState:
+    """One structured Gemini call returning the extraction and the reply together."""
+    context = "\n".join(state["retrieved_context"])
+    prompt = f"""
+You are a caring medical assistant conducting a post‑surgery follow‑up.
+
+Patient's last message: "{state['current_message']}"
+Relevant history: {context}
+
+Recent conversation:
+{_history_text(state)}
+
+Fill in:
+- symptoms: list of symptoms the patient reports
+- pain_level: 0-10, or null if not stated
+- risk: LOW, MEDIUM or HIGH
+- reply: your message to the patient. Respond empathetically and concisely. For LOW risk, reassure and remind to rest. For MEDIUM risk, advise monitoring and contacting a doctor if symptoms worsen. For HIGH risk, tell them to contact their doctor immediately.
+"""
+    try:
+        response = llm.generate(
+            operation="analyze",
+            model=LLM_MODEL,
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=TURN_SCHEMA,
+            ),
+        )
+    except LLMUnavailable as exc:
+        return _degrade(state, "analyze", exc)
+    try:
+        data = validate_extraction(parse_json_object(response.text), require_reply=True)
+    except SchemaError as exc:
+        # fall back to the two-call path rather than guessing
+        logger.warning("Structured turn for patient %s failed validation: %s", state["patient_id"], exc)
+        json_parse_fallbacks.inc(stage="analyze")
+        state["draft_response"] = None
+        return state
+    _apply_extraction(state, data)
+    state["draft_response"] = data["reply"]
     return state
 
 def parse_input(state: PatientState) -> PatientState:
@@ -51,20 +214,28 @@ def parse_input(state: PatientState) -> PatientState:
     - risk (LOW/MEDIUM/HIGH)
     Return JSON.
     """
-    response = gemini_client.models.generate_content(
-        model="models/gemini-2.5-flash",
-        contents=prompt
-    )
     try:
-        data = json.loads(response.text)
-    except Exception:
-        data = {"symptoms": [], "pain_level": None, "risk": "LOW"}
-
-    state.update({
-        "symptoms": data.get("symptoms", []),
-        "pain_level": data.get("pain_level"),
-        "risk": data.get("risk", "LOW"),
-    })
+        response = llm.generate(
+            operation="parse",
+            model=LLM_MODEL,
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=EXTRACTION_SCHEMA,
+            ),
+        )
+    except LLMUnavailable as exc:
+        return _degrade(state, "parse", exc)
+    try:
+        data = validate_extraction(parse_json_object(response.text))
+    except SchemaError as exc:
+        # Unknown risk is treated as MEDIUM so the patient is told to watch
+        # for worsening symptoms instead of being silently reassured.
+        logger.warning("Extraction for patient %s failed validation: %s", state["patient_id"], exc)
+        json_parse_fallbacks.inc(stage="parse")
+        data = {"symptoms": [], "pain_level": None, "risk": "MEDIUM"}
+        state["parse_failed"] = True
+    _apply_extraction(state, data)
     return state
 
 def assess_risk(state: PatientState) -> PatientState:
@@ -84,26 +255,19 @@ def generate_response(state: PatientState) -> PatientState:
         state["response"] = state["clarification_question"]
     elif state["risk"] == "HIGH":
         # Static urgent message (ensures clarity)
-        state["response"] = (
-            "I'm concerned. Please contact your doctor immediately or go to the ER. "
-            "I've notified your care team."
-        )
-        # Create an alert in the SQLite database
-        db = sqlite3.connect(os.getenv("DATABASE_PATH", "data/patients.db"))
-        db.execute(
-            "INSERT INTO alerts (patient_id, alert_type, reason) VALUES (?, ?, ?)",
-            (state["patient_id"], "high_risk", state["current_message"]),
-        )
-        db.commit()
-        db.close()
+        state["response"] = URGENT_REPLY
+        if not state.get("alerted"):
+            create_alert(state["patient_id"], "high_risk", state["current_message"], state.get("message_key"))
+            state["alerted"] = True
+    elif state.get("draft_response"):
+        # Reply already written by the structured single-call path
+        state["response"] = state["draft_response"]
+    elif state.get("degraded"):
+        # Gemini is down; don't make the patient wait on another call
+        state["response"] = FALLBACK_REPLIES.get(state["risk"], FALLBACK_REPLIES["MEDIUM"])
     else:
         # --- Dynamic response for LOW / MEDIUM risk ---
-        # Build conversation history (last 3 exchanges)
-        history_lines = []
-        for m in state["messages"][-3:]:
-            history_lines.append(f"User: {m['user']}")
-            history_lines.append(f"Assistant: {m['assistant']}")
-        history = "\n".join(history_lines)
+        history = _history_text(state)
 
         prompt = f"""
 You are a caring medical assistant conducting a post‑surgery follow‑up.
@@ -118,58 +282,142 @@ Recent conversation:
 
 Respond empathetically and concisely. For LOW risk, reassure and remind to rest. For MEDIUM risk, advise monitoring and contacting a doctor if symptoms worsen. Do not include any JSON, just the response.
 """
-        response = gemini_client.models.generate_content(
-            model="models/gemini-2.5-flash",
-            contents=prompt
-        )
-        state["response"] = response.text.strip()
+        try:
+            response = llm.generate(
+                operation="respond",
+                model=LLM_MODEL,
+                contents=prompt
+            )
+            state["response"] = response.text.strip()
+        except LLMUnavailable as exc:
+            logger.warning("Gemini unavailable for patient %s at respond: %s", state["patient_id"], exc)
+            llm.fallbacks.inc(stage="respond")
+            state["response"] = FALLBACK_REPLIES.get(state["risk"], FALLBACK_REPLIES["MEDIUM"])
     return state
 
 def update_history(state: PatientState) -> PatientState:
     """Append the current exchange to the conversation history."""
+    state["turn_count"] += 1
     state["messages"].append({
         "user": state["current_message"],
-        "assistant": state["response"]
+        "assistant": state["response"],
+        "turn": state["turn_count"],
     })
+    # Keep the checkpointed state bounded; older turns live in `conversations`
+    state["messages"] = state["messages"][-Config.AGENT_HISTORY_TURNS:]
     return state
 
 # --------------------------------------------------------------
-# 4. Build the LangGraph
+# 3. Build the LangGraph
 # --------------------------------------------------------------
 builder = StateGraph(PatientState)
-builder.add_node("retrieve", retrieve_context)
-builder.add_node("parse", parse_input)
-builder.add_node("assess", assess_risk)
-builder.add_node("respond", generate_response)
-builder.add_node("update", update_history)
-
-builder.set_entry_point("retrieve")
-builder.add_edge("retrieve", "parse")
+builder.add_node("triage", timed_node("triage", triage))
+builder.add_node("retrieve", timed_node("retrieve", retrieve_context))
+builder.add_node("analyze", timed_node("analyze", analyze_turn))
+builder.add_node("parse", timed_node("parse", parse_input))
+builder.add_node("assess", timed_node("assess", assess_risk))
+builder.add_node("respond", timed_node("respond", generate_response))
+builder.add_node("update", timed_node("update", update_history))
+
+builder.set_entry_point("triage")
+builder.add_edge("triage", "retrieve")
+# AGENT_MODE=single makes one structured call per turn; the two-call
+# extract-then-reply path is used in 'split' mode and whenever the
+# structured output fails validation.
+builder.add_conditional_edges(
+    "retrieve", lambda state: "analyze" if Config.AGENT_MODE == "single" else "parse",
+    ["analyze", "parse"],
+)
+builder.add_conditional_edges(
+    "analyze", lambda state: "assess" if state.get("draft_response") or state.get("degraded") else "parse",
+    ["assess", "parse"],
+)
 builder.add_edge("parse", "assess")
 builder.add_edge("assess", "respond")
 builder.add_edge("respond", "update")
 builder.add_edge("update", END)
 
-# Use an in‑memory checkpointer to avoid async issues
-checkpointer = MemorySaver()
-agent_graph = builder.compile(checkpointer=checkpointer)
+# Persistent checkpointer shared by every worker process; each thread keeps
+# only its newest checkpoints so the file stays bounded. It holds a SQLite
+# handle, so it and the graph compiled against it are built lazily, after
+# any fork.
+checkpointer = register(LazySingleton("checkpointer", lambda: open_checkpointer(
+    Config.CHECKPOINT_DB_PATH, Config.CHECKPOINT_KEEP_PER_THREAD)))
+agent_graph = register(LazySingleton("agent_graph", lambda: builder.compile(checkpointer=checkpointer.get())))
 
 # --------------------------------------------------------------
-# 5. Public function to run the agent
+# 4. Public function to run the agent
 # --------------------------------------------------------------
-def run_agent(patient_id: int, message: str) -> PatientState:
-    """Invoke the agent for a given patient and message."""
+class _ThreadLocks:
+    """One lock per conversation thread, dropped once nobody holds or waits on it."""
+
+    def __init__(self):
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, thread_id):
+        with self._guard:
+            entry = self._locks.setdefault(thread_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[thread_id]
+
+# Turns for one patient run one at a time (each reads the checkpoint the
+# previous one wrote); different patients still run in parallel. Across
+# processes the inbox claim gives the same guarantee.
+_thread_locks = _ThreadLocks()
+
+def run_agent(patient_id: int, message: str, phone: Optional[str] = None,
+              message_key: Optional[str] = None) -> PatientState:
+    """Invoke the agent for a given patient and message.
+
+    When ``phone`` is given, a red-flag message gets its urgent reply sent
+    straight away and the returned state has ``reply_sent`` set.
+    ``message_key`` identifies the inbound message so that a retried turn
+    raises its alerts (and urgent reply) only once.
+    """
     config = {"configurable": {"thread_id": str(patient_id)}}
-    initial_state = {
-        "patient_id": patient_id,
-        "messages": [],
-        "current_message": message,
-        "retrieved_context": [],
-        "symptoms": [],
-        "pain_level": None,
-        "risk": None,
-        "response": None,
-        "need_clarification": False,
-        "clarification_question": None,
-    }
-    return agent_graph.invoke(initial_state, config=config)
\ No newline at end of file
+    with _thread_locks.hold(config["configurable"]["thread_id"]):
+        # Continue the patient's thread from the last checkpoint, whichever
+        # process wrote it.
+        graph = agent_graph.get()
+        previous = graph.get_state(config).values or {}
+        messages = [dict(m) for m in previous.get("messages", [])]
+        turn_count = previous.get("turn_count")
+        if turn_count is None:
+            # checkpoint from before turns were numbered
+            turn_count = len(messages)
+            for n, m in enumerate(messages, start=1):
+                m["turn"] = n
+        initial_state = {
+            "patient_id": patient_id,
+            "phone": phone,
+            "message_key": message_key,
+            "messages": messages,
+            "turn_count": turn_count,
+            "current_message": message,
+            "retrieved_context": [],
+            "history": "",
+            "symptoms": [],
+            "pain_level": None,
+            "risk": None,
+            "response": None,
+            "need_clarification": False,
+            "clarification_question": None,
+            "triage_reason": None,
+            "alerted": False,
+            "reply_sent": False,
+            "draft_response": None,
+            "parse_failed": False,
+            "degraded": False,
+        }
+        final_state = graph.invoke(initial_state, config=config)
+        checkpointer.get().prune_thread(config["configurable"]["thread_id"])
+    return final_state
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""Cold tier for old conversations: zstd-compressed NDJSON segment files.
+
+Each calendar month (of ``created_at``) has one append-only segment file
+under ARCHIVE_DIR. An archive run appends one zstd frame per patient per
+month and records it in ``conversation_archive`` (segment, byte offset,
+length, time range), so one patient's history is read back by seeking to
+its frames instead of decompressing whole months.
+
+A run writes and fsyncs the frames before the transaction that indexes
+them and deletes the hot rows, so a crash in between leaves at most an
+unreferenced frame, never a lost conversation.
+"""
+import datetime
+import json
+import os
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+
+import zstandard
+
+from backend.config import Config
+from backend.database import db_write, pool
+from backend.response_cache import bump_versions, patient_scope
+
+COLUMNS = ("id", "patient_id", "doctor_id", "channel", "patient_message", "agent_response",
+           "extracted_symptoms", "pain_level", "risk_level", "created_at")
+DELETE_CHUNK = 500
+
+
+def segment_name(month):
+    return f"conversations-{month}.ndjson.zst"
+
+
+@contextmanager
+def _run_lock(directory):
+    # one archiver at a time; segment offsets assume a single appender.
+    # Imported here so the app still loads where fcntl doesn't exist.
+    with open(os.path.join(directory, ".archive.lock"), "w") as lock:
+        try:
+            import fcntl
+        except ImportError:
+            # Windows: lock the first byte; LK_LOCK retries for ~10s, then raises
+            import msvcrt
+            msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+            return
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _frames(rows, level):
+    """Group one batch's rows into {month: [(patient_id, frame_bytes, rows), ...]}."""
+    groups = {}
+    for row in rows:
+        groups.setdefault((row["created_at"][:7], row["patient_id"]), []).append(row)
+    compressor = zstandard.ZstdCompressor(level=level)
+    by_month = {}
+    for (month, patient_id), group in groups.items():
+        payload = "".join(json.dumps({c: r[c] for c in COLUMNS}, separators=(",", ":")) + "\n" for r in group)
+        by_month.setdefault(month, []).append((patient_id, compressor.compress(payload.encode("utf-8")), group))
+    return by_month
+
+
+def _append(directory, month, frames):
+    """Append frames to the month's segment; returns [(patient_id, offset, length, rows)]."""
+    written = []
+    with open(os.path.join(directory, segment_name(month)), "ab") as f:
+        offset = f.seek(0, os.SEEK_END)
+        for patient_id, frame, group in frames:
+            f.write(frame)
+            written.append((patient_id, offset, len(frame), group))
+            offset += len(frame)
+        f.flush()
+        os.fsync(f.fileno())
+    return written
+
+
+def archive_conversations(older_than_days=None, batch_patients=200, now=None):
+    """Move old conversations, and all of discharged patients', to the cold tier.
+
+    Returns ``{"patients": n, "rows": n, "frames": n}``.
+    """
+    directory = Config.ARCHIVE_DIR
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    days = Config.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    now = now or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    # whole days only, so a day's rollup row never straddles the two tiers
+    cutoff = (now.date() - datetime.timedelta(days=days)).isoformat()
+    stats = {"patients": 0, "rows": 0, "frames": 0}
+
+    with _run_lock(directory):
+        patient_ids = [r[0] for r in pool.connection().execute("""
+            SELECT p.id FROM patients p
+            WHERE EXISTS (
+                SELECT 1 FROM conversations c
+                WHERE c.patient_id = p.id AND c.created_at IS NOT NULL
+                  AND (p.is_active = 0 OR c.created_at < ?)
+            )
+        """, (cutoff,))]
+
+        for start in range(0, len(patient_ids), batch_patients):
+            batch = patient_ids[start:start + batch_patients]
+            placeholders = ",".join("?" * len(batch))
+            rows = pool.connection().execute(f"""
+                SELECT {', '.join('c.' + c for c in COLUMNS)} FROM conversations c
+                JOIN patients p ON p.id = c.patient_id
+                WHERE c.patient_id IN ({placeholders}) AND c.created_at IS NOT NULL
+                  AND (p.is_active = 0 OR c.created_at < ?)
+                ORDER BY c.patient_id, c.created_at, c.id
+            """, (*batch, cutoff)).fetchall()
+            if not rows:
+                continue
+
+            index_rows = []
+            for month, frames in sorted(_frames(rows, Config.ARCHIVE_ZSTD_LEVEL).items()):
+                for patient_id, offset, length, group in _append(directory, month, frames):
+                    index_rows.append((patient_id, month, segment_name(month), offset, length, len(group),
+                                       group[0]["created_at"], group[-1]["created_at"], time.time()))
+
+            ids = [(r["id"],) for r in rows]
+            with db_write() as db:
+                db.executemany("""
+                    INSERT INTO conversation_archive
+                        (patient_id, month, segment, byte_offset, byte_length, row_count,
+                         first_created_at, last_created_at, archived_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, index_rows)
+                for i in range(0, len(ids), DELETE_CHUNK):
+                    db.executemany("DELETE FROM conversations WHERE id = ?", ids[i:i + DELETE_CHUNK])
+                bump_versions(db, *{patient_scope(pid) for pid in batch})
+
+            stats["patients"] += len({r["patient_id"] for r in rows})
+            stats["rows"] += len(rows)
+            stats["frames"] += len(index_rows)
+    return stats
+
+
+@lru_cache(maxsize=256)
+def _read_frame(segment, offset, length):
+    # segments are append-only, so (segment, offset, length) never changes content
+    with open(os.path.join(Config.ARCHIVE_DIR, segment), "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+    text = zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    return tuple(json.loads(line) for line in text.splitlines() if line)
+
+
+def has_archive(db, patient_id):
+    return db.execute("SELECT 1 FROM conversation_archive WHERE patient_id = ? LIMIT 1",
+                      (patient_id,)).fetchone() is not None
+
+
+def read_archived(db, patient_id, before=None, limit=None):
+    """A patient's archived rows, newest first, keyed strictly before ``(created_at, id)``."""
+    entries = db.execute("""
+        SELECT segment, byte_offset, byte_length, first_created_at, last_created_at
+        FROM conversation_archive
+        WHERE patient_id = ? AND (? IS NULL OR first_created_at <= ?)
+        ORDER BY last_created_at DESC, id DESC
+    """, (patient_id, before and before[0], before and before[0])).fetchall()
+    collected = []
+    for entry in entries:
+        # frames are visited newest-ending first; once we hold `limit` rows
+        # newer than anything this frame holds, no later frame can help
+        if limit is not None and len(collected) >= limit and entry["last_created_at"] < collected[limit - 1]["created_at"]:
+            break
+        rows = _read_frame(entry["segment"], entry["byte_offset"], entry["byte_length"])
+        collected.extend(r for r in rows if before is None or (r["created_at"], r["id"]) < before)
+        collected.sort(key=lambda r: (r["created_at"], r["id"]), reverse=True)
+    return collected[:limit] if limit is not None else collected
+
+
+def vacuum():
+    """Reclaim the space freed by archiving (blocks writers while it runs)."""
+    with db_write() as db:
+        db.execute("VACUUM")
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
@@ -0,0 +1,321 @@
+"""Streaming bulk import and export of patients.
+
+One input row describes a patient and, optionally, their primary doctor,
+a patient login and a discharge note:
+
+    phone, name, date_of_birth, surgery_date, surgery_type, hospital_id,
+    is_active, doctor_phone, doctor_name, doctor_email, doctor_specialty,
+    username, password, discharge_note
+
+Rows are read lazily from CSV or NDJSON and imported in chunks. For each
+chunk, passwords are hashed in parallel and discharge notes are embedded
+in batched requests before the write lock is taken. One transaction then
+inserts doctors, patients, users and note vectors and advances the job's
+``rows_done`` offset. A failed or interrupted import resumes from the
+last committed chunk when the same input is replayed with its job id.
+Existing patients (by phone) are skipped, never overwritten. Export
+writes the same columns minus password and discharge_note.
+"""
+import csv
+import datetime
+import io
+import itertools
+import json
+import re
+import time
+
+from backend.auth_utils import hash_passwords
+from backend.config import Config
+from backend.database import db_write, pool
+from backend.metrics import external_call, registry
+from backend.services.clients import get_vector_store
+from backend.services.rag import embed_texts
+
+FORMATS = ("csv", "ndjson")
+EXPORT_COLUMNS = ("phone", "name", "date_of_birth", "surgery_date", "surgery_type", "hospital_id", "is_active",
+                  "doctor_phone", "doctor_name", "doctor_email", "doctor_specialty", "username")
+EXPORT_BATCH = 1000
+MAX_REPORTED_ERRORS = 20
+
+_PHONE = re.compile(r"^\+\d{7,15}$")
+
+imported_rows = registry.counter(
+    "bulk_import_rows_total", "Bulk import input rows by outcome.", ("outcome",))
+
+
+class BulkImportError(ValueError):
+    """Unknown job, wrong format or a job that cannot be resumed (answered with 400/404)."""
+
+
+def detect_format(explicit=None, mimetype=None, filename=None):
+    fmt = (explicit or "").lower()
+    if not fmt and mimetype:
+        fmt = "csv" if "csv" in mimetype else "ndjson" if ("ndjson" in mimetype or "jsonl" in mimetype) else ""
+    if not fmt and filename:
+        fmt = "csv" if filename.lower().endswith(".csv") else "ndjson"
+    if fmt == "jsonl":
+        fmt = "ndjson"
+    if fmt not in FORMATS:
+        raise BulkImportError("format must be csv or ndjson")
+    return fmt
+
+
+def read_rows(stream, fmt):
+    """Yield one dict per input row; unparseable NDJSON lines yield ``{"_error": ...}``."""
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield {"_error": f"invalid JSON: {exc}"}
+            continue
+        yield row if isinstance(row, dict) else {"_error": "not a JSON object"}
+
+
+def _text(row, key):
+    value = row.get(key)
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _normalize(row):
+    """Validated row, or raise ValueError with the reason."""
+    if "_error" in row:
+        raise ValueError(row["_error"])
+    phone = (_text(row, "phone") or "").replace(" ", "").replace("-", "")
+    if not _PHONE.match(phone):
+        raise ValueError(f"invalid phone {row.get('phone')!r}")
+    for key in ("date_of_birth", "surgery_date"):
+        if _text(row, key):
+            datetime.date.fromisoformat(_text(row, key)[:10])
+    hospital_id = _text(row, "hospital_id")
+    doctor_phone = (_text(row, "doctor_phone") or "").replace(" ", "").replace("-", "") or None
+    if doctor_phone and not _PHONE.match(doctor_phone):
+        raise ValueError(f"invalid doctor_phone {row.get('doctor_phone')!r}")
+    username, password = _text(row, "username"), _text(row, "password")
+    if password and not username:
+        raise ValueError("password without username")
+    is_active = _text(row, "is_active")
+    return {
+        "phone": phone, "name": _text(row, "name"),
+        "date_of_birth": _text(row, "date_of_birth"), "surgery_date": _text(row, "surgery_date"),
+        "surgery_type": _text(row, "surgery_type"),
+        "hospital_id": int(hospital_id) if hospital_id else None,
+        "is_active": 0 if is_active in ("0", "false", "False", "no") else 1,
+        "doctor_phone": doctor_phone, "doctor_name": _text(row, "doctor_name"),
+        "doctor_email": _text(row, "doctor_email"), "doctor_specialty": _text(row, "doctor_specialty"),
+        "username": username, "password": password, "discharge_note": _text(row, "discharge_note"),
+    }
+
+
+def _existing_phones(db, table, phones):
+    return {r[0]: r[1] for r in db.execute(
+        f"SELECT phone, id FROM {table} WHERE phone IN (SELECT value FROM json_each(?))", (json.dumps(phones),))}
+
+
+def create_job(source, fmt):
+    now = time.time()
+    with db_write() as db:
+        return db.execute(
+            "INSERT INTO import_jobs (source, format, created_at, updated_at) VALUES (?, ?, ?, ?) RETURNING id",
+            (source, fmt, now, now)).fetchone()[0]
+
+
+def get_job(job_id):
+    row = pool.connection().execute("SELECT * FROM import_jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def resume_job(job_id, fmt):
+    """Reopen a job for another pass over the same input; returns its row."""
+    job = get_job(job_id)
+    if job is None:
+        raise BulkImportError(f"no import job {job_id}")
+    if job["format"] != fmt:
+        raise BulkImportError(f"job {job_id} was a {job['format']} import")
+    if job["status"] == "failed":
+        with db_write() as db:
+            db.execute("UPDATE import_jobs SET status = 'running', last_error = NULL, updated_at = ? WHERE id = ?",
+                       (time.time(), job_id))
+    return get_job(job_id)
+
+
+def _import_chunk(job_id, chunk, first_row):
+    counts = {"patients": 0, "doctors": 0, "users": 0, "records": 0, "skipped": 0, "rejected": 0}
+    errors = []
+    rows = []
+    for n, raw in enumerate(chunk, start=first_row):
+        try:
+            rows.append({**_normalize(raw), "row": n})
+        except (ValueError, TypeError) as exc:
+            counts["rejected"] += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"row": n, "error": str(exc)})
+
+    # slow work first, outside the write lock
+    phones = [r["phone"] for r in rows]
+    known = _existing_phones(pool.connection(), "patients", phones)
+    notes = {}
+    for r in rows:
+        if r["discharge_note"] and r["phone"] not in known and r["phone"] not in notes:
+            notes[r["phone"]] = r["discharge_note"]
+    vectors = dict(zip(notes, embed_texts(list(notes.values())))) if notes else {}
+    # exported rows carry the username only; no password means no new login.
+    # Existing patients never get one either: their phones are not overwritten
+    with_login = [r for r in rows if r["username"] and r["password"] and r["phone"] not in known]
+    hashes = hash_passwords([r["password"] for r in with_login])
+    for r, hashed in zip(with_login, hashes):
+        r["password_hash"] = hashed
+
+    with db_write() as db:
+        doctors = {}
+        for r in rows:
+            if r["doctor_phone"] and r["doctor_phone"] not in doctors:
+                doctors[r["doctor_phone"]] = (r["doctor_name"] or r["doctor_phone"], r["doctor_phone"],
+                                              r["doctor_email"], r["doctor_specialty"], r["hospital_id"])
+        if doctors:
+            counts["doctors"] = max(db.executemany("""
+                INSERT INTO doctors (name, phone, email, specialty, hospital_id) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (phone) DO NOTHING
+            """, list(doctors.values())).rowcount, 0)
+        doctor_ids = _existing_phones(db, "doctors", list(doctors)) if doctors else {}
+
+        existing = _existing_phones(db, "patients", phones)
+        new_rows, seen = [], set(existing)
+        for r in rows:
+            if r["phone"] in seen:
+                counts["skipped"] += 1
+                continue
+            seen.add(r["phone"])
+            new_rows.append(r)
+        db.executemany("""
+            INSERT INTO patients (phone, name, date_of_birth, surgery_date, surgery_type, hospital_id,
+                                  primary_doctor_id, is_active)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(r["phone"], r["name"], r["date_of_birth"], r["surgery_date"], r["surgery_type"], r["hospital_id"],
+               doctor_ids.get(r["doctor_phone"]), r["is_active"]) for r in new_rows])
+        counts["patients"] = len(new_rows)
+        patient_ids = _existing_phones(db, "patients", phones)
+
+        logins = [r for r in new_rows if r.get("password_hash")]
+        if logins:
+            taken = {u[0] for u in db.execute(
+                "SELECT username FROM users WHERE username IN (SELECT value FROM json_each(?))",
+                (json.dumps([r["username"] for r in logins]),))}
+            users = []
+            for r in logins:
+                if r["username"] in taken:
+                    # the patient is imported, just without a login
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append({"row": r["row"],
+                                       "error": f"username {r['username']!r} is taken; no login created"})
+                    continue
+                taken.add(r["username"])
+                users.append((r["username"], r["password_hash"], patient_ids[r["phone"]]))
+            db.executemany("INSERT INTO users (username, password_hash, role, patient_id) VALUES (?, ?, 'patient', ?)",
+                           users)
+            counts["users"] = len(users)
+
+        # notes of patients that turned out to exist already are dropped;
+        # with the sqlite-vec store the vectors commit with this transaction
+        note_phones = [r["phone"] for r in new_rows if r["phone"] in notes]
+        if note_phones:
+            with external_call("vector_store", "add"):
+                get_vector_store().add_many(
+                    [patient_ids[p] for p in note_phones], [vectors[p] for p in note_phones],
+                    [notes[p] for p in note_phones],
+                    [{"source": "discharge_note", "import_job": job_id}] * len(note_phones))
+            counts["records"] = len(note_phones)
+
+        db.execute("""
+            UPDATE import_jobs SET rows_done = rows_done + ?, patients = patients + ?, doctors = doctors + ?,
+                users = users + ?, records = records + ?, skipped = skipped + ?, rejected = rejected + ?,
+                updated_at = ?
+            WHERE id = ?
+        """, (len(chunk), counts["patients"], counts["doctors"], counts["users"], counts["records"],
+              counts["skipped"], counts["rejected"], time.time(), job_id))
+
+    imported_rows.inc(counts["patients"], outcome="imported")
+    imported_rows.inc(counts["skipped"], outcome="skipped")
+    imported_rows.inc(counts["rejected"], outcome="rejected")
+    return counts, errors
+
+
+def run_import(job_id, rows, chunk_size=None):
+    """Import ``rows`` into job ``job_id``, skipping what it already committed.
+
+    Yields one report per chunk (counts, errors, throughput) and a final
+    one with the job's status and totals.
+    """
+    chunk_size = chunk_size or Config.IMPORT_CHUNK_ROWS
+    done = get_job(job_id)["rows_done"]
+    rows = itertools.islice(iter(rows), done, None)
+    chunk_no = 0
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        chunk_no += 1
+        start = time.perf_counter()
+        try:
+            counts, errors = _import_chunk(job_id, chunk, done + 1)
+        except Exception as exc:
+            with db_write() as db:
+                db.execute("UPDATE import_jobs SET status = 'failed', last_error = ?, updated_at = ? WHERE id = ?",
+                           (str(exc)[:500], time.time(), job_id))
+            yield {"job_id": job_id, "status": "failed", "rows_done": done, "error": str(exc)}
+            return
+        took = time.perf_counter() - start
+        done += len(chunk)
+        yield {"job_id": job_id, "chunk": chunk_no, "rows": len(chunk), "rows_done": done, **counts,
+               "errors": errors, "seconds": round(took, 3), "rows_per_second": round(len(chunk) / took, 1)}
+    with db_write() as db:
+        db.execute("UPDATE import_jobs SET status = 'done', updated_at = ? WHERE id = ?", (time.time(), job_id))
+    yield {"status": "done", **get_job(job_id)}
+
+
+def export_rows(hospital_id=None):
+    """Patients in import format, streamed in id order (no passwords or notes)."""
+    after = 0
+    db = pool.connection()
+    while True:
+        batch = db.execute("""
+            SELECT p.id, p.phone, p.name, p.date_of_birth, p.surgery_date, p.surgery_type, p.hospital_id, p.is_active,
+                   d.phone AS doctor_phone, d.name AS doctor_name, d.email AS doctor_email,
+                   d.specialty AS doctor_specialty,
+                   (SELECT username FROM users u WHERE u.patient_id = p.id AND u.role = 'patient'
+                    ORDER BY u.id LIMIT 1) AS username
+            FROM patients p LEFT JOIN doctors d ON d.id = p.primary_doctor_id
+            WHERE p.id > ? AND (? IS NULL OR p.hospital_id = ?)
+            ORDER BY p.id LIMIT ?
+        """, (after, hospital_id, hospital_id, EXPORT_BATCH)).fetchall()
+        if not batch:
+            return
+        for row in batch:
+            yield {c: row[c] for c in EXPORT_COLUMNS}
+        after = batch[-1]["id"]
+
+
+def format_rows(rows, fmt):
+    """Serialise export rows as CSV (with header) or NDJSON, in chunks of text."""
+    if fmt == "ndjson":
+        for batch in iter(lambda: list(itertools.islice(rows, EXPORT_BATCH)), []):
+            yield "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in batch)
+        return
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, lineterminator="\n")
+    writer.writeheader()
+    for batch in iter(lambda: list(itertools.islice(rows, EXPORT_BATCH)), []):
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
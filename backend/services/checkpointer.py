@@ -0,0 +1,80 @@
+import os
+import sqlite3
+from pathlib import Path
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+
+class BoundedSqliteSaver(SqliteSaver):
+    """SqliteSaver that keeps only the newest ``keep_last`` checkpoints per thread.
+
+    Checkpoint ids are time-ordered (uuid6), so ordering by id keeps the most
+    recent ones. Pending writes of dropped checkpoints are removed with them.
+    """
+
+    def __init__(self, conn, keep_last):
+        super().__init__(conn)
+        self.keep_last = keep_last
+
+    def prune_thread(self, thread_id):
+        """Drop all but the newest checkpoints of one thread. Returns rows deleted."""
+        with self.cursor() as cur:
+            cur.execute("""
+                DELETE FROM checkpoints WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (
+                            PARTITION BY checkpoint_ns ORDER BY checkpoint_id DESC) AS rn
+                        FROM checkpoints WHERE thread_id = ?
+                    ) WHERE rn > ?
+                )
+            """, (str(thread_id), self.keep_last))
+            deleted = cur.rowcount
+            if deleted:
+                cur.execute("""
+                    DELETE FROM writes WHERE thread_id = ? AND NOT EXISTS (
+                        SELECT 1 FROM checkpoints c
+                        WHERE c.thread_id = writes.thread_id
+                          AND c.checkpoint_ns = writes.checkpoint_ns
+                          AND c.checkpoint_id = writes.checkpoint_id)
+                """, (str(thread_id),))
+        return deleted
+
+    def prune_all(self):
+        """Apply the retention limit to every thread. Returns (checkpoints, writes) deleted."""
+        with self.cursor() as cur:
+            cur.execute("""
+                DELETE FROM checkpoints WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (
+                            PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS rn
+                        FROM checkpoints
+                    ) WHERE rn > ?
+                )
+            """, (self.keep_last,))
+            checkpoints = cur.rowcount
+            cur.execute("""
+                DELETE FROM writes WHERE NOT EXISTS (
+                    SELECT 1 FROM checkpoints c
+                    WHERE c.thread_id = writes.thread_id
+                      AND c.checkpoint_ns = writes.checkpoint_ns
+                      AND c.checkpoint_id = writes.checkpoint_id)
+            """)
+            writes = cur.rowcount
+        return checkpoints, writes
+
+    def vacuum(self):
+        with self.lock:
+            self.conn.execute("VACUUM")
+
+
+def open_checkpointer(path, keep_last):
+    """Open the shared checkpoint database; safe to use from several processes."""
+    dirpath = os.path.dirname(path)
+    if dirpath:
+        Path(dirpath).mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    saver = BoundedSqliteSaver(conn, keep_last)
+    saver.setup()
+    return saver
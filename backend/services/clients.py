@@ -0,0 +1,112 @@
+"""Process-wide clients for Gemini, Twilio and the vector store.
+
+Nothing is built at import time: each client is created on first use,
+once per process, and shared by every module that needs it. That keeps
+imports cheap, lets gunicorn preload the app in the master without
+opening sockets or database handles there, and turns a missing API key
+into an error on the first call instead of a crash at boot.
+"""
+import os
+import threading
+
+from backend.config import Config
+
+
+class LazySingleton:
+    """Build ``factory()`` on first ``get()``; thread-safe, resettable after fork."""
+
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def get(self):
+        value = self._value
+        if value is not None and self._pid == os.getpid():
+            return value
+        with self._lock:
+            if self._value is None or self._pid != os.getpid():
+                self._value = self.factory()
+                self._pid = os.getpid()
+            return self._value
+
+    def set(self, value):
+        """Install a ready-made instance (tests, benchmarks)."""
+        with self._lock:
+            self._value = value
+            self._pid = os.getpid()
+
+    def reset(self):
+        """Forget the instance; the next get() builds a new one."""
+        with self._lock:
+            self._value = None
+            self._pid = None
+
+    @property
+    def ready(self):
+        return self._value is not None and self._pid == os.getpid()
+
+
+def _make_gemini():
+    from google import genai
+    from google.genai import types
+    # no single HTTP request outlives the longest call deadline (services/llm.py)
+    timeout_ms = int(max(Config.LLM_DEADLINE_SECONDS, Config.EMBED_DEADLINE_SECONDS) * 1000)
+    return genai.Client(api_key=Config.GEMINI_API_KEY, http_options=types.HttpOptions(timeout=timeout_ms))
+
+
+def _make_twilio():
+    from twilio.rest import Client
+    return Client(Config.TWILIO_ACCOUNT_SID, Config.TWILIO_AUTH_TOKEN)
+
+
+def _make_vector_store():
+    from backend.services.vector_store import open_store
+    # sqlite-vec inside patients.db by default; VECTOR_BACKEND=chroma keeps
+    # the old Chroma collection until scripts/migrate_chroma_to_sqlite.py has run.
+    return open_store(Config.VECTOR_BACKEND, Config.EMBEDDING_DIM)
+
+
+gemini = LazySingleton("gemini", _make_gemini)
+twilio = LazySingleton("twilio", _make_twilio)
+vector_store = LazySingleton("vector_store", _make_vector_store)
+
+_ALL = [gemini, twilio, vector_store]
+
+
+def register(singleton):
+    """Include another lazy resource in reset_all() (e.g. the agent graph)."""
+    _ALL.append(singleton)
+    return singleton
+
+
+def get_gemini_client():
+    return gemini.get()
+
+
+def get_twilio_client():
+    return twilio.get()
+
+
+def get_vector_store():
+    return vector_store.get()
+
+
+def set_gemini_client(client):
+    gemini.set(client)
+
+
+def set_twilio_client(client):
+    twilio.set(client)
+
+
+def set_vector_store(store):
+    vector_store.set(store)
+
+
+def reset_all():
+    """Drop every client; used after fork so children never share sockets."""
+    for singleton in _ALL:
+        singleton.reset()
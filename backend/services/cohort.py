@@ -0,0 +1,202 @@
+"""Cohort pain and risk statistics for the hospital dashboard.
+
+A hospital's patients are aligned by days since ``surgery_date`` and
+grouped by ``surgery_type``; each cohort gets percentile bands of daily
+pain per post-op day, the share of patients reporting a high-risk
+message, and the recent patients whose latest pain sits above the 90th
+percentile of their post-op day.
+
+Rollup rows are loaded in one query per call, with SQLite packing each
+surgery type's rows into one comma-separated string that NumPy parses
+straight into an array, so no Python object is built per patient-day.
+Only today's rows still change, so days before today are loaded once per
+day into a per-process cache, pain already sorted by (post-op day, pain),
+and each request reads just today's rows and merges them in: timsort
+merges the two sorted runs in linear time. The cached days are reloaded
+when the date changes, the rollup is rebuilt, or a patient's surgery or
+hospital changes (``ROLLUP_SCOPE``). New patients have no earlier days.
+
+The rollup also holds archived days, so the bands cover patients whose
+conversations were moved to the cold tier.
+"""
+import datetime
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from backend.response_cache import ROLLUP_SCOPE, current_versions
+
+PERCENTILES = (10, 25, 50, 75, 90)
+DEFAULT_DAYS = 60
+MAX_DAYS = 365
+DEFAULT_RECENT_DAYS = 7
+# Post-op days reported by fewer patients get no band and flag no outliers
+MIN_COHORT = 5
+MAX_OUTLIERS = 50
+UNSPECIFIED = "unspecified"
+SETTLED_ENTRIES = 8
+
+# Columns of a cohort's rows: one per patient-day
+PATIENT, DAY, PAIN_SUM, PAIN_COUNT, RISK_HIGH, AGE = range(6)
+# Sort keys are post-op day << PAIN_BITS | pain in hundredths
+PAIN_SCALE = 100
+PAIN_BITS = 11
+
+COHORT_SQL = """
+    SELECT COALESCE(p.surgery_type, ?) AS surgery_type,
+           group_concat(s.patient_id || ',' ||
+                        CAST(julianday(s.day) - julianday(date(p.surgery_date)) AS INTEGER) || ',' ||
+                        s.pain_sum || ',' || s.pain_count || ',' || s.risk_high || ',' ||
+                        CAST(julianday(?) - julianday(s.day) AS INTEGER), ',') AS packed
+    FROM patients p
+    JOIN daily_patient_stats s
+      ON s.patient_id = p.id
+     AND s.day >= max(date(p.surgery_date), ?) AND s.day < ?
+     AND s.day <= date(p.surgery_date, '+' || ? || ' days')
+    WHERE p.hospital_id = ? AND p.surgery_date IS NOT NULL AND (? IS NULL OR p.surgery_type = ?)
+    GROUP BY 1
+"""
+
+
+def load(db, hospital_id, days, today, surgery_type=None, since="", before="9999-12-31"):
+    """{surgery_type: int32 array of rows} for rollup days in ``[since, before)``."""
+    cohorts = {}
+    for row in db.execute(COHORT_SQL, (UNSPECIFIED, today, since, before, days, hospital_id,
+                                       surgery_type, surgery_type)):
+        if row["packed"]:
+            cohorts[row["surgery_type"]] = np.fromstring(
+                row["packed"], dtype=np.int64, sep=",").astype(np.int32).reshape(-1, 6)
+    return cohorts
+
+
+def sort_keys(rows):
+    """Sorted (post-op day, pain) keys of the rows that reported pain."""
+    reported = rows[rows[:, PAIN_COUNT] > 0].astype(np.int64)
+    pain = (reported[:, PAIN_SUM] * PAIN_SCALE + reported[:, PAIN_COUNT] // 2) // reported[:, PAIN_COUNT]
+    return np.sort(reported[:, DAY] << PAIN_BITS | pain)
+
+
+def percentile_bands(keys, days):
+    """Per-day pain percentiles for days ``0..days`` from sorted keys.
+
+    Returns ``(counts, {q: band})``; bands hold NaN on days with fewer than
+    MIN_COHORT values. Uses the same linear interpolation as ``np.percentile``.
+    """
+    edges = np.searchsorted(keys, np.arange(days + 2, dtype=np.int64) << PAIN_BITS)
+    start, counts = edges[:-1], np.diff(edges)
+    valid = counts >= MIN_COHORT
+    if not valid.any():
+        return counts, {q: np.full(days + 1, np.nan) for q in PERCENTILES}
+    # days without enough values read an in-range slot, masked below
+    start = np.where(valid, start, 0)
+    span = np.where(valid, counts - 1, 0)
+    pain = (keys & (1 << PAIN_BITS) - 1) / PAIN_SCALE
+    bands = {}
+    for q in PERCENTILES:
+        pos = span * (q / 100)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, span)
+        band = pain[start + lo] + (pain[start + hi] - pain[start + lo]) * (pos - lo)
+        bands[q] = np.where(valid, band, np.nan)
+    return counts, bands
+
+
+def _latest_per_patient(rows):
+    """The most recent row of each patient (rows need not be sorted)."""
+    ordered = rows[np.lexsort((rows[:, AGE], rows[:, PATIENT]))]
+    _, first = np.unique(ordered[:, PATIENT], return_index=True)
+    return ordered[first]
+
+
+def _round(values):
+    return [None if np.isnan(v) else round(float(v), 2) for v in values]
+
+
+def summarize(rows, keys, days, recent_days=DEFAULT_RECENT_DAYS):
+    """Bands per post-op day and outliers for one cohort's rows and sort keys."""
+    counts, bands = percentile_bands(keys, days)
+
+    patient_days = np.bincount(rows[:, DAY], minlength=days + 1)
+    high_days = np.bincount(rows[:, DAY], weights=rows[:, RISK_HIGH] > 0, minlength=days + 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        high_share = np.where(patient_days >= MIN_COHORT, high_days / patient_days, np.nan)
+
+    recent = rows[rows[:, AGE] <= recent_days]
+    latest = _latest_per_patient(recent[recent[:, PAIN_COUNT] > 0])
+    latest_pain = latest[:, PAIN_SUM] / latest[:, PAIN_COUNT]
+    p50, p90 = bands[50][latest[:, DAY]], bands[90][latest[:, DAY]]
+    flagged = np.flatnonzero(~np.isnan(p90) & (latest_pain > p90))
+    flagged = flagged[np.argsort(p50[flagged] - latest_pain[flagged], kind="stable")][:MAX_OUTLIERS]
+
+    return {
+        "patients": len(np.unique(rows[:, PATIENT])),
+        "recent_patients": len(np.unique(recent[:, PATIENT])),
+        "bands": {
+            "post_op_day": list(range(days + 1)),
+            "reporting": counts.tolist(),
+            **{f"p{q}": _round(bands[q]) for q in PERCENTILES},
+            "high_risk_share": _round(high_share),
+        },
+        "outliers": [{
+            "patient_id": int(latest[i, PATIENT]),
+            "post_op_day": int(latest[i, DAY]),
+            "days_ago": int(latest[i, AGE]),
+            "pain": round(float(latest_pain[i]), 2),
+            "p50": round(float(p50[i]), 2),
+            "p90": round(float(p90[i]), 2),
+            "high_risk": bool(latest[i, RISK_HIGH]),
+        } for i in flagged],
+    }
+
+
+_settled = OrderedDict()
+_settled_lock = threading.Lock()
+
+
+def _settled_days(db, hospital_id, days, today, surgery_type):
+    """{surgery_type: (rows, keys)} for days before today, cached per process."""
+    key = (hospital_id, days, today, surgery_type)
+    versions = current_versions(db, [ROLLUP_SCOPE])
+    with _settled_lock:
+        entry = _settled.get(key)
+        if entry is not None and entry[0] == versions:
+            _settled.move_to_end(key)
+            return entry[1]
+    cohorts = {name: (rows, sort_keys(rows))
+               for name, rows in load(db, hospital_id, days, today, surgery_type, before=today).items()}
+    with _settled_lock:
+        _settled[key] = (versions, cohorts)
+        _settled.move_to_end(key)
+        while len(_settled) > SETTLED_ENTRIES:
+            _settled.popitem(last=False)
+    return cohorts
+
+
+def cohort_stats(db, hospital_id, days=DEFAULT_DAYS, recent_days=DEFAULT_RECENT_DAYS, surgery_type=None):
+    """Percentile bands and outliers for each surgery type at a hospital."""
+    # conversations are stamped in UTC, so the rollup's days are UTC days
+    today = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+    settled = _settled_days(db, hospital_id, days, today, surgery_type)
+    fresh = load(db, hospital_id, days, today, surgery_type, since=today)
+
+    cohorts = []
+    empty = (np.empty((0, 6), dtype=np.int32), np.empty(0, dtype=np.int64))
+    for name in sorted(settled.keys() | fresh.keys()):
+        rows, keys = settled.get(name, empty)
+        if name in fresh:
+            rows = np.concatenate((rows, fresh[name]))
+            # two sorted runs: the stable sort (timsort) merges them in one pass
+            keys = np.sort(np.concatenate((keys, sort_keys(fresh[name]))), kind="stable")
+        cohorts.append({"surgery_type": name, **summarize(rows, keys, days, recent_days)})
+
+    ids = sorted({o["patient_id"] for c in cohorts for o in c["outliers"]})
+    if ids:
+        names = dict(db.execute(
+            "SELECT id, name FROM patients WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(ids),)).fetchall())
+        for c in cohorts:
+            for o in c["outliers"]:
+                o["name"] = names.get(o["patient_id"])
+    return {"hospital_id": hospital_id, "days": days, "recent_days": recent_days, "cohorts": cohorts}
@@ -0,0 +1,178 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+
+from backend.metrics import registry
+
+_WHITESPACE = re.compile(r"\s+")
+
+# last_used is only rewritten when it is this stale, so hot keys don't turn
+# every cache hit into a disk write
+_TOUCH_INTERVAL_SECONDS = 3600
+# rows deleted per eviction statement
+_EVICT_BATCH = 256
+
+lookups = registry.counter(
+    "embedding_cache_lookups_total", "Embedding cache lookups by tier hit, or miss.", ("result",))
+evictions = registry.counter(
+    "embedding_cache_evictions_total", "Embeddings evicted from the SQLite tier.")
+
+# The disk tier's size lives in the file next to the rows, kept in the same
+# transaction by triggers, so every process sharing the file enforces one
+# budget against one total.
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS embeddings (
+        key BLOB PRIMARY KEY,
+        model TEXT NOT NULL,
+        vector BLOB NOT NULL,
+        last_used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used);
+    CREATE TABLE IF NOT EXISTS embeddings_size (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        bytes INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO embeddings_size (id, bytes)
+        SELECT 0, COALESCE(SUM(length(vector)), 0) FROM embeddings;
+    CREATE TRIGGER IF NOT EXISTS embeddings_size_insert AFTER INSERT ON embeddings BEGIN
+        UPDATE embeddings_size SET bytes = bytes + length(new.vector) WHERE id = 0;
+    END;
+    CREATE TRIGGER IF NOT EXISTS embeddings_size_update AFTER UPDATE OF vector ON embeddings BEGIN
+        UPDATE embeddings_size SET bytes = bytes + length(new.vector) - length(old.vector) WHERE id = 0;
+    END;
+    CREATE TRIGGER IF NOT EXISTS embeddings_size_delete AFTER DELETE ON embeddings BEGIN
+        UPDATE embeddings_size SET bytes = bytes - length(old.vector) WHERE id = 0;
+    END;
+"""
+
+
+def normalize_text(text):
+    """Canonical form used for cache keys: NFKC, case-folded, single-spaced."""
+    text = unicodedata.normalize("NFKC", text or "")
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+def cache_key(model, text):
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """Two-tier (in-process LRU + SQLite file) cache of embedding vectors.
+
+    Both tiers are bounded by size in bytes and evict least recently used
+    entries first. Vectors are stored as float32. The lock only covers the
+    in-memory LRU; each thread reads and writes the file on its own
+    connection.
+    """
+
+    def __init__(self, path, memory_bytes, disk_bytes):
+        self.path = path
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _db(self):
+        conn = getattr(self._local, "conn", None)
+        # a connection inherited across fork is not ours to use
+        if conn is None or self._local.pid != os.getpid():
+            dirpath = os.path.dirname(self.path)
+            if dirpath:
+                Path(dirpath).mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(f"BEGIN IMMEDIATE;\n{_SCHEMA}\nCOMMIT;")
+                    self._schema_ready = True
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _remember(self, key, vec):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= old.itemsize * len(old)
+        self._memory[key] = vec
+        self._memory_size += vec.itemsize * len(vec)
+        while self._memory_size > self.memory_bytes and self._memory:
+            _, dropped = self._memory.popitem(last=False)
+            self._memory_size -= dropped.itemsize * len(dropped)
+
+    def get(self, model, text):
+        """Return the cached vector as a list of floats, or None."""
+        key = cache_key(model, text)
+        with self._lock:
+            vec = self._memory.get(key)
+            if vec is not None:
+                self._memory.move_to_end(key)
+        if vec is not None:
+            lookups.inc(result="memory")
+            return vec.tolist()
+        db = self._db()
+        row = db.execute("SELECT vector, last_used FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            lookups.inc(result="miss")
+            return None
+        now = time.time()
+        if now - row[1] > _TOUCH_INTERVAL_SECONDS:
+            db.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (now, key))
+        vec = array("f")
+        vec.frombytes(row[0])
+        with self._lock:
+            self._remember(key, vec)
+        lookups.inc(result="disk")
+        return vec.tolist()
+
+    def put(self, model, text, vector):
+        key = cache_key(model, text)
+        vec = array("f", vector)
+        with self._lock:
+            self._remember(key, vec)
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("""
+                INSERT INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    model = excluded.model, vector = excluded.vector, last_used = excluded.last_used
+            """, (key, model, vec.tobytes(), time.time()))
+            if self._disk_size(db) > self.disk_bytes:
+                self._evict_disk(db)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _disk_size(self, db):
+        return db.execute("SELECT bytes FROM embeddings_size WHERE id = 0").fetchone()[0]
+
+    def _evict_disk(self, db):
+        # trim to 90% of the budget so eviction doesn't run on every insert
+        target = int(self.disk_bytes * 0.9)
+        while self._disk_size(db) > target:
+            deleted = db.execute("""
+                DELETE FROM embeddings WHERE key IN (
+                    SELECT key FROM embeddings ORDER BY last_used LIMIT ?)
+            """, (_EVICT_BATCH,)).rowcount
+            if not deleted:
+                break
+            evictions.inc(deleted)
+
+    def memory_size(self):
+        with self._lock:
+            return self._memory_size
+
+    def disk_size(self):
+        return self._disk_size(self._db())
@@ -0,0 +1,71 @@
+import json
+import threading
+
+# alert.created events carry the alert as the dashboard lists it
+EVENTS_SQL = """
+    SELECT e.id, e.event_type, e.alert_id, a.patient_id, p.name, a.alert_type, a.reason,
+           a.created_at
+    FROM alert_events e
+    LEFT JOIN alerts a ON a.id = e.alert_id
+    LEFT JOIN patients p ON p.id = a.patient_id
+    WHERE e.id > ?
+    ORDER BY e.id
+    LIMIT ?
+"""
+
+
+def format_event(row):
+    """Server-Sent Events frame for one ``alert_events`` row."""
+    if row["event_type"] == "alert.created":
+        data = {
+            "id": row["alert_id"], "patient_id": row["patient_id"], "name": row["name"],
+            "alert_type": row["alert_type"], "reason": row["reason"], "acknowledged": 0,
+            "created_at": row["created_at"],
+        }
+    else:
+        data = {"id": row["alert_id"]}
+    return f"id: {row['id']}\nevent: {row['event_type']}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class AlertFeed:
+    """Alert create/acknowledge events for the dashboards' SSE stream.
+
+    Triggers on ``alerts`` append to the ``alert_events`` table in the
+    transaction that changes the alert, so every worker process sees every
+    event by polling it, and a client resumes from its Last-Event-ID (an
+    ``alert_events`` id) whichever worker it reconnects to.
+
+    Each open stream holds a server thread, so at most ``max_streams`` run
+    per process; ``acquire`` returns False beyond that.
+    """
+
+    def __init__(self, batch=100):
+        self.batch = batch
+        self._streams = 0
+        self._lock = threading.Lock()
+
+    def latest_id(self, db):
+        row = db.execute("SELECT MAX(id) FROM alert_events").fetchone()
+        return row[0] or 0
+
+    def since(self, db, last_id):
+        """Up to ``batch`` events after ``last_id``, oldest first."""
+        return db.execute(EVENTS_SQL, (last_id, self.batch)).fetchall()
+
+    def acquire(self, max_streams):
+        with self._lock:
+            if self._streams >= max_streams:
+                return False
+            self._streams += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._streams -= 1
+
+    def stream_count(self):
+        with self._lock:
+            return self._streams
+
+
+alert_feed = AlertFeed()
@@ -0,0 +1,277 @@
+import json
+import logging
+import threading
+import time
+
+from backend.config import Config
+from backend.database import db_write, get_db
+from backend.metrics import agent_turn, registry
+from backend.response_cache import bump_versions, hospital_scope, patient_scope
+from backend.services.agent import run_agent
+from backend.services.rollup import apply_turn
+from backend.services.triage import get_rules
+from backend.services.whatsapp import send_whatsapp
+from backend.services.writer import writer
+
+logger = logging.getLogger(__name__)
+
+# Rows stuck in 'processing' longer than this belonged to a worker that died
+STALE_PROCESSING_SECONDS = 300
+RETRY_BACKOFF_SECONDS = 5
+WORKER_ERROR_BACKOFF_SECONDS = 1
+# Workers look for stale 'processing' rows every this many polls
+REQUEUE_EVERY_POLLS = 20
+
+coalesced_messages = registry.counter(
+    "inbox_coalesced_messages_total", "Inbound messages merged into another message's turn.")
+
+
+def _insert_turn(db, patient_id, message, response, symptoms_json, pain_level, risk, inbound_ids=(), reply=None,
+                 message_key=None, reply_sent=False):
+    inserted = db.execute("""
+        INSERT INTO conversations
+            (patient_id, patient_message, agent_response, extracted_symptoms, pain_level, risk_level,
+             message_key, reply_sent)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (message_key) DO NOTHING
+        RETURNING created_at
+    """, (patient_id, message, response, symptoms_json, pain_level, risk, message_key, int(reply_sent))).fetchone()
+    if inserted is None:
+        # a concurrent redelivery of the same message recorded it first
+        return
+    created_at = inserted[0]
+    apply_turn(db, patient_id, created_at[:10], pain_level, risk)
+    hospital = db.execute("SELECT hospital_id FROM patients WHERE id = ?", (patient_id,)).fetchone()
+    scopes = [patient_scope(patient_id)]
+    if hospital and hospital[0] is not None:
+        scopes.append(hospital_scope(hospital[0]))
+    bump_versions(db, *scopes)
+    # in the same savepoint: from here on a retry only redelivers the reply,
+    # which is kept on the turn's last message
+    now = time.time()
+    db.executemany("UPDATE inbound_messages SET turn_recorded = 1, reply = ?, updated_at = ? WHERE id = ?",
+                   [(reply if i == inbound_ids[-1] else None, now, i) for i in inbound_ids])
+
+
+def record_turn(patient_id, message, final_state, inbound_ids=(), reply=None, message_key=None):
+    """Queue one agent exchange and its rollup update for the next group commit.
+
+    ``inbound_ids`` are the queued messages the turn answers; they are
+    marked as recorded, with the ``reply`` still to deliver, in the same
+    write. A ``message_key`` is stored on the conversation row, at most
+    once. Returns the writer's Future.
+    """
+    return writer.submit(
+        _insert_turn, patient_id, message, final_state['response'],
+        json.dumps({"symptoms": final_state['symptoms'], "pain_level": final_state['pain_level']}),
+        final_state['pain_level'], final_state['risk'], tuple(inbound_ids), reply,
+        message_key, bool(final_state.get('reply_sent')),
+    )
+
+
+def handle_turn(patient_id, message, phone=None, message_key=None):
+    """Run the agent for one message and persist the exchange.
+
+    Returns the reply still to be delivered, or None when the agent already
+    sent it (red-flag fast path). A ``message_key`` whose turn is already
+    recorded (a redelivered webhook) returns that turn's reply without
+    running the agent again.
+    """
+    if message_key:
+        done = get_db().execute("SELECT agent_response, reply_sent FROM conversations WHERE message_key = ?",
+                                (message_key,)).fetchone()
+        if done is not None:
+            return None if done['reply_sent'] else done['agent_response']
+    with agent_turn(patient_id, Config.SLOW_TURN_SECONDS):
+        final_state = run_agent(patient_id, message, phone=phone, message_key=message_key)
+        # wait for the commit so a write error surfaces and the next read sees the turn
+        record_turn(patient_id, message, final_state, message_key=message_key).result()
+    return None if final_state.get('reply_sent') else final_state['response']
+
+
+def enqueue(patient_id, phone, body, message_sid=None):
+    """Durably queue an inbound message. Returns False for a duplicate Twilio retry."""
+    now = time.time()
+    urgent = get_rules().match(body or "") is not None
+    with db_write() as db:
+        cur = db.execute("""
+            INSERT OR IGNORE INTO inbound_messages
+                (message_sid, patient_id, phone, body, urgent, received_at, available_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (message_sid, patient_id, phone, body, int(urgent), now, now, now))
+    if cur.rowcount:
+        _wakeup.set()
+    return bool(cur.rowcount)
+
+
+def _claim():
+    """Atomically move one patient's due messages to 'processing'.
+
+    A patient is claimable once their latest message is older than the
+    coalescing window (or any message is a red flag) and none of their
+    messages is already being processed, so a burst becomes one turn and
+    two workers never run the same patient at once, in any process.
+    """
+    now = time.time()
+    with db_write() as db:
+        rows = db.execute("""
+            UPDATE inbound_messages
+            SET status = 'processing', attempts = attempts + 1, updated_at = :now
+            WHERE status = 'pending' AND available_at <= :now AND patient_id = (
+                SELECT p.patient_id FROM inbound_messages p
+                WHERE p.status = 'pending' AND p.available_at <= :now
+                  AND NOT EXISTS (
+                      SELECT 1 FROM inbound_messages q
+                      WHERE q.patient_id = p.patient_id AND q.status = 'processing')
+                GROUP BY p.patient_id
+                HAVING MAX(p.received_at) <= :quiet_before OR MAX(p.urgent) = 1
+                ORDER BY MIN(p.available_at) LIMIT 1
+            )
+            RETURNING id, patient_id, phone, body, attempts, turn_recorded, reply, turn_key
+        """, {"now": now, "quiet_before": now - Config.COALESCE_WINDOW_SECONDS}).fetchall()
+        return _fix_turn(db, sorted((dict(r) for r in rows), key=lambda r: r['id']), now)
+
+
+def _fix_turn(db, rows, now):
+    """Settle which claimed messages the turn answers, and its key.
+
+    The first claim stores ``turn_key`` on the messages it coalesces. A
+    retry answers exactly those messages under that key, so alerts and
+    urgent replies deduped on it are not repeated; messages that arrived
+    in between go back to 'pending' for the next turn.
+    """
+    fresh = [r for r in rows if not r['turn_recorded']]
+    keyed = [r for r in fresh if r['turn_key']]
+    if keyed:
+        key = keyed[0]['turn_key']
+        later = [r['id'] for r in fresh if r['turn_key'] != key]
+        db.executemany("""
+            UPDATE inbound_messages SET status = 'pending', attempts = attempts - 1, updated_at = ?
+            WHERE id = ?
+        """, [(now, i) for i in later])
+        return [r for r in rows if r['turn_recorded'] or r['turn_key'] == key]
+    if fresh:
+        key = "inbound:" + ",".join(str(r['id']) for r in fresh)
+        db.executemany("UPDATE inbound_messages SET turn_key = ? WHERE id = ?", [(key, r['id']) for r in fresh])
+        for r in fresh:
+            r['turn_key'] = key
+    return rows
+
+
+def _requeue_stale():
+    now = time.time()
+    with db_write() as db:
+        db.execute("""
+            UPDATE inbound_messages SET status = 'pending', available_at = ?, updated_at = ?
+            WHERE status = 'processing' AND updated_at < ?
+        """, (now, now, now - STALE_PROCESSING_SECONDS))
+
+
+def _process(rows):
+    """Answer a patient's claimed messages as one agent turn.
+
+    The turn is committed, with its reply, before the reply is sent. Messages
+    whose turn was already recorded by an earlier attempt only get that
+    reply redelivered, so a failed send never reruns the agent (and never
+    duplicates the conversation row, alerts or history).
+    """
+    first = rows[0]
+    ids = [r['id'] for r in rows]
+    replies = [r['reply'] for r in rows if r['turn_recorded'] and r['reply']]
+    fresh = [r for r in rows if not r['turn_recorded']]
+    try:
+        if fresh:
+            message = "\n".join(r['body'] or "" for r in fresh)
+            if len(fresh) > 1:
+                coalesced_messages.inc(len(fresh) - 1)
+            with agent_turn(first['patient_id'], Config.SLOW_TURN_SECONDS):
+                final_state = run_agent(first['patient_id'], message, phone=first['phone'],
+                                        message_key=fresh[0]['turn_key'])
+                reply = None if final_state.get('reply_sent') else final_state['response']
+                record_turn(first['patient_id'], message, final_state,
+                            [r['id'] for r in fresh], reply).result()
+            if reply:
+                replies.append(reply)
+        for reply in replies:
+            send_whatsapp(first['phone'], reply)
+    except Exception as exc:
+        _retry(rows, exc)
+        return
+    writer.submit(_mark_done, ids).result()
+
+
+def _retry(rows, exc):
+    ids = [r['id'] for r in rows]
+    attempts = max(r['attempts'] for r in rows)
+    logger.error("Inbound messages %s failed (attempt %s)", ids, attempts, exc_info=exc)
+    failed = attempts >= Config.INBOX_MAX_ATTEMPTS
+    now = time.time()
+    with db_write() as db:
+        db.executemany("""
+            UPDATE inbound_messages SET status = ?, last_error = ?, available_at = ?, updated_at = ?
+            WHERE id = ?
+        """, [('failed' if failed else 'pending', str(exc)[:500],
+               now + RETRY_BACKOFF_SECONDS * attempts, now, i) for i in ids])
+
+
+def _mark_done(db, ids):
+    db.executemany("UPDATE inbound_messages SET status = 'done', reply = NULL, updated_at = ? WHERE id = ?",
+                   [(time.time(), i) for i in ids])
+
+
+# --------------------------------------------------------------
+# Worker pool
+# --------------------------------------------------------------
+_wakeup = threading.Event()
+_stop = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def _worker_loop():
+    next_requeue = time.monotonic()
+    while not _stop.is_set():
+        try:
+            if time.monotonic() >= next_requeue:
+                # a patient with a stale 'processing' row could never be
+                # claimed again; don't wait for a restart to free them
+                _requeue_stale()
+                next_requeue = time.monotonic() + Config.INBOX_POLL_SECONDS * REQUEUE_EVERY_POLLS
+            rows = _claim()
+            if rows:
+                _process(rows)
+                continue
+        except Exception:
+            # e.g. "database is locked"; rows left in 'processing' are
+            # requeued once stale
+            logger.exception("Inbox worker iteration failed")
+            _stop.wait(WORKER_ERROR_BACKOFF_SECONDS)
+            continue
+        # Enqueues from this process wake us at once; other processes
+        # are picked up on the next poll.
+        _wakeup.wait(Config.INBOX_POLL_SECONDS)
+        _wakeup.clear()
+
+
+def start_workers(count=None):
+    """Start the bounded pool of inbox workers (idempotent)."""
+    with _workers_lock:
+        if any(t.is_alive() for t in _workers):
+            return
+        # threads listed here but dead were inherited across fork()
+        _workers.clear()
+        _stop.clear()
+        for i in range(count or Config.INBOX_WORKERS):
+            t = threading.Thread(target=_worker_loop, name=f"inbox-worker-{i}", daemon=True)
+            t.start()
+            _workers.append(t)
+
+
+def stop_workers(timeout=None):
+    """Signal the workers to exit after their current message and wait for them."""
+    with _workers_lock:
+        _stop.set()
+        _wakeup.set()
+        for t in _workers:
+            t.join(timeout)
+        _workers.clear()
@@ -0,0 +1,237 @@
+"""Deadlines, hedging, retries and a circuit breaker around Gemini calls.
+
+``generate`` and ``embed`` run the client call on a worker pool and wait
+at most until the call's deadline. If the first request is still out
+after the operation's recent p95 latency, an identical second request is
+sent and whichever answers first wins. Each operation (call site) keeps
+its own latency window, and is not hedged until it has enough samples.
+Retryable failures (429, 5xx, transport errors) are retried with jittered
+exponential backoff while the deadline allows. Calls that still fail count towards a circuit breaker;
+once it opens, calls fail immediately with ``LLMUnavailable`` until a
+probe succeeds, so callers can fall back to static replies instead of
+holding a worker.
+
+Abandoned requests keep running on the pool until the client's own HTTP
+timeout (set to the deadline in services/clients.py) ends them.
+"""
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from backend.config import Config
+from backend.metrics import count_tokens, external_call, registry
+from backend.services.clients import LazySingleton, get_gemini_client, register
+
+LATENCY_WINDOW = 200
+# An operation is not hedged until its window holds this many samples
+MIN_LATENCY_SAMPLES = 20
+MAX_BACKOFF_SECONDS = 4
+
+hedges = registry.counter(
+    "llm_hedges_total", "Hedged second requests, fired and won.", ("operation", "outcome"))
+retries = registry.counter(
+    "llm_retries_total", "Retries after retryable Gemini errors.", ("operation",))
+deadlines = registry.counter(
+    "llm_deadline_exceeded_total", "Gemini calls abandoned at their deadline.", ("operation",))
+short_circuits = registry.counter(
+    "llm_short_circuits_total", "Gemini calls refused while the breaker was open.", ("operation",))
+breaker_transitions = registry.counter(
+    "llm_breaker_transitions_total", "Circuit breaker state changes.", ("state",))
+fallbacks = registry.counter(
+    "llm_fallbacks_total", "Agent steps answered without the LLM.", ("stage",))
+
+
+class LLMUnavailable(Exception):
+    """Gemini did not answer in time, kept failing, or the breaker is open."""
+
+
+class _DeadlineExceeded(Exception):
+    pass
+
+
+def _retryable(exc):
+    code = getattr(exc, "code", None)
+    if not isinstance(code, int):
+        code = getattr(exc, "status_code", None)
+    if isinstance(code, int):
+        return code == 429 or code >= 500
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    try:
+        import httpx
+    except ImportError:
+        return False
+    return isinstance(exc, httpx.TransportError)
+
+
+class CircuitBreaker:
+    """Opens after ``failures`` consecutive failed calls; half-opens after ``reset_seconds``.
+
+    While half-open a single probe call is let through; its outcome closes
+    or re-opens the breaker.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, failures, reset_seconds):
+        self.threshold = failures
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _move(self, state):
+        if state != self.state:
+            self.state = state
+            breaker_transitions.inc(state=state)
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._move(self.HALF_OPEN)
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self._move(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+                self._move(self.OPEN)
+
+    def level(self):
+        return {self.CLOSED: 0, self.HALF_OPEN: 1, self.OPEN: 2}[self.state]
+
+
+class LatencyWindow:
+    """Recent successful call latencies of one operation; ``hedge_delay`` is their p95."""
+
+    def __init__(self, size=LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def hedge_delay(self):
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            # no p95 to go by yet: a guessed delay would duplicate slow operations
+            return None
+        return max(Config.LLM_HEDGE_MIN_SECONDS, samples[int(len(samples) * 0.95) - 1])
+
+
+class ResilientCaller:
+    def __init__(self, breaker, max_attempts, hedge, workers):
+        self.breaker = breaker
+        self.max_attempts = max_attempts
+        self.hedge = hedge
+        self._latency = {}
+        # built on first use so a forked worker never inherits pool threads
+        self._pool = register(LazySingleton("llm_pool", lambda: ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="llm")))
+
+    def latency(self, operation):
+        return self._latency.setdefault(operation, LatencyWindow())
+
+    def call(self, operation, fn, deadline_seconds):
+        """Run ``fn()`` under the deadline, hedging and retrying; raises LLMUnavailable."""
+        if not self.breaker.allow():
+            short_circuits.inc(operation=operation)
+            raise LLMUnavailable(f"{operation}: circuit open")
+        deadline = time.monotonic() + deadline_seconds
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = self._hedged(operation, fn, deadline)
+            except _DeadlineExceeded:
+                deadlines.inc(operation=operation)
+                self.breaker.record_failure()
+                raise LLMUnavailable(f"{operation}: no answer within {deadline_seconds:g}s")
+            except Exception as exc:
+                if not _retryable(exc):
+                    # the upstream answered; the request itself is wrong
+                    self.breaker.record_success()
+                    raise
+                delay = random.uniform(0, min(MAX_BACKOFF_SECONDS, 0.25 * 2 ** attempt))
+                if attempt >= self.max_attempts or time.monotonic() + delay >= deadline:
+                    self.breaker.record_failure()
+                    raise LLMUnavailable(f"{operation} failed after {attempt} attempts: {exc}") from exc
+                retries.inc(operation=operation)
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def _hedged(self, operation, fn, deadline):
+        pool = self._pool.get()
+        window = self.latency(operation)
+        delay = window.hedge_delay()
+        start = time.monotonic()
+        hedge_at = start + (delay or 0)
+        primary = pool.submit(contextvars.copy_context().run, fn)
+        pending = {primary}
+        hedged = not self.hedge or delay is None
+        error = None
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                raise _DeadlineExceeded()
+            until = deadline if hedged else min(deadline, hedge_at)
+            done, pending = wait(pending, timeout=max(until - now, 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    window.observe(time.monotonic() - start)
+                    if future is not primary:
+                        hedges.inc(operation=operation, outcome="won")
+                    return future.result()
+                error = error or future.exception()
+            if pending and not hedged and time.monotonic() >= hedge_at:
+                hedged = True
+                hedges.inc(operation=operation, outcome="fired")
+                pending.add(pool.submit(contextvars.copy_context().run, fn))
+        raise error
+
+
+breaker = CircuitBreaker(Config.LLM_BREAKER_FAILURES, Config.LLM_BREAKER_RESET_SECONDS)
+caller = ResilientCaller(breaker, Config.LLM_MAX_ATTEMPTS, Config.LLM_HEDGE, Config.LLM_WORKERS)
+
+registry.gauge("llm_breaker_state", "Gemini circuit breaker: 0 closed, 1 half-open, 2 open.", fn=breaker.level)
+
+
+def generate(operation="generate", deadline=None, **kwargs):
+    """``models.generate_content(**kwargs)`` with deadline, hedging, retries and breaker."""
+    with external_call("gemini", operation):
+        response = caller.call(
+            operation, lambda: get_gemini_client().models.generate_content(**kwargs),
+            deadline or Config.LLM_DEADLINE_SECONDS)
+    count_tokens(response)
+    return response
+
+
+def embed(deadline=None, **kwargs):
+    """``models.embed_content(**kwargs)`` with deadline, hedging, retries and breaker."""
+    with external_call("gemini", "embed"):
+        return caller.call(
+            "embed", lambda: get_gemini_client().models.embed_content(**kwargs),
+            deadline or Config.EMBED_DEADLINE_SECONDS)
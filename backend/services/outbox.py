@@ -0,0 +1,274 @@
+"""Scheduled check-ins and the rate-limited outbound WhatsApp queue.
+
+``schedule_checkins`` picks the patients whose ``next_checkin_at`` has
+passed, queues a personalised message for each in ``outbound_messages``
+and moves their next check-in forward according to how far they are from
+surgery. ``drain`` delivers the queue with a pool of senders through
+the Twilio REST API on pooled HTTP connections, under a token bucket
+matching the account's send rate, retrying throttling and server errors
+with exponential backoff.
+"""
+import datetime
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from backend.config import Config
+from backend.database import db_write, pool
+from backend.metrics import external_call, registry
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_BATCH = 500
+MAX_BACKOFF_SECONDS = 600
+# Rows stuck in 'sending' longer than this belonged to a sender that died
+STALE_SENDING_SECONDS = 300
+
+# (last post-op day, days between check-ins, message). After the last row
+# the patient gets no more check-ins.
+CHECKIN_SCHEDULE = [
+    (7, 1, "Hi {name}, it's day {day} after your {surgery}. How are you feeling today? "
+           "Please rate your pain from 0 to 10 and tell us about any swelling, redness or fever."),
+    (30, 2, "Hi {name}, checking in on day {day} of your recovery. How is your pain (0-10) "
+            "and how are you getting around?"),
+    (90, 7, "Hi {name}, it's been {day} days since your {surgery}. How are you feeling this week? "
+            "Reply with anything that's bothering you."),
+]
+
+outbound_total = registry.counter(
+    "outbound_messages_total", "Outbound messages by final delivery outcome.", ("status",))
+checkins_scheduled = registry.counter(
+    "checkins_scheduled_total", "Check-in messages queued by the scheduler.")
+
+
+def checkin_plan(day):
+    """(interval_days, template) for a post-op day, or None when check-ins are over."""
+    for last_day, interval, template in CHECKIN_SCHEDULE:
+        if day <= last_day:
+            return interval, template
+    return None
+
+
+def _next_slot(today, interval):
+    slot = datetime.datetime.combine(today + datetime.timedelta(days=interval),
+                                     datetime.time(Config.CHECKIN_HOUR_UTC))
+    return slot.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _checkin_row(patient, today, now):
+    start = patient["surgery_date"] or patient["created_at"]
+    try:
+        day = (today - datetime.date.fromisoformat(start[:10])).days
+    except (TypeError, ValueError):
+        day = 0
+    plan = checkin_plan(max(day, 0))
+    if plan is None:
+        return None, None
+    interval, template = plan
+    name = (patient["name"] or "there").split()[0]
+    body = template.format(name=name, day=max(day, 0), surgery=patient["surgery_type"] or "surgery")
+    message = (f"checkin:{patient['id']}:{today.isoformat()}", patient["id"], patient["phone"], body, now, now)
+    return message, _next_slot(today, interval)
+
+
+def schedule_checkins(now=None):
+    """Queue check-ins for every due patient. Returns the number of messages queued."""
+    now_dt = now or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    now_text = now_dt.strftime("%Y-%m-%d %H:%M:%S")
+    today = now_dt.date()
+    queued = 0
+    while True:
+        with db_write() as db:
+            due = db.execute("""
+                SELECT id, phone, name, surgery_date, surgery_type, created_at FROM patients
+                WHERE is_active = 1 AND next_checkin_at <= ?
+                ORDER BY next_checkin_at LIMIT ?
+            """, (now_text, SCHEDULE_BATCH)).fetchall()
+            if not due:
+                break
+            messages, moves = [], []
+            for patient in due:
+                message, next_at = _checkin_row(patient, today, time.time())
+                if message:
+                    messages.append(message)
+                moves.append((next_at, patient["id"]))
+            # the dedupe key makes a re-run on the same day a no-op
+            cur = db.executemany("""
+                INSERT OR IGNORE INTO outbound_messages
+                    (dedupe_key, patient_id, phone, body, kind, created_at, available_at)
+                VALUES (?, ?, ?, ?, 'checkin', ?, ?)
+            """, messages)
+            queued += max(cur.rowcount, 0)
+            db.executemany("UPDATE patients SET next_checkin_at = ? WHERE id = ?", moves)
+    checkins_scheduled.inc(queued)
+    return queued
+
+
+class TokenBucket:
+    """Blocking token bucket: ``rate`` tokens per second, up to ``burst`` saved up."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(1, int(burst))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class SendError(Exception):
+    def __init__(self, message, retryable, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class TwilioSender:
+    """Messages API client on one pooled ``requests.Session`` shared by all senders."""
+
+    def __init__(self, account_sid, auth_token, from_number, api_base, pool_size):
+        self.url = f"{api_base.rstrip('/')}/2010-04-01/Accounts/{account_sid}/Messages.json"
+        self.from_ = f"whatsapp:{from_number}"
+        self.session = requests.Session()
+        self.session.auth = (account_sid or "", auth_token or "")
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def send(self, to_number, body):
+        data = {"From": self.from_, "To": f"whatsapp:{to_number}", "Body": body}
+        if Config.TWILIO_STATUS_CALLBACK_URL:
+            data["StatusCallback"] = Config.TWILIO_STATUS_CALLBACK_URL
+        try:
+            with external_call("twilio", "send"):
+                resp = self.session.post(self.url, data=data, timeout=(5, 30))
+        except requests.RequestException as exc:
+            raise SendError(f"network error: {exc}", retryable=True)
+        if resp.status_code == 429 or resp.status_code >= 500:
+            retry_after = resp.headers.get("Retry-After")
+            raise SendError(f"HTTP {resp.status_code}", retryable=True,
+                            retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None)
+        if resp.status_code >= 400:
+            try:
+                detail = resp.json().get("message", resp.text)
+            except ValueError:
+                detail = resp.text
+            raise SendError(f"HTTP {resp.status_code}: {detail}"[:500], retryable=False)
+        payload = resp.json()
+        return payload.get("sid"), payload.get("status")
+
+
+def _claim(limit):
+    now = time.time()
+    with db_write() as db:
+        return db.execute("""
+            UPDATE outbound_messages
+            SET status = 'sending', attempts = attempts + 1, updated_at = ?
+            WHERE id IN (
+                SELECT id FROM outbound_messages
+                WHERE status = 'pending' AND available_at <= ?
+                ORDER BY available_at, id LIMIT ?
+            )
+            RETURNING id, phone, body, attempts
+        """, (now, now, limit)).fetchall()
+
+
+def _requeue_stale():
+    now = time.time()
+    with db_write() as db:
+        db.execute("""
+            UPDATE outbound_messages SET status = 'pending', available_at = ?, updated_at = ?
+            WHERE status = 'sending' AND updated_at < ?
+        """, (now, now, now - STALE_SENDING_SECONDS))
+
+
+def _backoff(attempts, retry_after=None):
+    delay = min(MAX_BACKOFF_SECONDS, Config.OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1))
+    delay = random.uniform(delay / 2, delay)  # jitter so retries don't arrive in waves
+    return max(delay, retry_after or 0)
+
+
+def _deliver(sender, bucket, row):
+    bucket.acquire()
+    now = time.time()
+    try:
+        sid, provider_status = sender.send(row["phone"], row["body"])
+    except SendError as exc:
+        failed = not exc.retryable or row["attempts"] >= Config.OUTBOX_MAX_ATTEMPTS
+        if failed:
+            logger.warning("Outbound message %s failed: %s", row["id"], exc)
+            outbound_total.inc(status="failed")
+        with db_write() as db:
+            db.execute("""
+                UPDATE outbound_messages SET status = ?, last_error = ?, available_at = ?, updated_at = ?
+                WHERE id = ?
+            """, ("failed" if failed else "pending", str(exc)[:500],
+                  now + _backoff(row["attempts"], exc.retry_after), now, row["id"]))
+        return False
+    with db_write() as db:
+        db.execute("""
+            UPDATE outbound_messages SET status = 'sent', provider_sid = ?, provider_status = ?, updated_at = ?
+            WHERE id = ?
+        """, (sid, provider_status, time.time(), row["id"]))
+    outbound_total.inc(status="sent")
+    return True
+
+
+def record_status(provider_sid, provider_status):
+    """Store a Twilio status callback (queued, sent, delivered, read, failed, ...)."""
+    with db_write() as db:
+        return db.execute(
+            "UPDATE outbound_messages SET provider_status = ?, updated_at = ? WHERE provider_sid = ?",
+            (provider_status, time.time(), provider_sid),
+        ).rowcount
+
+
+def make_sender(pool_size=None):
+    return TwilioSender(Config.TWILIO_ACCOUNT_SID, Config.TWILIO_AUTH_TOKEN, Config.TWILIO_WHATSAPP_NUMBER,
+                        Config.TWILIO_API_BASE, pool_size or Config.OUTBOX_SENDERS)
+
+
+def make_bucket():
+    return TokenBucket(Config.TWILIO_RATE_PER_SECOND, Config.TWILIO_RATE_BURST)
+
+
+def drain(senders=None, sender=None, bucket=None):
+    """Send everything due now with a pool of concurrent senders. Returns (sent, not_sent)."""
+    senders = senders or Config.OUTBOX_SENDERS
+    sender = sender or make_sender(senders)
+    bucket = bucket or make_bucket()
+    _requeue_stale()
+    sent = not_sent = 0
+    with ThreadPoolExecutor(max_workers=senders, thread_name_prefix="outbox") as executor:
+        while True:
+            rows = _claim(senders * 4)
+            if not rows:
+                break
+            for ok in executor.map(lambda row: _deliver(sender, bucket, row), rows):
+                if ok:
+                    sent += 1
+                else:
+                    not_sent += 1
+    return sent, not_sent
+
+
+def pending_count():
+    return pool.connection().execute(
+        "SELECT COUNT(*) FROM outbound_messages WHERE status IN ('pending', 'sending')").fetchone()[0]
+
@@ -0,0 +1,219 @@
+"""Prompt context assembly under a fixed token budget.
+
+Every agent prompt gets the same shape of context: a rolling summary of
+the patient's older turns, the turns since that summary (newest first,
+as many as fit), and the retrieved records that are not near-duplicates
+of each other or of that history, in retrieval order with the last one
+truncated to fit. Token counts are estimated at ~4 characters per token,
+which is close enough for budgeting and costs no API call. Prompt size
+therefore stays flat however long a patient's history grows.
+
+The summary is kept in ``patient_summaries`` and recomputed in the
+background once SUMMARY_EVERY_TURNS turns have aged out of the recent
+window: one extra LLM call per N turns, never on the reply's path.
+"""
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.config import Config
+from backend.database import db_write, pool
+from backend.metrics import registry
+from backend.services import llm
+from backend.services.clients import LazySingleton, register
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_MODEL = "models/gemini-2.5-flash"
+SUMMARY_WORDS = 120
+CHARS_PER_TOKEN = 4
+# Word-trigram Jaccard similarity above which two chunks count as the same
+NEAR_DUPLICATE = 0.8
+# A record cut shorter than this is dropped rather than truncated
+MIN_TRUNCATED_TOKENS = 24
+FOLD_TURN_TOKENS = 200
+
+context_tokens = registry.histogram(
+    "prompt_context_tokens", "Estimated tokens of assembled prompt context.", ("section",),
+    buckets=(25, 50, 100, 200, 400, 800, 1600, 3200))
+summary_refreshes = registry.counter(
+    "patient_summary_refreshes_total", "Background summary refreshes by outcome.", ("outcome",))
+
+_WORD = re.compile(r"\w+")
+
+
+def estimate_tokens(text):
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def truncate(text, tokens):
+    """Cut ``text`` to about ``tokens`` tokens, at a word boundary when possible."""
+    limit = max(tokens, 1) * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit - 1]
+    space = cut.rfind(" ")
+    if space > limit // 2:
+        cut = cut[:space]
+    return cut.rstrip() + "…"
+
+
+def _shingles(text):
+    words = _WORD.findall(text.lower())
+    return set(zip(words, words[1:], words[2:])) or set(words)
+
+
+def dedupe(chunks, seen=()):
+    """Drop empty, repeated and near-identical chunks, keeping the first of each.
+
+    A chunk is also dropped when it duplicates or is contained in one of
+    ``seen`` (text already in the prompt).
+    """
+    kept = []
+    signatures = [sig for sig in map(_shingles, seen) if sig]
+    for chunk in chunks:
+        chunk = (chunk or "").strip()
+        sig = _shingles(chunk)
+        if not sig:
+            continue
+        if any(sig <= other or len(sig & other) / len(sig | other) >= NEAR_DUPLICATE for other in signatures):
+            continue
+        kept.append(chunk)
+        signatures.append(sig)
+    return kept
+
+
+def _exchange(turn, tokens=None):
+    text = f"User: {turn['user']}\nAssistant: {turn['assistant']}"
+    return truncate(text, tokens) if tokens else text
+
+
+def load_summary(patient_id):
+    """(summary, through_turn) for a patient, or (None, 0)."""
+    row = pool.connection().execute(
+        "SELECT summary, through_turn FROM patient_summaries WHERE patient_id = ?", (patient_id,)).fetchone()
+    return (row["summary"], row["through_turn"]) if row else (None, 0)
+
+
+def assemble(patient_id, message, turns, records, turn_count, budget=None):
+    """Fit history and retrieved records into the budget.
+
+    ``turns`` is the checkpointed history, oldest first, each entry
+    numbered by ``turn``; ``turn_count`` is the number of completed turns.
+    Half the budget goes to history (summary first, then the newest
+    unsummarised turns), the rest and anything history left over to
+    records. Returns ``(history_text, records)``.
+    """
+    budget = budget or Config.PROMPT_TOKEN_BUDGET
+    history_budget = budget // 2
+    summary, through = load_summary(patient_id)
+    reset = through > turn_count
+    if reset:
+        # the agent thread was started over; its turn numbers begin again
+        summary, through = None, 0
+    if turn_count - Config.PROMPT_RECENT_TURNS - through >= Config.SUMMARY_EVERY_TURNS:
+        schedule_refresh(patient_id, summary, through, turns, turn_count - Config.PROMPT_RECENT_TURNS, reset)
+
+    used = 0
+    lines = []
+    if summary:
+        summary = truncate(summary, history_budget // 2)
+        used = estimate_tokens(summary)
+    recent = []
+    for turn in reversed([t for t in turns if t.get("turn", 0) > through]):
+        text = _exchange(turn)
+        cost = estimate_tokens(text)
+        if used + cost > history_budget:
+            if not recent and history_budget - used >= MIN_TRUNCATED_TOKENS:
+                # the latest exchange always goes in, cut if need be
+                recent.append((turn, _exchange(turn, history_budget - used)))
+                used = history_budget
+            break
+        recent.append((turn, text))
+        used += cost
+    if summary:
+        lines.append(f"Summary of earlier conversation: {summary}")
+    lines.extend(text for _, text in reversed(recent))
+    history = "\n".join(lines)
+    context_tokens.observe(used, section="history")
+
+    left = budget - used
+    fitted = []
+    for record in dedupe(records, seen=[message] + [turn["user"] for turn, _ in recent]):
+        cost = estimate_tokens(record)
+        if cost <= left:
+            fitted.append(record)
+            left -= cost
+            continue
+        if left >= MIN_TRUNCATED_TOKENS:
+            fitted.append(truncate(record, left))
+            left = 0
+        break
+    context_tokens.observe(sum(estimate_tokens(r) for r in fitted), section="records")
+    return history, fitted
+
+
+# One background thread per process; built lazily so it is never
+# inherited across a fork.
+_executor = register(LazySingleton("summary_executor", lambda: ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="summary")))
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def schedule_refresh(patient_id, summary, through, turns, upto, reset=False):
+    """Fold turns ``through < turn <= upto`` into the summary in the background."""
+    fold = [dict(t) for t in turns if through < t.get("turn", 0) <= upto]
+    if not fold:
+        return False
+    with _in_flight_lock:
+        if patient_id in _in_flight:
+            return False
+        _in_flight.add(patient_id)
+    try:
+        _executor.get().submit(_refresh, patient_id, summary, fold, upto, reset)
+    except RuntimeError:
+        # executor shut down at exit
+        with _in_flight_lock:
+            _in_flight.discard(patient_id)
+        return False
+    return True
+
+
+def summarize(previous, turns):
+    exchanges = "\n".join(_exchange(t, FOLD_TURN_TOKENS) for t in turns)
+    prompt = f"""
+Summarize this post-surgery follow-up conversation for the care assistant in at most {SUMMARY_WORDS} words:
+symptoms and how they changed, pain levels, concerns raised and advice given. Plain text, no preamble.
+
+Summary so far: {previous or "(none)"}
+
+Newer exchanges:
+{exchanges}
+"""
+    response = llm.generate(operation="summarize", model=SUMMARY_MODEL, contents=prompt)
+    return truncate(response.text.strip(), SUMMARY_WORDS * 2)
+
+
+def _refresh(patient_id, previous, fold, upto, reset):
+    try:
+        summary = summarize(previous, fold)
+        with db_write() as db:
+            # a slower refresh never overwrites a newer one, short of a reset
+            db.execute("""
+                INSERT INTO patient_summaries (patient_id, summary, through_turn, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (patient_id) DO UPDATE SET
+                    summary = excluded.summary, through_turn = excluded.through_turn,
+                    updated_at = excluded.updated_at
+                WHERE ? OR excluded.through_turn > patient_summaries.through_turn
+            """, (patient_id, summary, upto, time.time(), reset))
+        summary_refreshes.inc(outcome="ok")
+    except Exception:
+        logger.exception("Summary refresh for patient %s failed", patient_id)
+        summary_refreshes.inc(outcome="error")
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard(patient_id)
@@ -1,43 +1,71 @@
-import chromadb
-from google import genai
-import os
-import uuid
+import logging
 
-CHROMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'chroma_db')
-client = chromadb.PersistentClient(path=CHROMA_PATH)
-collection = client.get_or_create_collection(name="patient_records")
+from backend.config import Config
+from backend.metrics import external_call, registry
+from backend.services import llm
+from backend.services.clients import get_vector_store
+from backend.services.embedding_cache import EmbeddingCache
 
-gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+logger = logging.getLogger(__name__)
 
-# C:\Users\karth\OneDrive\Desktop\KLH\patient-agent\backend\services\rag.py
+# Gemini accepts at most 100 texts per embed request
+EMBED_BATCH = 100
+
+# Patients repeat the same short replies, so most query texts have been
+# embedded before; the cache saves the round trip and the quota.
+embedding_cache = EmbeddingCache(
+    Config.EMBED_CACHE_PATH,
+    memory_bytes=Config.EMBED_CACHE_MEMORY_MB * 1024 * 1024,
+    disk_bytes=Config.EMBED_CACHE_DISK_MB * 1024 * 1024,
+)
+registry.gauge("embedding_cache_memory_bytes", "Vectors held in this process's LRU.",
+               fn=embedding_cache.memory_size)
+registry.gauge("embedding_cache_disk_bytes", "Vectors stored in the SQLite tier.",
+               fn=embedding_cache.disk_size)
 
 def embed_text(query_text):
-    # Change 'text-embedding-004' to 'gemini-embedding-001'
-    result = gemini_client.models.embed_content(
-        model="gemini-embedding-001", 
+    cached = embedding_cache.get(Config.EMBED_MODEL, query_text)
+    if cached is not None:
+        return cached
+    result = llm.embed(
+        model=Config.EMBED_MODEL,
         contents=query_text
     )
-    return result.embeddings[0].values
+    vector = result.embeddings[0].values
+    embedding_cache.put(Config.EMBED_MODEL, query_text, vector)
+    return vector
+
+def embed_texts(texts):
+    """Embeddings for many texts: cached ones first, the rest EMBED_BATCH per request."""
+    vectors = [embedding_cache.get(Config.EMBED_MODEL, text) for text in texts]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    for start in range(0, len(missing), EMBED_BATCH):
+        batch = missing[start:start + EMBED_BATCH]
+        result = llm.embed(
+            deadline=Config.LLM_DEADLINE_SECONDS,
+            model=Config.EMBED_MODEL,
+            contents=[texts[i] for i in batch]
+        )
+        for i, embedding in zip(batch, result.embeddings):
+            vectors[i] = embedding.values
+            embedding_cache.put(Config.EMBED_MODEL, texts[i], embedding.values)
+    return vectors
+
 def add_patient_record(patient_id, record_text, metadata=None):
     embedding = embed_text(record_text)
-    record_id = f"{patient_id}_{uuid.uuid4()}"
-    collection.add(
-        embeddings=[embedding],
-        documents=[record_text],
-        metadatas=[{"patient_id": patient_id, **(metadata or {})}],
-        ids=[record_id]
-    )
+    with external_call("vector_store", "add"):
+        get_vector_store().add_many([patient_id], [embedding], [record_text], [metadata])
 
 def retrieve_similar_records(patient_id, query_text, top_k=5):
-    query_embedding = embed_text(query_text)
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=top_k,
-        where={"patient_id": patient_id}
-    )
-    return results['documents'][0] if results['documents'] else []
+    try:
+        query_embedding = embed_text(query_text)
+    except llm.LLMUnavailable as exc:
+        # answer without history rather than not at all
+        logger.warning("Skipping retrieval for patient %s: %s", patient_id, exc)
+        llm.fallbacks.inc(stage="retrieve")
+        return []
+    with external_call("vector_store", "query"):
+        return get_vector_store().query(patient_id, query_embedding, top_k)
 
 def delete_patient_records(patient_id):
-    all_ids = collection.get(where={"patient_id": patient_id})['ids']
-    if all_ids:
-        collection.delete(ids=all_ids)
\ No newline at end of file
+    get_vector_store().delete(patient_id)
@@ -0,0 +1,60 @@
+"""Maintenance of the daily_patient_stats rollup table.
+
+Pain and risk charts read one row per patient per day from here instead of
+scanning the patient's whole conversation history.
+"""
+from backend.response_cache import ROLLUP_SCOPE, bump_versions
+
+UPSERT_SQL = """
+    INSERT INTO daily_patient_stats
+        (patient_id, day, message_count, pain_count, pain_sum, pain_min, pain_max,
+         risk_low, risk_medium, risk_high)
+    VALUES (:patient_id, :day, 1, :pain IS NOT NULL, COALESCE(:pain, 0), :pain, :pain,
+            COALESCE(:risk = 'LOW', 0), COALESCE(:risk = 'MEDIUM', 0), COALESCE(:risk = 'HIGH', 0))
+    ON CONFLICT (patient_id, day) DO UPDATE SET
+        message_count = message_count + 1,
+        pain_count = pain_count + excluded.pain_count,
+        pain_sum = pain_sum + excluded.pain_sum,
+        pain_min = min(COALESCE(pain_min, excluded.pain_min), COALESCE(excluded.pain_min, pain_min)),
+        pain_max = max(COALESCE(pain_max, excluded.pain_max), COALESCE(excluded.pain_max, pain_max)),
+        risk_low = risk_low + excluded.risk_low,
+        risk_medium = risk_medium + excluded.risk_medium,
+        risk_high = risk_high + excluded.risk_high
+"""
+
+REBUILD_SQL = """
+    INSERT INTO daily_patient_stats
+        (patient_id, day, message_count, pain_count, pain_sum, pain_min, pain_max,
+         risk_low, risk_medium, risk_high)
+    SELECT patient_id, date(created_at), COUNT(*), COUNT(pain_level), COALESCE(SUM(pain_level), 0),
+           MIN(pain_level), MAX(pain_level),
+           COALESCE(SUM(risk_level = 'LOW'), 0),
+           COALESCE(SUM(risk_level = 'MEDIUM'), 0),
+           COALESCE(SUM(risk_level = 'HIGH'), 0)
+    FROM conversations
+    WHERE patient_id IS NOT NULL AND created_at IS NOT NULL
+    GROUP BY patient_id, date(created_at)
+"""
+
+
+def apply_turn(db, patient_id, day, pain_level, risk):
+    """Fold one conversation into its day's rollup row (call inside the insert's transaction)."""
+    db.execute(UPSERT_SQL, {"patient_id": patient_id, "day": day, "pain": pain_level, "risk": risk})
+
+
+def rebuild(db):
+    """Recompute the rollup from the conversations table.
+
+    Days whose conversations have all moved to the archive (see
+    services/archive.py, which only archives whole days) keep their rows.
+    """
+    db.execute("""
+        DELETE FROM daily_patient_stats
+        WHERE NOT EXISTS (SELECT 1 FROM conversation_archive a WHERE a.patient_id = daily_patient_stats.patient_id)
+           OR (patient_id, day) IN (
+                SELECT patient_id, date(created_at) FROM conversations
+                WHERE patient_id IS NOT NULL AND created_at IS NOT NULL)
+    """)
+    days = db.execute(REBUILD_SQL).rowcount
+    bump_versions(db, ROLLUP_SCOPE)
+    return days
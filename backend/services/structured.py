@@ -0,0 +1,89 @@
+import json
+import re
+
+RISK_LEVELS = ("LOW", "MEDIUM", "HIGH")
+
+# Response schemas for Gemini structured output (OpenAPI subset).
+EXTRACTION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "symptoms": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "pain_level": {"type": "INTEGER", "nullable": True},
+        "risk": {"type": "STRING", "enum": list(RISK_LEVELS)},
+    },
+    "required": ["symptoms", "pain_level", "risk"],
+}
+
+TURN_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        **EXTRACTION_SCHEMA["properties"],
+        "reply": {"type": "STRING"},
+    },
+    "required": EXTRACTION_SCHEMA["required"] + ["reply"],
+}
+
+
+class SchemaError(ValueError):
+    """Model output that could not be parsed or validated."""
+
+
+_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+def parse_json_object(text):
+    """Parse a JSON object from model output, repairing common damage.
+
+    Handles markdown code fences, prose around the object, trailing commas
+    and smart quotes. Raises SchemaError if nothing parseable is left.
+    """
+    if not text:
+        raise SchemaError("empty model output")
+    try:
+        data = json.loads(text)
+    except ValueError:
+        candidate = _FENCE.sub("", text.strip())
+        start, end = candidate.find("{"), candidate.rfind("}")
+        if start == -1 or end <= start:
+            raise SchemaError("no JSON object in model output")
+        candidate = candidate[start:end + 1]
+        candidate = candidate.replace("“", '"').replace("”", '"')
+        candidate = _TRAILING_COMMA.sub(r"\1", candidate)
+        try:
+            data = json.loads(candidate)
+        except ValueError as exc:
+            raise SchemaError(f"unrepairable JSON: {exc}")
+    if not isinstance(data, dict):
+        raise SchemaError("model output is not a JSON object")
+    return data
+
+
+def validate_extraction(data, require_reply=False):
+    """Check and normalise extracted fields; raises SchemaError when invalid."""
+    symptoms = data.get("symptoms")
+    if isinstance(symptoms, str):
+        symptoms = [symptoms] if symptoms.strip() else []
+    if not isinstance(symptoms, list) or not all(isinstance(s, str) for s in symptoms):
+        raise SchemaError("symptoms must be a list of strings")
+
+    pain = data.get("pain_level")
+    if pain is not None:
+        try:
+            pain = int(round(float(pain)))
+        except (TypeError, ValueError):
+            raise SchemaError(f"pain_level {pain!r} is not a number")
+        if not 0 <= pain <= 10:
+            raise SchemaError(f"pain_level {pain} out of range")
+
+    risk = str(data.get("risk", "")).strip().upper()
+    if risk not in RISK_LEVELS:
+        raise SchemaError(f"risk {data.get('risk')!r} is not one of {RISK_LEVELS}")
+
+    result = {"symptoms": [s.strip() for s in symptoms if s.strip()], "pain_level": pain, "risk": risk}
+    if require_reply:
+        reply = data.get("reply")
+        if not isinstance(reply, str) or not reply.strip():
+            raise SchemaError("reply is missing")
+        result["reply"] = reply.strip()
+    return result
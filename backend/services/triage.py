@@ -0,0 +1,86 @@
+import json
+import re
+import threading
+from typing import NamedTuple, Optional
+
+from backend.config import Config
+
+# A negation only denies the red-flag phrase it directly precedes, with at
+# most one of these words in between ("no chest pain", "not any bleeding",
+# "I don't have a fever of 40"); "No idea why I have chest pain" still matches.
+NEGATION_FILLERS = ("any", "a", "more", "further")
+
+
+class TriageMatch(NamedTuple):
+    rule: str
+    reason: str
+    text: str
+
+
+class TriageRules:
+    """Red-flag phrases compiled into a single case-insensitive regex."""
+
+    def __init__(self, rules, negations=()):
+        self.rules = {}
+        parts = []
+        for i, rule in enumerate(rules):
+            group = f"r{i}"
+            self.rules[group] = (rule["name"], rule["reason"])
+            parts.append(f"(?P<{group}>{'|'.join(f'(?:{p})' for p in rule['patterns'])})")
+        self.pattern = re.compile("|".join(parts), re.IGNORECASE) if parts else None
+        self.negation = (
+            re.compile(r"\b(?:" + "|".join(re.escape(n) for n in negations) + r")\s+"
+                       r"(?:(?:" + "|".join(NEGATION_FILLERS) + r")\s+)?$", re.IGNORECASE)
+            if negations else None
+        )
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        rules = cls(data["rules"], data.get("negations", ()))
+        rules.check(data.get("examples", {}))
+        return rules
+
+    def check(self, examples):
+        """Raise ValueError if a rules file's own examples don't hold."""
+        for message in examples.get("match", ()):
+            if self.match(message) is None:
+                raise ValueError(f"triage rules miss red flag: {message!r}")
+        for message in examples.get("no_match", ()):
+            found = self.match(message)
+            if found is not None:
+                raise ValueError(f"triage rules flag {found.rule} in: {message!r}")
+
+    def match(self, message) -> Optional[TriageMatch]:
+        """Return the first non-negated red flag in the message, if any."""
+        if not message or self.pattern is None:
+            return None
+        text = message.replace("’", "'")
+        for m in self.pattern.finditer(text):
+            if self.negation and self.negation.search(text, 0, m.start()):
+                continue
+            name, reason = self.rules[m.lastgroup]
+            return TriageMatch(name, reason, m.group(0))
+        return None
+
+
+_rules = None
+_rules_lock = threading.Lock()
+
+
+def get_rules():
+    """Rules loaded from TRIAGE_RULES_PATH, compiled once per process."""
+    global _rules
+    if _rules is None:
+        with _rules_lock:
+            if _rules is None:
+                _rules = TriageRules.from_file(Config.TRIAGE_RULES_PATH)
+    return _rules
+
+
+def reload_rules():
+    global _rules
+    with _rules_lock:
+        _rules = TriageRules.from_file(Config.TRIAGE_RULES_PATH)
+    return _rules
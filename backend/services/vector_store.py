@@ -0,0 +1,139 @@
+import json
+import os
+import uuid
+
+from backend.database import db_write, pool
+
+
+def _load_sqlite_vec(conn):
+    import sqlite_vec
+    conn.enable_load_extension(True)
+    sqlite_vec.load(conn)
+    conn.enable_load_extension(False)
+
+
+class SqliteVecStore:
+    """Patient record embeddings stored in patients.db through sqlite-vec.
+
+    The vec0 table is partitioned on patient_id, so a KNN query only scans
+    the vectors of the patient being asked about instead of filtering one
+    global collection. Every partition preallocates a chunk of vectors, so
+    chunks are kept small: most patients have a handful of records, and the
+    default of 1024 slots cost ~12 MB of zeros per patient at 3072 dims.
+    """
+
+    table = "patient_record_vectors"
+    chunk_size = 8
+
+    def __init__(self, dim):
+        self.dim = dim
+        self._schema_ready = False
+        # every pooled connection gets the vec0 module, readers and writer alike
+        pool.add_initializer(_load_sqlite_vec)
+
+    def _ensure_schema(self):
+        if self._schema_ready:
+            return
+        with db_write() as conn:
+            conn.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING vec0(
+                    patient_id INTEGER PARTITION KEY,
+                    embedding FLOAT[{self.dim}],
+                    +record_id TEXT,
+                    +document TEXT,
+                    +metadata TEXT,
+                    chunk_size={self.chunk_size}
+                )
+            """)
+        self._schema_ready = True
+
+    def rebuild(self):
+        """Recreate the table in the current layout, keeping every row (vec0 cannot be altered)."""
+        self._ensure_schema()
+        columns = "patient_id, embedding, record_id, document, metadata"
+        with db_write() as conn:
+            conn.execute(f"CREATE TEMP TABLE vector_copy AS SELECT {columns} FROM {self.table}")
+            conn.execute(f"DROP TABLE {self.table}")
+            self._schema_ready = False
+            self._ensure_schema()
+            count = conn.execute(f"INSERT INTO {self.table} ({columns}) SELECT {columns} FROM temp.vector_copy").rowcount
+            conn.execute("DROP TABLE temp.vector_copy")
+        return count
+
+    def _conn(self):
+        self._ensure_schema()
+        return pool.connection()
+
+    def add_many(self, patient_ids, embeddings, documents, metadatas=None, record_ids=None):
+        from sqlite_vec import serialize_float32
+        metadatas = metadatas or [None] * len(documents)
+        record_ids = record_ids or [f"{pid}_{uuid.uuid4()}" for pid in patient_ids]
+        self._ensure_schema()
+        with db_write() as conn:
+            conn.executemany(
+                f"INSERT INTO {self.table} (patient_id, embedding, record_id, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                [(int(pid), serialize_float32(emb), rid, doc, json.dumps(md) if md else None)
+                 for pid, emb, doc, md, rid in zip(patient_ids, embeddings, documents, metadatas, record_ids)],
+            )
+        return record_ids
+
+    def query(self, patient_id, embedding, top_k):
+        from sqlite_vec import serialize_float32
+        rows = self._conn().execute(
+            f"""SELECT document FROM {self.table}
+                WHERE embedding MATCH ? AND k = ? AND patient_id = ?
+                ORDER BY distance""",
+            (serialize_float32(embedding), top_k, int(patient_id)),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def delete(self, patient_id):
+        self._ensure_schema()
+        with db_write() as conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE patient_id = ?", (int(patient_id),))
+
+    def record_ids(self):
+        return {r[0] for r in self._conn().execute(f"SELECT record_id FROM {self.table}")}
+
+
+class ChromaStore:
+    """The original Chroma collection, kept for deployments not yet migrated."""
+
+    def __init__(self, path):
+        import chromadb
+        self.collection = chromadb.PersistentClient(path=path).get_or_create_collection(name="patient_records")
+
+    def add_many(self, patient_ids, embeddings, documents, metadatas=None, record_ids=None):
+        metadatas = metadatas or [None] * len(documents)
+        record_ids = record_ids or [f"{pid}_{uuid.uuid4()}" for pid in patient_ids]
+        self.collection.add(
+            embeddings=list(embeddings),
+            documents=list(documents),
+            metadatas=[{"patient_id": pid, **(md or {})} for pid, md in zip(patient_ids, metadatas)],
+            ids=record_ids,
+        )
+        return record_ids
+
+    def query(self, patient_id, embedding, top_k):
+        results = self.collection.query(
+            query_embeddings=[embedding],
+            n_results=top_k,
+            where={"patient_id": patient_id}
+        )
+        return results['documents'][0] if results['documents'] else []
+
+    def delete(self, patient_id):
+        all_ids = self.collection.get(where={"patient_id": patient_id})['ids']
+        if all_ids:
+            self.collection.delete(ids=all_ids)
+
+
+CHROMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'chroma_db')
+
+
+def open_store(backend, dim):
+    if backend == "chroma":
+        return ChromaStore(CHROMA_PATH)
+    if backend == "sqlite":
+        return SqliteVecStore(dim)
+    raise ValueError(f"Unknown VECTOR_BACKEND {backend!r}")
@@ -0,0 +1,159 @@
+"""Group-commit writer for the hot-path inserts (conversations, rollup, alerts).
+
+Callers hand a ``fn(db, *args)`` to ``writer.submit`` and get a Future back.
+A single thread collects submissions for a short window and runs them in
+one transaction, each inside its own savepoint so one bad write does not
+sink the batch, then commits once. Bursts of turns therefore cost one
+fsync instead of one each. ``flush=True`` commits the batch at once (alerts
+must never wait); ``stop()`` drains the queue and is called at exit.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from backend.config import Config
+from backend.database import db_write
+from backend.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+batch_size = registry.histogram(
+    "db_writer_batch_size", "Writes per group commit.", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+commit_seconds = registry.histogram(
+    "db_writer_commit_seconds", "Time to run and commit one batch.")
+failed_writes = registry.counter(
+    "db_writer_failed_writes_total", "Writes rolled back to their savepoint.")
+
+_STOP = object()
+
+
+class _Write:
+    __slots__ = ("fn", "args", "flush", "future")
+
+    def __init__(self, fn, args, flush):
+        self.fn = fn
+        self.args = args
+        self.flush = flush
+        self.future = Future()
+
+
+class GroupCommitWriter:
+    def __init__(self, window_seconds, max_batch):
+        self.window = window_seconds
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._atexit = False
+
+    def submit(self, fn, *args, flush=False):
+        """Queue ``fn(db, *args)`` for the next group commit; the Future resolves after commit."""
+        write = _Write(fn, args, flush)
+        if self._stopped or not self._ensure_running():
+            # shutting down: don't lose the write, just don't batch it
+            self._commit([write])
+        else:
+            self._queue.put(write)
+        return write.future
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _ensure_running(self):
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid() and thread.is_alive():
+            return True
+        with self._lock:
+            if self._stopped:
+                return False
+            if self._pid != os.getpid():
+                # the parent's queued writes are the parent's to commit
+                self._queue = queue.Queue()
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+                if not self._atexit:
+                    atexit.register(self.stop)
+                    self._atexit = True
+            return True
+
+    def stop(self, timeout=10):
+        """Commit everything queued so far and stop the thread."""
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            flush = first.flush
+            stop = False
+            deadline = time.monotonic() + self.window
+            while not flush and len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+                flush = item.flush
+            self._commit(batch)
+            if stop:
+                return
+
+    def _commit(self, batch):
+        outcomes = []
+        start = time.perf_counter()
+        try:
+            with db_write() as db:
+                if not db.in_transaction:
+                    # savepoints must nest in one transaction, not open their own
+                    db.execute("BEGIN IMMEDIATE")
+                for write in batch:
+                    db.execute("SAVEPOINT group_write")
+                    try:
+                        outcomes.append((write, write.fn(db, *write.args), None))
+                    except Exception as exc:
+                        db.execute("ROLLBACK TO group_write")
+                        failed_writes.inc()
+                        logger.exception("Write %s failed; rolled back", getattr(write.fn, "__name__", write.fn))
+                        outcomes.append((write, None, exc))
+                    db.execute("RELEASE group_write")
+        except Exception as exc:
+            logger.exception("Group commit of %s writes failed", len(batch))
+            for write in batch:
+                write.future.set_exception(exc)
+            return
+        finally:
+            commit_seconds.observe(time.perf_counter() - start)
+            batch_size.observe(len(batch))
+        for write, result, exc in outcomes:
+            if exc is None:
+                write.future.set_result(result)
+            else:
+                write.future.set_exception(exc)
+
+
+writer = GroupCommitWriter(Config.WRITE_BATCH_WINDOW_MS / 1000.0, Config.WRITE_BATCH_MAX)
+
+registry.gauge("db_writer_queue_depth", "Writes waiting for the next group commit.", fn=writer.depth)
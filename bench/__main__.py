@@ -0,0 +1,165 @@
+"""Offline benchmark runner.
+
+    python -m bench                                  # all scenarios, default sizes
+    python -m bench --patients 5000 --days 180 --scenarios webhook --async
+    python -m bench --compare bench/results/baseline.json
+    python -m bench --scenarios startup --requests 10   # cold start, 10 fresh interpreters
+
+Everything runs against a throwaway database in a temp directory, with
+Gemini, Twilio and the vector store replaced by the latency-injecting fakes
+in bench/fakes.py. Results are written as JSON under bench/results/.
+"""
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+COMPARED = {"p50_ms": "lower", "p95_ms": "lower", "p99_ms": "lower", "rps": "higher", "peak_rss_mb": "lower"}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default="webhook,dashboard,login",
+                        help="comma-separated subset of webhook, dashboard, login, startup")
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--hospitals", type=int, default=3)
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=90, help="days of conversation history to generate")
+    parser.add_argument("--messages-per-day", type=float, default=1.0)
+    parser.add_argument("--async", dest="webhook_async", action="store_true",
+                        help="run the webhook in WEBHOOK_ASYNC mode and time the inbox drain")
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--embed-latency-ms", type=float, default=150)
+    parser.add_argument("--twilio-latency-ms", type=float, default=200)
+    parser.add_argument("--vector-latency-ms", type=float, default=20)
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--output", help="result file (default bench/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier result file to diff against")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percent change counted as a regression in --compare")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args, workdir):
+    """Point every data path at ``workdir``; must run before backend is imported."""
+    os.environ.update({
+        "DATABASE_PATH": os.path.join(workdir, "patients.db"),
+        "CHECKPOINT_DB_PATH": os.path.join(workdir, "checkpoints.db"),
+        "EMBED_CACHE_PATH": os.path.join(workdir, "embedding_cache.db"),
+        "WEBHOOK_ASYNC": "true" if args.webhook_async else "false",
+        "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+        "GEMINI_API_KEY": "bench",
+        "TWILIO_ACCOUNT_SID": "ACbench",
+        "TWILIO_AUTH_TOKEN": "bench",
+        "TWILIO_WHATSAPP_NUMBER": "+10000000000",
+    })
+
+
+def install_fakes(args):
+    from bench.fakes import FakeGenaiClient, FakeTwilioClient, FakeVectorStore
+    from backend.config import Config
+    from backend.services import clients
+
+    genai = FakeGenaiClient(args.llm_latency_ms, args.embed_latency_ms, dim=Config.EMBEDDING_DIM)
+    twilio = FakeTwilioClient(args.twilio_latency_ms)
+    clients.set_gemini_client(genai)
+    clients.set_twilio_client(twilio)
+    clients.set_vector_store(FakeVectorStore(args.vector_latency_ms))
+    return genai, twilio
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new, threshold):
+    """Print per-metric changes; returns the list of regressions beyond ``threshold`` percent."""
+    regressions = []
+    for name, result in new["scenarios"].items():
+        before = old.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        print(f"\n{name}")
+        for metric, better in COMPARED.items():
+            a, b = before.get(metric), result.get(metric)
+            if not a or b is None:
+                continue
+            change = (b - a) / a * 100.0
+            worse = change > threshold if better == "lower" else change < -threshold
+            flag = "  REGRESSION" if worse else ""
+            print(f"  {metric:<12} {a:>10} -> {b:>10}  ({change:+.1f}%){flag}")
+            if worse:
+                regressions.append((name, metric, change))
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        configure_environment(args, workdir)
+        sys.path.insert(0, ROOT)
+
+        from backend.app import create_app
+        from bench import dataset, scenarios
+
+        unknown = [n for n in names if n not in scenarios.SCENARIOS]
+        if unknown:
+            sys.exit(f"unknown scenario(s): {', '.join(unknown)}")
+
+        app = create_app()
+        start = time.perf_counter()
+        data = dataset.seed(os.environ["DATABASE_PATH"], hospitals=args.hospitals, patients=args.patients,
+                            days=args.days, messages_per_day=args.messages_per_day)
+        print(f"seeded {data['patients']} patients, {data['conversations']} conversations "
+              f"in {time.perf_counter() - start:.1f}s")
+        genai, twilio = install_fakes(args)
+
+        results = {}
+        for name in names:
+            print(f"running {name} ({args.requests} requests, concurrency {args.concurrency})...")
+            results[name] = scenarios.run(name, app, data, args.requests, args.concurrency)
+            print("  " + ", ".join(f"{k}={v}" for k, v in results[name].items()))
+
+        from backend.app import stop_background_workers
+        stop_background_workers(timeout=5)
+
+    report = {
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "python": sys.version.split()[0],
+        "args": vars(args),
+        "dataset": {k: data[k] for k in ("patients", "doctors", "conversations")},
+        "upstream_calls": {**genai.calls, "twilio_sent": twilio.sent},
+        "scenarios": results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nresults written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold}%")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""Seeded synthetic dataset for benchmarks, in the style of scripts/seed_users.py."""
+import datetime
+import json
+import random
+import sqlite3
+
+import bcrypt
+
+SURGERY_TYPES = ["knee replacement", "hip replacement", "appendectomy", "cholecystectomy", "c-section"]
+MESSAGES = [
+    "ok", "better today", "pain 3", "pain 5", "a little sore", "knee swelling a bit",
+    "slept well", "not sure, maybe some swelling", "pain 2 today", "walking more",
+]
+RISKS = ["LOW"] * 8 + ["MEDIUM"] * 2
+PASSWORD = "bench-password"
+
+
+def _phone(n):
+    return f"+1999{n:07d}"
+
+
+def seed(db_path, hospitals=2, patients=1000, days=90, messages_per_day=1.0, rng_seed=42):
+    """Fill an initialised database; returns the login names to use in scenarios.
+
+    Every user shares one password hashed at bcrypt cost 4 so seeding stays
+    fast; the login scenario rehashes at the configured cost on first login
+    like a real deployment would.
+    """
+    rng = random.Random(rng_seed)
+    password_hash = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt(rounds=4)).decode("utf-8")
+    today = datetime.date.today()
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    with conn:
+        conn.executemany("INSERT INTO hospitals (name) VALUES (?)",
+                         [(f"Hospital {h + 1}",) for h in range(hospitals)])
+        doctors_per_hospital = max(1, patients // 200)
+        conn.executemany(
+            "INSERT INTO doctors (name, phone, email, hospital_id) VALUES (?, ?, ?, ?)",
+            [(f"Dr. {h}-{d}", f"+1888{h:03d}{d:04d}", f"doc{h}-{d}@bench.test", h + 1)
+             for h in range(hospitals) for d in range(doctors_per_hospital)])
+        doctor_count = hospitals * doctors_per_hospital
+
+        patient_rows = []
+        for p in range(patients):
+            surgery = today - datetime.timedelta(days=rng.randint(0, days))
+            hospital = p % hospitals + 1
+            doctor = (hospital - 1) * doctors_per_hospital + rng.randrange(doctors_per_hospital) + 1
+            patient_rows.append((_phone(p), f"Patient {p}", surgery.isoformat(),
+                                 rng.choice(SURGERY_TYPES), hospital, doctor))
+        conn.executemany("""
+            INSERT INTO patients (phone, name, surgery_date, surgery_type, hospital_id, primary_doctor_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, patient_rows)
+
+        conversation_rows = []
+        for pid, (_, _, surgery, *_rest) in enumerate(patient_rows, start=1):
+            start = datetime.date.fromisoformat(surgery)
+            for d in range((today - start).days + 1):
+                for _ in range(int(messages_per_day) + (rng.random() < messages_per_day % 1)):
+                    pain = max(0, min(10, int(rng.gauss(7 - d * 0.06, 1.5))))
+                    risk = rng.choice(RISKS)
+                    ts = datetime.datetime.combine(start + datetime.timedelta(days=d), datetime.time(
+                        rng.randint(7, 21), rng.randint(0, 59), rng.randint(0, 59)))
+                    conversation_rows.append((
+                        pid, rng.choice(MESSAGES), "Thanks for checking in. Keep resting.",
+                        json.dumps({"symptoms": [], "pain_level": pain}), pain, risk,
+                        ts.strftime("%Y-%m-%d %H:%M:%S")))
+        conn.executemany("""
+            INSERT INTO conversations
+                (patient_id, patient_message, agent_response, extracted_symptoms, pain_level, risk_level, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, conversation_rows)
+
+        conn.executemany("INSERT INTO alerts (patient_id, alert_type, reason) VALUES (?, 'high_risk', ?)",
+                         [(rng.randint(1, patients), "bench alert") for _ in range(max(1, patients // 20))])
+
+        users = [("admin", password_hash, "admin", None, None)]
+        users += [(f"doctor{d + 1}", password_hash, "doctor", None, d + 1) for d in range(doctor_count)]
+        users += [(_phone(p), password_hash, "patient", p + 1, None) for p in range(patients)]
+        conn.executemany("""
+            INSERT INTO users (username, password_hash, role, patient_id, doctor_id) VALUES (?, ?, ?, ?, ?)
+        """, users)
+
+    from backend.services.rollup import rebuild
+    with conn:
+        rebuild(conn)
+    conn.close()
+    return {
+        "patients": patients,
+        "doctors": doctor_count,
+        "conversations": len(conversation_rows),
+        "patient_phones": [_phone(p) for p in range(patients)],
+        "doctor_usernames": [f"doctor{d + 1}" for d in range(doctor_count)],
+        "password": PASSWORD,
+    }
@@ -0,0 +1,115 @@
+"""Local stand-in for the Twilio Messages REST API.
+
+    python -m bench.fake_twilio_server --port 8099 --rate 10 --error-rate 0.02
+    TWILIO_API_BASE=http://127.0.0.1:8099 python scripts/run_checkins.py
+
+Accepts ``POST /2010-04-01/Accounts/<sid>/Messages.json`` like the real
+API, sleeps for the configured latency, answers 429 when senders exceed
+``rate`` messages per second and fails a random fraction with 500, so the
+outbox's rate limiting and retries can be exercised without sending
+anything.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+_MESSAGES_PATH = re.compile(r"^/2010-04-01/Accounts/([^/]+)/Messages\.json$")
+
+
+class FakeTwilioServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=100, rate=None, error_rate=0.0):
+        super().__init__(address, _Handler)
+        self.latency_ms = latency_ms
+        self.rate = rate
+        self.error_rate = error_rate
+        self.messages = []
+        self.throttled = 0
+        self.errors = 0
+        self._window = []
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _over_rate(self):
+        if not self.rate:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.rate:
+                self.throttled += 1
+                return True
+            self._window.append(now)
+            return False
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeTwilioServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload, headers=()):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        match = _MESSAGES_PATH.match(self.path)
+        if not match:
+            return self._reply(404, {"code": 20404, "message": "The requested resource was not found"})
+        form = parse_qs(self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode("utf-8"))
+        server = self.server
+        if server.latency_ms:
+            time.sleep(max(0.0, random.gauss(server.latency_ms, server.latency_ms * 0.2)) / 1000.0)
+        if server._over_rate():
+            return self._reply(429, {"code": 20429, "message": "Too Many Requests"}, [("Retry-After", "1")])
+        if random.random() < server.error_rate:
+            with server._lock:
+                server.errors += 1
+            return self._reply(500, {"code": 20500, "message": "Internal Server Error"})
+        to = form.get("To", [""])[0]
+        if not to.startswith("whatsapp:+"):
+            return self._reply(400, {"code": 21211, "message": f"The 'To' number {to} is not a valid phone number."})
+        sid = f"SM{random.getrandbits(128):032x}"
+        with server._lock:
+            server.messages.append({"sid": sid, "account": match.group(1), "to": to,
+                                    "from": form.get("From", [""])[0], "body": form.get("Body", [""])[0]})
+        self._reply(201, {"sid": sid, "status": "queued", "to": to})
+
+
+def serve(port=0, **kwargs):
+    """Start a server on a background thread; returns it (``server.url``, ``server.shutdown()``)."""
+    server = FakeTwilioServer(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=server.serve_forever, name="fake-twilio", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Twilio Messages API.")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--rate", type=float, help="messages per second before answering 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 500")
+    args = parser.parse_args()
+    server = FakeTwilioServer(("127.0.0.1", args.port), args.latency_ms, args.rate, args.error_rate)
+    print(f"Fake Twilio API on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
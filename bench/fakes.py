@@ -0,0 +1,118 @@
+"""Local stand-ins for Gemini, Twilio and the vector store.
+
+Each fake sleeps for a configurable latency so throughput numbers reflect
+how the app behaves while waiting on upstream services, without calling
+(or paying for) them.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+
+def _sleep(latency_ms, jitter):
+    if latency_ms:
+        time.sleep(max(0.0, random.gauss(latency_ms, latency_ms * jitter)) / 1000.0)
+
+
+class _FakeModels:
+    def __init__(self, client):
+        self.client = client
+
+    def generate_content(self, model, contents, config=None):
+        self.client._count('generate')
+        _sleep(self.client.generate_latency_ms, self.client.jitter)
+        text = str(contents)
+        pain = re.search(r"\bpain\D{0,10}(\d{1,2})\b", text, re.IGNORECASE)
+        data = {
+            "symptoms": ["swelling"] if "swell" in text.lower() else [],
+            "pain_level": min(int(pain.group(1)), 10) if pain else None,
+            "risk": "MEDIUM" if "swell" in text.lower() else "LOW",
+        }
+        if config is not None and getattr(config, "response_schema", None) is not None:
+            if "reply" in json.dumps(config.response_schema):
+                data["reply"] = "Thanks for checking in. Keep resting and let us know if anything changes."
+            return SimpleNamespace(text=json.dumps(data), usage_metadata=None)
+        if "Return JSON" in text:
+            return SimpleNamespace(text=json.dumps(data), usage_metadata=None)
+        return SimpleNamespace(text="Thanks for checking in. Keep resting.", usage_metadata=None)
+
+    def embed_content(self, model, contents, config=None):
+        items = contents if isinstance(contents, list) else [contents]
+        self.client._count('embed', len(items))
+        _sleep(self.client.embed_latency_ms, self.client.jitter)
+        embeddings = []
+        for item in items:
+            # deterministic pseudo-embedding so identical texts match
+            seed = int.from_bytes(hashlib.sha256(str(item).encode("utf-8")).digest()[:8], "big")
+            rng = random.Random(seed)
+            embeddings.append(SimpleNamespace(values=[rng.uniform(-1, 1) for _ in range(self.client.dim)]))
+        return SimpleNamespace(embeddings=embeddings)
+
+
+class FakeGenaiClient:
+    """Quacks like ``google.genai.Client`` for ``models.generate_content/embed_content``."""
+
+    def __init__(self, generate_latency_ms=800, embed_latency_ms=150, jitter=0.2, dim=3072):
+        self.generate_latency_ms = generate_latency_ms
+        self.embed_latency_ms = embed_latency_ms
+        self.jitter = jitter
+        self.dim = dim
+        self.calls = {"generate": 0, "embed": 0}
+        self._lock = threading.Lock()
+        self.models = _FakeModels(self)
+
+    def _count(self, kind, n=1):
+        with self._lock:
+            self.calls[kind] += n
+
+
+class _FakeMessages:
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, body, from_, to, **kwargs):
+        _sleep(self.client.latency_ms, self.client.jitter)
+        with self.client._lock:
+            self.client.sent += 1
+        return SimpleNamespace(sid=f"SM{random.getrandbits(64):016x}", status="queued")
+
+
+class FakeTwilioClient:
+    """Quacks like ``twilio.rest.Client`` for ``messages.create``."""
+
+    def __init__(self, latency_ms=200, jitter=0.2):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.sent = 0
+        self._lock = threading.Lock()
+        self.messages = _FakeMessages(self)
+
+
+class FakeVectorStore:
+    """In-memory stand-in for the Chroma / sqlite-vec stores."""
+
+    def __init__(self, latency_ms=20, jitter=0.2):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self._docs = {}
+        self._lock = threading.Lock()
+
+    def add_many(self, patient_ids, embeddings, documents, metadatas=None, record_ids=None):
+        _sleep(self.latency_ms, self.jitter)
+        with self._lock:
+            for pid, doc in zip(patient_ids, documents):
+                self._docs.setdefault(int(pid), []).append(doc)
+        return record_ids or []
+
+    def query(self, patient_id, embedding, top_k):
+        _sleep(self.latency_ms, self.jitter)
+        with self._lock:
+            return list(self._docs.get(int(patient_id), []))[:top_k]
+
+    def delete(self, patient_id):
+        with self._lock:
+            self._docs.pop(int(patient_id), None)
@@ -0,0 +1,209 @@
+"""Load scenarios driven through the Flask test client from a thread pool."""
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from twilio.request_validator import RequestValidator
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(latencies, errors, elapsed):
+    ms = sorted(l * 1000.0 for l in latencies)
+    return {
+        "requests": len(ms) + errors,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(ms) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(ms, 50), 2) if ms else None,
+        "p95_ms": round(percentile(ms, 95), 2) if ms else None,
+        "p99_ms": round(percentile(ms, 99), 2) if ms else None,
+        "max_ms": round(ms[-1], 2) if ms else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _drive(app, make_request, total, concurrency):
+    """Issue ``total`` requests over ``concurrency`` threads, one test client each."""
+    local = threading.local()
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def one(i):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        start = time.perf_counter()
+        response = make_request(client, i)
+        response.get_data()  # drain streamed bodies so they are timed too
+        took = time.perf_counter() - start
+        with lock:
+            if response.status_code < 400:
+                latencies.append(took)
+            else:
+                errors[0] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    return latencies, errors[0], time.perf_counter() - start
+
+
+def _login(client, username, password):
+    response = client.post("/api/login", json={"username": username, "password": password})
+    return response.get_json()["token"]
+
+
+def webhook_burst(app, dataset, total, concurrency, rng):
+    """Inbound WhatsApp messages from random patients, as Twilio would post them."""
+    phones = dataset["patient_phones"]
+    bodies = ["pain 3 today", "feeling ok", "knee swelling a bit", "pain 6, hard to sleep", "better"]
+
+    signer = RequestValidator(app.config["TWILIO_AUTH_TOKEN"])
+
+    def request(client, i):
+        data = {
+            "Body": rng.choice(bodies),
+            "From": f"whatsapp:{rng.choice(phones)}",
+            "MessageSid": f"SMbench{i:08d}{rng.getrandbits(32):08x}",
+        }
+        signature = signer.compute_signature("http://localhost/webhook/whatsapp", data)
+        return client.post("/webhook/whatsapp", data=data, headers={"X-Twilio-Signature": signature})
+
+    latencies, errors, elapsed = _drive(app, request, total, concurrency)
+    result = summarize(latencies, errors, elapsed)
+    if app.config.get("WEBHOOK_ASYNC"):
+        result["drain_s"] = round(_wait_for_inbox(), 3)
+    return result
+
+
+def _wait_for_inbox(timeout=600):
+    """Seconds until the async inbox has no pending or processing rows."""
+    from backend.database import pool
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        left = pool.connection().execute(
+            "SELECT COUNT(*) FROM inbound_messages WHERE status IN ('pending', 'processing')").fetchone()[0]
+        if not left:
+            break
+        time.sleep(0.05)
+    return time.perf_counter() - start
+
+
+def dashboard_reads(app, dataset, total, concurrency, rng):
+    """A doctor's dashboard: patient list, alerts, one patient's history and pain trend."""
+    with app.test_client() as client:
+        token = _login(client, dataset["doctor_usernames"][0], dataset["password"])
+    headers = {"Authorization": f"Bearer {token}"}
+    patients = dataset["patients"]
+
+    def request(client, i):
+        pid = rng.randint(1, patients)
+        path = rng.choice([
+            "/api/patients",
+            "/api/alerts",
+            f"/api/patients/{pid}",
+            f"/api/patients/{pid}/conversations",
+            f"/api/patients/{pid}/pain-trend",
+        ])
+        return client.get(path, headers=headers)
+
+    return summarize(*_drive(app, request, total, concurrency))
+
+
+def login_storm(app, dataset, total, concurrency, rng):
+    """Many patients logging in at once (bcrypt-bound)."""
+    phones = dataset["patient_phones"]
+
+    def request(client, i):
+        return client.post("/api/login", json={"username": rng.choice(phones), "password": dataset["password"]})
+
+    return summarize(*_drive(app, request, total, concurrency))
+
+
+_STARTUP_PROBE = """
+import json, time
+t0 = time.perf_counter()
+import backend.app
+t1 = time.perf_counter()
+app = backend.app.create_app(start_background=False)
+t2 = time.perf_counter()
+from backend.services.agent import agent_graph
+agent_graph.get()
+t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "create_app": t2 - t1, "graph": t3 - t2}))
+"""
+
+
+def _slowest_imports(root, limit=10):
+    """Top-level modules by cumulative import time up to a built app (``python -X importtime``)."""
+    code = "import backend.app; backend.app.create_app(start_background=False)"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=root, capture_output=True, text=True, check=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if cumulative.strip().isdigit() and not name[1:].startswith(" "):
+            rows.append((int(cumulative), name.strip()))
+    rows.sort(reverse=True)
+    return {name: round(us / 1000.0, 1) for us, name in rows[:limit]}
+
+
+def startup(app, dataset, total, concurrency, rng):
+    """Cold start in fresh interpreters: import, create_app, first graph compile.
+
+    Runs one process at a time so they don't compete for CPU; the reported
+    latency is import + create_app, i.e. time until a worker can serve.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    phases = {"import": [], "create_app": [], "graph": []}
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(total):
+        proc = subprocess.run([sys.executable, "-c", _STARTUP_PROBE], cwd=root,
+                              capture_output=True, text=True, check=True)
+        timings = json.loads(proc.stdout.strip().splitlines()[-1])
+        for phase, seconds in timings.items():
+            phases[phase].append(seconds * 1000.0)
+        latencies.append(timings["import"] + timings["create_app"])
+    result = summarize(latencies, 0, time.perf_counter() - start)
+    result.pop("rps")
+    for phase, values in phases.items():
+        result[f"{phase}_p50_ms"] = round(percentile(sorted(values), 50), 2)
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    result["child_peak_rss_mb"] = round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    result["slowest_imports_ms"] = _slowest_imports(root)
+    return result
+
+
+SCENARIOS = {
+    "webhook": webhook_burst,
+    "dashboard": dashboard_reads,
+    "login": login_storm,
+    "startup": startup,
+}
+
+
+def run(name, app, dataset, total, concurrency, seed=7):
+    return SCENARIOS[name](app, dataset, total, concurrency, random.Random(seed))
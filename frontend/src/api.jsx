@@ -21,8 +21,16 @@ API.interceptors.response.use(
 );
 
 export const login = (credentials) => API.post('/login', credentials);
-export const getPatients = () => API.get('/patients');
-export const getAlerts = () => API.get('/alerts');
+// list endpoints are keyset-paginated: pass { cursor, limit, fields } and
+// read { items, next_cursor } from the response
+export const getPatients = (params) => API.get('/patients', { params });
+export const getAlerts = (params) => API.get('/alerts', { params });
 export const acknowledgeAlert = (id) => API.post(`/alerts/${id}/acknowledge`);
-export const getPatientConversations = (id) => API.get(`/patients/${id}/conversations`);
-export const getPainTrend = (id) => API.get(`/patients/${id}/pain-trend`);
\ No newline at end of file
+export const getPatientConversations = (id, params) => API.get(`/patients/${id}/conversations`, { params });
+// EventSource can't set headers, so the token goes in the query string
+export const alertStreamUrl = (lastEventId) =>
+  `${API.defaults.baseURL}/alerts/stream?token=${encodeURIComponent(localStorage.getItem('token') || '')}` +
+  (lastEventId ? `&lastEventId=${encodeURIComponent(lastEventId)}` : '');
+export const getPainTrend = (id) => API.get(`/patients/${id}/pain-trend`);
+// cohort pain bands by post-op day, grouped by surgery type
+export const getCohortStats = (hospitalId, params) => API.get(`/hospitals/${hospitalId}/cohort-stats`, { params });
\ No newline at end of file
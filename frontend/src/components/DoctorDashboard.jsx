@@ -1,18 +1,67 @@
 import { useState, useEffect } from 'react';
-import { getAlerts, acknowledgeAlert, getPatients } from '../api';
+import { getAlerts, acknowledgeAlert, getPatients, alertStreamUrl } from '../api';
 
 const DoctorDashboard = () => {
   const [alerts, setAlerts] = useState([]);
+  const [alertsCursor, setAlertsCursor] = useState(null);
   const [patients, setPatients] = useState([]);
+  const [patientsCursor, setPatientsCursor] = useState(null);
+
+  const loadAlerts = (cursor) => {
+    getAlerts({ cursor, fields: 'id,name,reason' }).then(res => {
+      setAlerts(prev => (cursor ? [...prev, ...res.data.items] : res.data.items));
+      setAlertsCursor(res.data.next_cursor);
+    });
+  };
+
+  const loadPatients = (cursor) => {
+    getPatients({ cursor, fields: 'id,name,phone' }).then(res => {
+      setPatients(prev => (cursor ? [...prev, ...res.data.items] : res.data.items));
+      setPatientsCursor(res.data.next_cursor);
+    });
+  };
 
   useEffect(() => {
-    getAlerts().then(res => setAlerts(res.data));
-    getPatients().then(res => setPatients(res.data));
+    loadAlerts();
+    loadPatients();
+  }, []);
+
+  // live alert updates; EventSource reconnects and resumes via Last-Event-ID.
+  // A busy server answers 503, which closes the source: reopen it after a
+  // pause, resuming from the last event seen.
+  useEffect(() => {
+    let source;
+    let timer;
+    let lastEventId = null;
+    const track = (handler) => (e) => {
+      lastEventId = e.lastEventId || lastEventId;
+      handler(JSON.parse(e.data));
+    };
+    const connect = () => {
+      source = new EventSource(alertStreamUrl(lastEventId));
+      source.addEventListener('alert.created', track((alert) => {
+        setAlerts(prev => (prev.some(a => a.id === alert.id) ? prev : [alert, ...prev]));
+      }));
+      source.addEventListener('alert.acknowledged', track(({ id }) => {
+        setAlerts(prev => prev.filter(a => a.id !== id));
+      }));
+      source.addEventListener('reset', () => loadAlerts());
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+          timer = setTimeout(connect, 10000);
+        }
+      };
+    };
+    connect();
+    return () => {
+      clearTimeout(timer);
+      source.close();
+    };
   }, []);
 
   const handleAcknowledge = (id) => {
     acknowledgeAlert(id).then(() => {
-      setAlerts(alerts.filter(a => a.id !== id));
+      setAlerts(prev => prev.filter(a => a.id !== id));
     });
   };
 
@@ -44,6 +93,14 @@ const DoctorDashboard = () => {
                   </button>
                 </div>
               ))}
+              {alertsCursor && (
+                <button
+                  onClick={() => loadAlerts(alertsCursor)}
+                  className="text-red-300 hover:text-red-200 text-sm font-semibold"
+                >
+                  Load more alerts
+                </button>
+              )}
             </div>
           )}
         </div>
@@ -59,6 +116,14 @@ const DoctorDashboard = () => {
               </div>
             ))}
           </div>
+          {patientsCursor && (
+            <button
+              onClick={() => loadPatients(patientsCursor)}
+              className="mt-4 bg-slate-700 hover:bg-slate-600 text-white font-semibold py-2 px-4 rounded-lg transition-colors"
+            >
+              Load more patients
+            </button>
+          )}
         </div>
       </div>
     </div>
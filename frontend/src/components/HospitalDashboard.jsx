@@ -1,41 +1,138 @@
-const HospitalDashboard = () => (
-  <div className="min-h-screen bg-gradient-to-br from-slate-50 to-slate-100 p-8">
-    <div className="max-w-7xl mx-auto">
-      <div className="mb-12">
-        <h1 className="text-4xl font-bold text-slate-900 mb-2">
-          Hospital Admin Dashboard
-        </h1>
-        <p className="text-lg text-slate-600">
-          Aggregate statistics and management tools
-        </p>
-      </div>
+import { useState, useEffect } from 'react';
+import { getCohortStats } from '../api';
+import CohortBandChart from './charts/CohortBandChart';
+
+const DAY_WINDOWS = [30, 60, 90, 180];
+
+const HospitalDashboard = () => {
+  const [hospitalId, setHospitalId] = useState(1);
+  const [days, setDays] = useState(60);
+  const [stats, setStats] = useState(null);
+  const [error, setError] = useState(null);
+
+  useEffect(() => {
+    setError(null);
+    getCohortStats(hospitalId, { days })
+      .then(res => setStats(res.data))
+      .catch(() => setError('Could not load cohort statistics'));
+  }, [hospitalId, days]);
 
-      <div className="grid grid-cols-1 md:grid-cols-3 gap-6 mb-8">
-        {[1, 2, 3].map((i) => (
-          <div
-            key={i}
-            className="bg-white rounded-lg shadow-md p-6 hover:shadow-lg transition-shadow"
-          >
-            <div className="h-12 w-12 bg-blue-100 rounded-lg mb-4" />
-            <h3 className="text-lg font-semibold text-slate-900 mb-2">
-              Metric {i}
-            </h3>
-            <p className="text-2xl font-bold text-blue-600 mb-1">0</p>
-            <p className="text-sm text-slate-500">Coming soon</p>
+  const cohorts = stats ? stats.cohorts : [];
+  const totals = [
+    { label: 'Patients in window', value: cohorts.reduce((n, c) => n + c.patients, 0) },
+    { label: `Reported in last ${stats ? stats.recent_days : 7} days`, value: cohorts.reduce((n, c) => n + c.recent_patients, 0) },
+    { label: 'Above 90th percentile', value: cohorts.reduce((n, c) => n + c.outliers.length, 0) },
+  ];
+
+  return (
+    <div className="min-h-screen bg-gradient-to-br from-slate-50 to-slate-100 p-8">
+      <div className="max-w-7xl mx-auto">
+        <div className="mb-12 flex flex-wrap items-end justify-between gap-4">
+          <div>
+            <h1 className="text-4xl font-bold text-slate-900 mb-2">
+              Hospital Admin Dashboard
+            </h1>
+            <p className="text-lg text-slate-600">
+              Pain by day after surgery, compared across each surgery type's cohort
+            </p>
           </div>
-        ))}
-      </div>
+          <div className="flex gap-4">
+            <label className="text-sm text-slate-600">
+              Hospital
+              <input
+                type="number"
+                min="1"
+                value={hospitalId}
+                onChange={(e) => setHospitalId(Number(e.target.value) || 1)}
+                className="ml-2 w-20 rounded border border-slate-300 px-2 py-1"
+              />
+            </label>
+            <label className="text-sm text-slate-600">
+              Days after surgery
+              <select
+                value={days}
+                onChange={(e) => setDays(Number(e.target.value))}
+                className="ml-2 rounded border border-slate-300 px-2 py-1"
+              >
+                {DAY_WINDOWS.map(d => <option key={d} value={d}>{d}</option>)}
+              </select>
+            </label>
+          </div>
+        </div>
 
-      <div className="bg-white rounded-lg shadow-md p-6">
-        <h2 className="text-xl font-semibold text-slate-900 mb-4">
-          Management Tools
-        </h2>
-        <p className="text-slate-600">
-          Additional features and management tools coming soon.
-        </p>
+        {error && (
+          <div className="bg-red-50 border border-red-300 rounded-lg p-4 mb-8">
+            <p className="text-red-700">{error}</p>
+          </div>
+        )}
+
+        <div className="grid grid-cols-1 md:grid-cols-3 gap-6 mb-8">
+          {totals.map(({ label, value }) => (
+            <div
+              key={label}
+              className="bg-white rounded-lg shadow-md p-6 hover:shadow-lg transition-shadow"
+            >
+              <h3 className="text-lg font-semibold text-slate-900 mb-2">{label}</h3>
+              <p className="text-2xl font-bold text-blue-600 mb-1">{value}</p>
+            </div>
+          ))}
+        </div>
+
+        {stats && cohorts.length === 0 && (
+          <div className="bg-white rounded-lg shadow-md p-6">
+            <p className="text-slate-600">No pain reports for this hospital's patients yet.</p>
+          </div>
+        )}
+
+        {cohorts.map(cohort => (
+          <div key={cohort.surgery_type} className="bg-white rounded-lg shadow-md p-6 mb-8">
+            <div className="flex items-baseline justify-between mb-4">
+              <h2 className="text-xl font-semibold text-slate-900 capitalize">
+                {cohort.surgery_type}
+              </h2>
+              <p className="text-sm text-slate-500">
+                {cohort.patients} patients · {cohort.recent_patients} recent
+              </p>
+            </div>
+            <p className="text-sm text-slate-500 mb-2">
+              Median pain, 25th-75th and 10th-90th percentile bands
+            </p>
+            <CohortBandChart bands={cohort.bands} />
+
+            {cohort.outliers.length > 0 && (
+              <table className="w-full mt-6 text-sm">
+                <thead>
+                  <tr className="text-left text-slate-500 border-b border-slate-200">
+                    <th className="py-2">Patient</th>
+                    <th className="py-2">Day after surgery</th>
+                    <th className="py-2">Pain</th>
+                    <th className="py-2">Cohort median / p90</th>
+                    <th className="py-2">Last report</th>
+                  </tr>
+                </thead>
+                <tbody>
+                  {cohort.outliers.map(o => (
+                    <tr key={o.patient_id} className="border-b border-slate-100">
+                      <td className="py-2 font-medium text-slate-900">
+                        {o.name}
+                        {o.high_risk && <span className="ml-2 text-xs text-red-600">high risk</span>}
+                      </td>
+                      <td className="py-2 text-slate-600">{o.post_op_day}</td>
+                      <td className="py-2 font-semibold text-red-600">{o.pain}</td>
+                      <td className="py-2 text-slate-600">{o.p50} / {o.p90}</td>
+                      <td className="py-2 text-slate-600">
+                        {o.days_ago === 0 ? 'today' : `${o.days_ago} days ago`}
+                      </td>
+                    </tr>
+                  ))}
+                </tbody>
+              </table>
+            )}
+          </div>
+        ))}
       </div>
     </div>
-  </div>
-);
+  );
+};
 
 export default HospitalDashboard;
\ No newline at end of file
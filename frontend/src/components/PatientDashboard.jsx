@@ -5,11 +5,19 @@ import PainChart from './charts/PainChart';
 const PatientDashboard = () => {
   const patientId = localStorage.getItem('patientId');
   const [conversations, setConversations] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [painData, setPainData] = useState([]);
 
+  const loadConversations = (cursor) => {
+    getPatientConversations(patientId, { cursor, limit: 20 }).then(res => {
+      setConversations(prev => (cursor ? [...prev, ...res.data.items] : res.data.items));
+      setNextCursor(res.data.next_cursor);
+    });
+  };
+
   useEffect(() => {
     if (!patientId) return;
-    getPatientConversations(patientId).then(res => setConversations(res.data));
+    loadConversations();
     getPainTrend(patientId).then(res => setPainData(res.data));
   }, [patientId]);
 
@@ -34,6 +42,14 @@ const PatientDashboard = () => {
               </div>
             ))}
           </div>
+          {nextCursor && (
+            <button
+              onClick={() => loadConversations(nextCursor)}
+              className="mt-6 bg-indigo-600 hover:bg-indigo-700 text-white font-semibold py-2 px-4 rounded-lg transition-colors"
+            >
+              Load older conversations
+            </button>
+          )}
         </div>
       </div>
     </div>
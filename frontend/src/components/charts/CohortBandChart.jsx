@@ -0,0 +1,49 @@
+import { ComposedChart, Area, Line, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer } from 'recharts';
+
+// bands come as parallel arrays; recharts wants one object per post-op day.
+// Stacked areas draw the p10-p90 and p25-p75 ranges as differences.
+const toSeries = (bands) => bands.post_op_day.map((day, i) => ({
+  day,
+  base: bands.p10[i],
+  outer: bands.p90[i] === null ? null : bands.p25[i] - bands.p10[i],
+  inner: bands.p75[i] === null ? null : bands.p75[i] - bands.p25[i],
+  upper: bands.p90[i] === null ? null : bands.p90[i] - bands.p75[i],
+  p50: bands.p50[i],
+  reporting: bands.reporting[i],
+}));
+
+const CohortBandChart = ({ bands }) => (
+  <div className="w-full h-72">
+    <ResponsiveContainer width="100%" height="100%">
+      <ComposedChart data={toSeries(bands)} margin={{ top: 5, right: 30, left: 0, bottom: 5 }}>
+        <CartesianGrid stroke="#e5e7eb" strokeDasharray="3 3" />
+        <XAxis
+          dataKey="day"
+          stroke="#6b7280"
+          style={{ fontSize: '12px' }}
+        />
+        <YAxis
+          domain={[0, 10]}
+          stroke="#6b7280"
+          style={{ fontSize: '12px' }}
+        />
+        <Tooltip
+          contentStyle={{
+            backgroundColor: '#f3f4f6',
+            border: '1px solid #d1d5db',
+            borderRadius: '0.5rem'
+          }}
+          labelFormatter={(day) => `Day ${day} after surgery`}
+          formatter={(value, name, { payload }) => [`${value} (${payload.reporting} reporting)`, 'Median pain']}
+        />
+        <Area type="monotone" dataKey="base" stackId="band" stroke="none" tooltipType="none" fill="transparent" />
+        <Area type="monotone" dataKey="outer" stackId="band" stroke="none" tooltipType="none" fill="#bfdbfe" />
+        <Area type="monotone" dataKey="inner" stackId="band" stroke="none" tooltipType="none" fill="#93c5fd" />
+        <Area type="monotone" dataKey="upper" stackId="band" stroke="none" tooltipType="none" fill="#bfdbfe" />
+        <Line type="monotone" dataKey="p50" stroke="#2563eb" strokeWidth={2} dot={false} />
+      </ComposedChart>
+    </ResponsiveContainer>
+  </div>
+);
+
+export default CohortBandChart;
\ No newline at end of file
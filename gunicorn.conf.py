@@ -0,0 +1,38 @@
+# gunicorn -c gunicorn.conf.py
+#
+# The app is imported and built once in the master (--preload) so workers
+# share the imported modules copy-on-write and boot fast. Anything holding a
+# socket, a SQLite handle or a thread is created per worker after fork.
+import multiprocessing
+import os
+
+wsgi_app = "backend.app:create_app(start_background=False)"
+preload_app = True
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# Each open /api/alerts/stream holds one of a worker's threads for as long as
+# the dashboard stays open. ALERT_STREAM_MAX_PER_WORKER (default 2) caps them
+# so the other threads keep serving requests: the deployment holds about
+# workers * ALERT_STREAM_MAX_PER_WORKER dashboards, and streams past a
+# worker's cap get a 503 and retry later. Raise threads with the cap.
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_class = "gthread"
+# For gthread workers this is not a request timeout: the master restarts a
+# worker whose main loop stops heartbeating for this long. Slow requests and
+# open SSE streams run on the worker's threads and are never cut off by it.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+
+
+def post_fork(server, worker):
+    from backend.app import after_fork
+    after_fork()
+
+
+def post_worker_init(worker):
+    from backend.app import start_background_workers
+    start_background_workers(worker.wsgi)
+
+
+def worker_exit(server, worker):
+    from backend.app import stop_background_workers
+    stop_background_workers()
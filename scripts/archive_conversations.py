@@ -0,0 +1,21 @@
+import argparse
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from backend.config import Config
+from backend.database import init_db
+from backend.services.archive import archive_conversations, vacuum
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move old and discharged patients' conversations to the archive.")
+    parser.add_argument('--older-than-days', type=int, default=Config.ARCHIVE_AFTER_DAYS)
+    parser.add_argument('--vacuum', action='store_true', help="reclaim the freed space afterwards")
+    args = parser.parse_args()
+
+    init_db()
+    stats = archive_conversations(older_than_days=args.older_than_days)
+    print(f"Archived {stats['rows']} conversations of {stats['patients']} patients "
+          f"in {stats['frames']} frames under {Config.ARCHIVE_DIR}.")
+    if args.vacuum:
+        vacuum()
+        print("Vacuumed the database.")
@@ -0,0 +1,11 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from backend.database import init_db, db_write
+from backend.services.rollup import rebuild
+
+if __name__ == '__main__':
+    init_db()
+    with db_write() as conn:
+        days = rebuild(conn)
+    print(f"Rebuilt daily_patient_stats: {days} patient-days.")
@@ -0,0 +1,53 @@
+import argparse
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from backend.config import Config
+from backend.database import init_db
+from backend.services import bulk
+
+def run_import(args):
+    fmt = bulk.detect_format(args.format, filename=args.file)
+    job_id = args.resume or bulk.create_job(os.path.basename(args.file), fmt)
+    if args.resume:
+        bulk.resume_job(job_id, fmt)
+    print(f"Import job {job_id}")
+    with open(args.file, encoding='utf-8-sig', newline='') as f:
+        for report in bulk.run_import(job_id, bulk.read_rows(f, fmt), chunk_size=args.chunk_size):
+            if report.get('status') == 'failed':
+                sys.exit(f"Chunk failed after row {report['rows_done']}: {report['error']}\n"
+                         f"Resume with: --resume {job_id}")
+            if report.get('status') == 'done':
+                print(f"Done: {report['patients']} patients, {report['doctors']} doctors, {report['users']} users, "
+                      f"{report['records']} records; {report['skipped']} skipped, {report['rejected']} rejected.")
+                continue
+            print(f"chunk {report['chunk']}: rows {report['rows_done']}, {report['patients']} new patients, "
+                  f"{report['rows_per_second']} rows/s")
+            for error in report['errors']:
+                print(f"  row {error['row']}: {error['error']}")
+
+def run_export(args):
+    fmt = bulk.detect_format(args.format, filename=args.file)
+    with open(args.file, 'w', encoding='utf-8', newline='') as f:
+        for text in bulk.format_rows(bulk.export_rows(args.hospital_id), fmt):
+            f.write(text)
+    print(f"Exported patients to {args.file}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bulk import or export patients as CSV or NDJSON.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    imp = sub.add_parser('import', help="import patients, doctors, logins and discharge notes")
+    imp.add_argument('file')
+    imp.add_argument('--format', choices=bulk.FORMATS, help="default: from the file extension")
+    imp.add_argument('--resume', type=int, metavar='JOB_ID', help="continue an interrupted import of the same file")
+    imp.add_argument('--chunk-size', type=int, default=Config.IMPORT_CHUNK_ROWS)
+    imp.set_defaults(run=run_import)
+    exp = sub.add_parser('export', help="export patients in the import format")
+    exp.add_argument('file')
+    exp.add_argument('--format', choices=bulk.FORMATS)
+    exp.add_argument('--hospital-id', type=int)
+    exp.set_defaults(run=run_export)
+    args = parser.parse_args()
+
+    init_db()
+    args.run(args)
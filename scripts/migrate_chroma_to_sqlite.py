@@ -0,0 +1,52 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from backend.config import Config
+from backend.services.vector_store import ChromaStore, SqliteVecStore, CHROMA_PATH
+
+BATCH_SIZE = 500
+
+def migrate():
+    """Copy every record of the Chroma collection into the sqlite-vec table."""
+    source = ChromaStore(CHROMA_PATH).collection
+    target = SqliteVecStore(Config.EMBEDDING_DIM)
+    already = target.record_ids()
+
+    copied = skipped = 0
+    offset = 0
+    while True:
+        batch = source.get(include=["embeddings", "documents", "metadatas"],
+                           limit=BATCH_SIZE, offset=offset)
+        ids = batch['ids']
+        if not ids:
+            break
+        offset += len(ids)
+
+        rows = [(rid, emb, doc, md) for rid, emb, doc, md in
+                zip(ids, batch['embeddings'], batch['documents'], batch['metadatas'])
+                if rid not in already]
+        skipped += len(ids) - len(rows)
+        if not rows:
+            continue
+        for _, emb, _, _ in rows:
+            if len(emb) != Config.EMBEDDING_DIM:
+                raise SystemExit(f"Embedding has {len(emb)} dimensions, EMBEDDING_DIM is {Config.EMBEDDING_DIM}")
+
+        patient_ids, extras = [], []
+        for _, _, _, md in rows:
+            md = dict(md or {})
+            patient_ids.append(md.pop('patient_id'))
+            extras.append(md or None)
+        target.add_many(patient_ids, [r[1] for r in rows], [r[2] for r in rows],
+                        extras, [r[0] for r in rows])
+        copied += len(rows)
+        print(f"Copied {copied} records...")
+
+    print(f"Migration finished: {copied} copied, {skipped} already present.")
+
+if __name__ == '__main__':
+    if '--rebuild' in sys.argv:
+        # re-lay out an existing sqlite-vec table (e.g. smaller per-patient chunks)
+        print(f"Rebuilt {SqliteVecStore(Config.EMBEDDING_DIM).rebuild()} records.")
+    else:
+        migrate()
@@ -0,0 +1,12 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from backend.config import Config
+from backend.services.checkpointer import open_checkpointer
+
+if __name__ == '__main__':
+    saver = open_checkpointer(Config.CHECKPOINT_DB_PATH, Config.CHECKPOINT_KEEP_PER_THREAD)
+    checkpoints, writes = saver.prune_all()
+    if '--vacuum' in sys.argv:
+        saver.vacuum()
+    print(f"Pruned {checkpoints} checkpoints and {writes} pending writes.")
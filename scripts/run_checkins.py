@@ -0,0 +1,30 @@
+import argparse
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from backend.config import Config
+from backend.database import init_db
+from backend.services.outbox import drain, pending_count, schedule_checkins
+
+def run_once(args):
+    if not args.send_only:
+        print(f"Queued {schedule_checkins()} check-ins.")
+    if not args.schedule_only:
+        sent, not_sent = drain(senders=args.senders)
+        print(f"Sent {sent}, {not_sent} failed or deferred, {pending_count()} still queued.")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Queue due patient check-ins and deliver the outbound queue.")
+    parser.add_argument('--schedule-only', action='store_true', help="queue check-ins without sending")
+    parser.add_argument('--send-only', action='store_true', help="only deliver what is already queued")
+    parser.add_argument('--senders', type=int, default=Config.OUTBOX_SENDERS)
+    parser.add_argument('--loop', type=float, metavar='SECONDS',
+                        help="keep running, repeating every SECONDS (retries become due in between)")
+    args = parser.parse_args()
+
+    init_db()
+    run_once(args)
+    while args.loop:
+        time.sleep(args.loop)
+        run_once(args)